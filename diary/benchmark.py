@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import statistics
+from datetime import date, timedelta
+
+from storage import ExpenseStorage, FIRST_PAGE_KEY
+
+DATA_DIR = 'bench_data'
+SEED = 42
+ROWS = 1_000_000
+DAYS = 3650
+BATCH = 50_000
+CATEGORIES = ['еда', 'транспорт', 'развлечения', 'жилье', 'здоровье', 'образование', 'другое']
+OPERATIONS = ['add', 'by_date', 'by_category', 'statistics', 'summary', 'all']
+SUMMARY_DAYS = 90
+
+LEGACY_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS expenses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        amount REAL NOT NULL,
+        category TEXT NOT NULL,
+        date TEXT NOT NULL,
+        description TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def generate_database(db_path, rows, seed=SEED):
+    """Воспроизводимая база старого формата (без индексов и миграций) из rows записей.
+
+    Записи идут в хронологическом порядке, как их и вносят в дневник.
+    """
+    rng = random.Random(seed)
+    first_day = date.today() - timedelta(days=DAYS)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(LEGACY_SCHEMA)
+        for start in range(0, rows, BATCH):
+            count = min(BATCH, rows - start)
+            day_offsets = sorted(rng.randrange(start * DAYS, (start + count) * DAYS) // rows for _ in range(count))
+            conn.executemany(
+                'INSERT INTO expenses (amount, category, date, description) VALUES (?, ?, ?, ?)',
+                [(round(rng.uniform(10, 5000), 2), rng.choice(CATEGORIES),
+                  (first_day + timedelta(days=offset)).isoformat(),
+                  rng.choice((None, 'покупка', 'оплата', 'подписка')))
+                 for offset in day_offsets])
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def ensure_database(data_dir, rows):
+    """Исходная база нужного размера; генерируется один раз"""
+    os.makedirs(data_dir, exist_ok=True)
+    db_path = os.path.join(data_dir, f'expenses-{rows}.db')
+    if not os.path.exists(db_path):
+        print(f"🛠️  Генерация базы из {rows} записей...")
+        generate_database(db_path, rows)
+    return db_path
+
+
+class LegacyOperations:
+    """Операции в исходном виде: новое подключение на каждый вызов, без индексов"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def _query(self, sql, params=(), write=False):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        if write:
+            conn.commit()
+        conn.close()
+        return rows
+
+    def add(self, expense_date, category):
+        self._query('INSERT INTO expenses (amount, category, date, description) VALUES (?, ?, ?, ?)',
+                    (100.0, category, expense_date, 'бенчмарк'), write=True)
+
+    def by_date(self, expense_date, category):
+        return self._query('SELECT * FROM expenses WHERE date = ? ORDER BY id DESC', (expense_date,))
+
+    def by_category(self, expense_date, category):
+        return self._query('SELECT * FROM expenses WHERE category = ? ORDER BY date DESC, id DESC',
+                           (category,))
+
+    def statistics(self, expense_date, category):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT SUM(amount) FROM expenses')
+        cursor.fetchone()
+        cursor.execute('SELECT category, SUM(amount) FROM expenses GROUP BY category ORDER BY SUM(amount) DESC')
+        cursor.fetchall()
+        cursor.execute('SELECT SUM(amount) FROM expenses WHERE date >= ?', (expense_date,))
+        cursor.fetchone()
+        conn.close()
+
+    def summary(self, expense_date, category):
+        end_date = (date.fromisoformat(expense_date) + timedelta(days=SUMMARY_DAYS)).isoformat()
+        return self._query('SELECT category, SUM(amount), COUNT(*) FROM expenses WHERE date BETWEEN ? AND ? '
+                           'GROUP BY category ORDER BY SUM(amount) DESC', (expense_date, end_date))
+
+    def all(self, expense_date, category):
+        return self._query('SELECT * FROM expenses ORDER BY date DESC, id DESC')
+
+    def close(self):
+        pass
+
+
+class StorageOperations:
+    """Те же операции через ExpenseStorage; просмотры читают одну страницу, как в интерфейсе"""
+
+    def __init__(self, db_path):
+        self.storage = ExpenseStorage(db_path)
+
+    def add(self, expense_date, category):
+        self.storage.add_expense(100.0, category, expense_date, 'бенчмарк')
+
+    def by_date(self, expense_date, category):
+        return self.storage.page('date', expense_date).fetchall()
+
+    def by_category(self, expense_date, category):
+        return self.storage.page('category', category).fetchall()
+
+    def statistics(self, expense_date, category):
+        self.storage.total_amount()
+        self.storage.category_totals()
+        self.storage.total_since(expense_date)
+
+    def summary(self, expense_date, category):
+        end_date = (date.fromisoformat(expense_date) + timedelta(days=SUMMARY_DAYS)).isoformat()
+        return self.storage.summary(expense_date, end_date)
+
+    def all(self, expense_date, category):
+        # Страница с произвольной глубины: по ключу она стоит столько же, сколько первая
+        return self.storage.page('all', key=(expense_date, FIRST_PAGE_KEY[1])).fetchall()
+
+    def close(self):
+        self.storage.close()
+
+
+def measure(operations, operation, repeat, seed=SEED):
+    """Задержки одной операции в миллисекундах: медиана, p95 и максимум"""
+    rng = random.Random(seed)
+    first_day = date.today() - timedelta(days=DAYS)
+    call = getattr(operations, operation)
+    latencies = []
+    for _ in range(repeat):
+        expense_date = (first_day + timedelta(days=rng.randint(0, DAYS))).isoformat()
+        category = rng.choice(CATEGORIES)
+        started = time.perf_counter()
+        call(expense_date, category)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        'median_ms': statistics.median(latencies),
+        'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        'max_ms': latencies[-1],
+        'calls': repeat,
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Бенчмарк хранилища дневника расходов: до и после")
+    parser.add_argument('--rows', type=int, default=ROWS, help="число записей в базе")
+    parser.add_argument('--operations', default=','.join(OPERATIONS), help="операции через запятую")
+    parser.add_argument('--repeat', type=int, default=200, help="число вызовов точечных операций")
+    parser.add_argument('--repeat-scan', type=int, default=5,
+                        help="число вызовов операций, читающих всю таблицу (statistics, all)")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="папка для сгенерированных баз")
+    parser.add_argument('--output', default='bench_storage.json', help="файл для результатов")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    operations = [operation.strip() for operation in args.operations.split(',') if operation.strip()]
+    unknown = [operation for operation in operations if operation not in OPERATIONS]
+    if unknown:
+        print(f"❌ Неизвестные операции: {', '.join(unknown)}")
+        return 2
+
+    source = ensure_database(args.data_dir, args.rows)
+    results = {}
+    print(f"\n{'Вариант/операция':<42} {'Медиана, мс':>12} {'p95, мс':>10} {'Макс, мс':>10}")
+    print("-" * 77)
+    for variant, factory in (('before', LegacyOperations), ('after', StorageOperations)):
+        # Каждый вариант работает с копией исходной базы; 'after' заодно проверяет миграцию
+        db_path = os.path.join(args.data_dir, f'expenses-{args.rows}-{variant}.db')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        shutil.copyfile(source, db_path)
+
+        started = time.perf_counter()
+        subject = factory(db_path)
+        if variant == 'after':
+            print(f"ℹ️  Миграция схемы: {time.perf_counter() - started:.2f} с")
+        try:
+            for operation in operations:
+                repeat = args.repeat_scan if operation in ('statistics', 'all') else args.repeat
+                key = f"{variant}/{operation}"
+                results[key] = measure(subject, operation, repeat)
+                result = results[key]
+                print(f"{key:<42} {result['median_ms']:>12.3f} {result['p95_ms']:>10.3f} "
+                      f"{result['max_ms']:>10.3f}")
+        finally:
+            subject.close()
+
+    print()
+    for operation in operations:
+        before = results[f"before/{operation}"]['median_ms']
+        after = results[f"after/{operation}"]['median_ms']
+        print(f"  {operation:<14}: ускорение x{before / after if after > 0 else 0:.1f}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'rows': args.rows, 'results': results}, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ Результаты сохранены в {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
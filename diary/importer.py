@@ -0,0 +1,274 @@
+import os
+import csv
+import sys
+import json
+import math
+import time
+import argparse
+import contextlib
+from datetime import date
+
+from storage import ExpenseStorage, CATEGORIES
+
+# Записей в одном executemany; весь файл загружается одной транзакцией
+BATCH = 100_000
+JSON_CHUNK = 1024 * 1024
+# Ошибка разбора не дальше стольких символов от конца буфера - признак объекта, обрезанного
+# границей блока (недочитанные true/false/null, \uXXXX, показатель степени числа)
+TRUNCATED_TAIL = 6
+# Средний размер строки файла для оценки числа записей до чтения
+ESTIMATED_ROW_BYTES = 40
+REJECTED_SUFFIX = '.rejected.csv'
+
+# Заголовки колонок: английские - как в export_to_csv, плюс русские
+COLUMNS = {
+    'id': 'id', 'amount': 'amount', 'category': 'category', 'date': 'date',
+    'description': 'description', 'created at': 'created_at', 'created_at': 'created_at',
+    'сумма': 'amount', 'категория': 'category', 'дата': 'date', 'описание': 'description',
+}
+
+
+def detect_format(file_path):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in ('.json', '.jsonl', '.ndjson'):
+        return 'json'
+    return 'csv'
+
+
+def iter_csv(file_path):
+    """Потоковое чтение CSV: (номер строки, {поле: значение}, исходная строка)"""
+    with open(file_path, 'r', newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        fields = [COLUMNS.get(name.strip().lower()) for name in header]
+        missing = {'amount', 'category', 'date'} - set(fields)
+        if missing:
+            raise ValueError(f"в заголовке нет колонок: {', '.join(sorted(missing))}")
+        for row in reader:
+            if not row:
+                continue
+            yield reader.line_num, dict(zip(fields, row)), row
+
+
+def _iter_json_array(f):
+    """Объекты массива JSON по одному, без чтения всего файла в память"""
+    decoder = json.JSONDecoder()
+    buffer = f.read(JSON_CHUNK).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("ожидался массив JSON")
+    position = 1
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            # Обрезанный на границе блока объект всегда дает ошибку, а не неполный результат
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as e:
+            # Ошибка в середине буфера - испорченный элемент: дочитывать файл бессмысленно
+            truncated = len(buffer) - e.pos <= TRUNCATED_TAIL or e.msg.startswith('Unterminated string')
+            if eof or not truncated:
+                raise
+            chunk = f.read(JSON_CHUNK)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+        if position > JSON_CHUNK:
+            buffer = buffer[position:]
+            position = 0
+
+
+def _iter_json_lines(f):
+    """Записи JSON Lines; нечитаемая строка возвращается как есть, без прерывания импорта"""
+    for line in f:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            yield line.rstrip('\r\n')
+
+
+def iter_json(file_path):
+    """Потоковое чтение массива JSON или JSON Lines: (номер записи, {поле: значение}, исходная запись)"""
+    with open(file_path, 'r', encoding='utf-8-sig') as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == '[':
+            items = _iter_json_array(f)
+        else:
+            items = _iter_json_lines(f)
+        for number, item in enumerate(items, 1):
+            if not isinstance(item, dict):
+                # Не объект или нечитаемая строка JSON Lines - отклоняется в parse_record
+                yield number, None, item
+                continue
+            yield number, {COLUMNS.get(key.strip().lower()): value for key, value in item.items()}, item
+
+
+def parse_record(record, categories):
+    """Проверенная строка для вставки: (сумма, категория, дата, описание, создано); иначе ValueError"""
+    if record is None:
+        raise ValueError("запись не является объектом JSON")
+    amount = record.get('amount')
+    # JSON true иначе превратился бы в сумму 1.0
+    if isinstance(amount, bool):
+        raise ValueError("неверный формат суммы")
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        raise ValueError("неверный формат суммы")
+    # inf и nan испортили бы накопленные итоги по дням и категориям
+    if not math.isfinite(amount):
+        raise ValueError("неверный формат суммы")
+    if not amount > 0:
+        raise ValueError("сумма должна быть положительной")
+    category = record.get('category')
+    if not isinstance(category, str):
+        raise ValueError(f"неизвестная категория: {category}")
+    if category not in categories:
+        if category.strip().lower() not in categories:
+            raise ValueError(f"неизвестная категория: {category}")
+        category = category.strip().lower()
+    expense_date = record.get('date')
+    # Тот же формат ГГГГ-ММ-ДД, что и при ручном вводе; fromisoformat быстрее strptime
+    if not isinstance(expense_date, str) or len(expense_date) != 10 or expense_date[4] != '-' or expense_date[7] != '-':
+        raise ValueError(f"неверный формат даты: {expense_date}")
+    try:
+        date.fromisoformat(expense_date)
+    except ValueError:
+        raise ValueError(f"неверная дата: {expense_date}")
+    description = record.get('description')
+    if description is not None and not isinstance(description, str):
+        raise ValueError("описание должно быть строкой")
+    created_at = record.get('created_at')
+    if created_at is not None and not isinstance(created_at, str):
+        raise ValueError("время создания должно быть строкой")
+    return amount, category, expense_date, description or None, created_at or None
+
+
+class ExpenseImporter:
+    """Массовый импорт расходов из CSV/JSON - обратная операция к export_to_csv.
+
+    Файл читается потоково, строки проверяются по категориям и формату даты
+    и вставляются через executemany пачками по BATCH строк. Весь файл
+    загружается одной транзакцией: при ошибке чтения файла (испорченный
+    JSON, неверная кодировка) в базе не остается ни одной его строки, и
+    повторный импорт не создает дублей. Отклоненные строки с причиной
+    пишутся в отчет рядом с исходным файлом.
+    """
+
+    def __init__(self, storage, categories=None, batch=BATCH):
+        self.storage = storage
+        self.categories = set(categories or CATEGORIES)
+        self.batch = batch
+
+    def import_file(self, file_path, file_format=None, report_path=None):
+        """Импорт файла: {'imported', 'rejected', 'seconds', 'rows_per_second', 'report'}"""
+        file_format = file_format or detect_format(file_path)
+        records = iter_json(file_path) if file_format == 'json' else iter_csv(file_path)
+        report_path = report_path or file_path + REJECTED_SUFFIX
+        if os.path.exists(report_path):
+            os.remove(report_path)
+
+        started = time.perf_counter()
+        imported = 0
+        pending = []
+        categories = self.categories
+        # Индексы пересоздаются после загрузки, если файл не меньше уже накопленной истории
+        bulk = os.path.getsize(file_path) // ESTIMATED_ROW_BYTES >= self.storage.approximate_rows()
+        with RejectedReport(report_path, file_format) as report, \
+                self.storage.bulk_load() if bulk else contextlib.nullcontext(), \
+                self.storage.transaction():
+            for number, record, raw in records:
+                try:
+                    pending.append(parse_record(record, categories))
+                except ValueError as e:
+                    report.add(number, str(e), raw)
+                    continue
+                if len(pending) >= self.batch:
+                    imported += self.storage.insert_many(pending, commit=False)
+                    pending = []
+            if pending:
+                imported += self.storage.insert_many(pending, commit=False)
+        seconds = time.perf_counter() - started
+        return {
+            'imported': imported,
+            'rejected': report.count,
+            'seconds': seconds,
+            'rows_per_second': (imported + report.count) / seconds if seconds > 0 else 0,
+            'report': report_path if report.count else None,
+        }
+
+
+class RejectedReport:
+    """Отчет об отклоненных строках (CSV): номер строки (записи), причина, исходные поля.
+
+    Файл создается при первой отклоненной строке и пишется по мере чтения,
+    чтобы не держать отклоненные строки в памяти.
+    """
+
+    def __init__(self, report_path, file_format):
+        self.report_path = report_path
+        self.file_format = file_format
+        self.count = 0
+        self.file = None
+        self.writer = None
+
+    def add(self, number, reason, raw):
+        if self.file is None:
+            self.file = open(self.report_path, 'w', newline='', encoding='utf-8')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(['Line', 'Reason', 'Data'])
+        if self.file_format == 'json':
+            self.writer.writerow([number, reason, json.dumps(raw, ensure_ascii=False)])
+        else:
+            self.writer.writerow([number, reason, *raw])
+        self.count += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.file is not None:
+            self.file.close()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Импорт расходов из CSV/JSON в дневник расходов")
+    parser.add_argument('files', nargs='+', help="файлы CSV или JSON (массив или JSON Lines)")
+    parser.add_argument('--db', default='expenses.db', help="файл базы данных")
+    parser.add_argument('--format', choices=('csv', 'json'), help="формат (по умолчанию - по расширению)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    status = 0
+    with ExpenseStorage(args.db) as storage:
+        importer = ExpenseImporter(storage)
+        for file_path in args.files:
+            try:
+                result = importer.import_file(file_path, args.format)
+            except (OSError, ValueError) as e:
+                print(f"❌ {file_path}: {e}", file=sys.stderr)
+                status = 2
+                continue
+            print(f"✅ {file_path}: импортировано {result['imported']}, отклонено {result['rejected']} "
+                  f"за {result['seconds']:.2f} с ({result['rows_per_second']:,.0f} строк/с)")
+            if result['report']:
+                print(f"⚠️  Отклоненные строки: {result['report']}")
+                status = max(status, 1)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
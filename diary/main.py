@@ -1,31 +1,26 @@
-import sqlite3
-import csv
-from datetime import datetime, date
 import os
+import csv
+import math
+from datetime import datetime, date, timedelta
+
+from storage import ExpenseStorage, CATEGORIES, FIRST_PAGE_KEY, PAGE_SIZE
+from importer import ExpenseImporter
 
 
 class ExpenseTracker:
     def __init__(self, db_name='expenses.db'):
         self.db_name = db_name
-        self.categories = ['еда', 'транспорт', 'развлечения', 'жилье', 'здоровье', 'образование', 'другое']
+        self.categories = list(CATEGORIES)
+        self.page_size = PAGE_SIZE
+        self.storage = None
         self.init_database()
 
     def init_database(self):
-        """Инициализация базы данных"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS expenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                amount REAL NOT NULL,
-                category TEXT NOT NULL,
-                date TEXT NOT NULL,
-                description TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        """Инициализация базы данных: одно соединение на все время работы, миграции схемы"""
+        self.storage = ExpenseStorage(self.db_name)
+
+    def close(self):
+        self.storage.close()
 
     def add_expense(self):
         """Добавление новой записи о расходе"""
@@ -33,6 +28,8 @@ class ExpenseTracker:
 
         try:
             amount = float(input("Введите сумму расхода: "))
+            if not math.isfinite(amount):
+                raise ValueError
             if amount <= 0:
                 print("❌ Сумма должна быть положительной!")
                 return
@@ -69,30 +66,14 @@ class ExpenseTracker:
         description = input("Введите описание (необязательно): ").strip() or None
 
         # Сохранение в базу данных
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute(
-            'INSERT INTO expenses (amount, category, date, description) VALUES (?, ?, ?, ?)',
-            (amount, category, expense_date.isoformat(), description)
-        )
-        conn.commit()
-        conn.close()
+        self.storage.add_expense(amount, category, expense_date.isoformat(), description)
 
         print("✅ Расход успешно добавлен!")
 
     def view_all_expenses(self):
         """Просмотр всех расходов"""
         print("\n📋 ВСЕ РАСХОДЫ")
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM expenses 
-            ORDER BY date DESC, id DESC
-        ''')
-        expenses = cursor.fetchall()
-        conn.close()
-
-        self.display_expenses(expenses)
+        self.browse_expenses('all')
 
     def view_expenses_by_date(self):
         """Просмотр расходов по дате"""
@@ -103,17 +84,8 @@ class ExpenseTracker:
             print("❌ Неверный формат даты!")
             return
 
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT * FROM expenses WHERE date = ? ORDER BY id DESC',
-            (target_date.isoformat(),)
-        )
-        expenses = cursor.fetchall()
-        conn.close()
-
         print(f"\n📅 РАСХОДЫ ЗА {target_date}:")
-        self.display_expenses(expenses)
+        self.browse_expenses('date', target_date.isoformat())
 
     def view_expenses_by_category(self):
         """Просмотр расходов по категории"""
@@ -132,65 +104,80 @@ class ExpenseTracker:
             print("❌ Неверный формат номера!")
             return
 
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT * FROM expenses WHERE category = ? ORDER BY date DESC, id DESC',
-            (category,)
-        )
-        expenses = cursor.fetchall()
-        conn.close()
-
         print(f"\n📂 РАСХОДЫ ПО КАТЕГОРИИ '{category.upper()}':")
-        self.display_expenses(expenses)
+        self.browse_expenses('category', category)
 
-    def display_expenses(self, expenses):
-        """Отображение списка расходов"""
-        if not expenses:
+    def browse_expenses(self, view, value=None):
+        """Постраничный просмотр расходов от новых к старым.
+
+        Соседняя страница ищется по (дата, id) первой или последней строки
+        текущей, нарастающий итог продолжается с ее крайней строки.
+        """
+        total, count = self.storage.view_totals(view, value)
+        if not count:
             print("Расходы не найдены")
             return
 
-        total = 0
-        print(f"{'ID':<3} {'Дата':<12} {'Категория':<12} {'Сумма':<10} {'Описание':<20}")
-        print("-" * 65)
-        for expense in expenses:
-            id, amount, category, expense_date, description, created_at = expense
-            description_display = description if description else "—"
-            print(f"{id:<3} {expense_date:<12} {category:<12} {amount:<10.2f} {description_display:<20}")
-            total += amount
+        key, base, newer = FIRST_PAGE_KEY, 0, False
+        position = 0
+        while True:
+            shown, first, last = self.display_expenses(self.storage.page(view, value, key, self.page_size, base, newer))
+            if not shown:
+                print("Больше записей нет")
+                return
+            if newer:
+                position -= shown
+            print(f"{'ВСЕГО:':<27} {total:<10.2f} (записи {position + 1}-{position + shown} из {count})")
+
+            options = []
+            if position + shown < count:
+                options.append("[с] следующая")
+            if position > 0:
+                options.append("[п] предыдущая")
+            if not options:
+                return
+            choice = input(f"{', '.join(options)}, Enter - выход: ").strip().lower()
+            if choice in ('с', 'n') and position + shown < count:
+                position += shown
+                key, base, newer = (last[3], last[0]), last[6], False
+            elif choice in ('п', 'p') and position > 0:
+                key, base, newer = (first[3], first[0]), first[6] - first[1], True
+            else:
+                return
 
-        print("-" * 65)
-        print(f"{'ВСЕГО:':<27} {total:<10.2f}")
+    def display_expenses(self, expenses):
+        """Отображение страницы расходов из курсора; возвращает (число строк, первая, последняя)"""
+        first = last = None
+        shown = 0
+        rows = expenses.fetchmany(self.page_size)
+        if not rows:
+            return shown, first, last
+
+        print(f"{'ID':<3} {'Дата':<12} {'Категория':<12} {'Сумма':<10} {'Итог':<12} {'Описание':<20}")
+        print("-" * 78)
+        while rows:
+            for expense in rows:
+                id, amount, category, expense_date, description, created_at, running_total = expense
+                description_display = description if description else "—"
+                print(f"{id:<3} {expense_date:<12} {category:<12} {amount:<10.2f} {running_total:<12.2f} "
+                      f"{description_display:<20}")
+            first = first or rows[0]
+            last = rows[-1]
+            shown += len(rows)
+            rows = expenses.fetchmany(self.page_size)
+
+        print("-" * 78)
+        return shown, first, last
 
     def get_statistics(self):
-        """Получение статистики по расходам"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
-        # Общая сумма расходов
-        cursor.execute('SELECT SUM(amount) FROM expenses')
-        total_amount = cursor.fetchone()[0] or 0
-
-        # Сумма по категориям
-        cursor.execute('''
-            SELECT category, SUM(amount) 
-            FROM expenses 
-            GROUP BY category 
-            ORDER BY SUM(amount) DESC
-        ''')
-        category_totals = cursor.fetchall()
-
+        """Получение статистики по расходам из сводной таблицы"""
         # Последние 30 дней
         thirty_days_ago = (date.today() - timedelta(days=30)).isoformat()
-        cursor.execute('SELECT SUM(amount) FROM expenses WHERE date >= ?', (thirty_days_ago,))
-        last_30_days = cursor.fetchone()[0] or 0
-
-        conn.close()
 
         return {
-            'total_amount': total_amount,
-            'category_totals': category_totals,
-            'last_30_days': last_30_days
+            'total_amount': self.storage.total_amount(),
+            'category_totals': self.storage.category_totals(),
+            'last_30_days': self.storage.total_since(thirty_days_ago)
         }
 
     def show_statistics(self):
@@ -207,23 +194,73 @@ class ExpenseTracker:
             percentage = (amount / stats['total_amount']) * 100 if stats['total_amount'] > 0 else 0
             print(f"  {category:<12}: {amount:>8.2f} ({percentage:>5.1f}%)")
 
+    def show_summary(self):
+        """Сводка расходов за период, по всем категориям или по одной"""
+        try:
+            start_date = datetime.strptime(input("Введите начальную дату (ГГГГ-ММ-ДД): ").strip(), '%Y-%m-%d').date()
+            end_date = datetime.strptime(input("Введите конечную дату (ГГГГ-ММ-ДД): ").strip(), '%Y-%m-%d').date()
+        except ValueError:
+            print("❌ Неверный формат даты!")
+            return
+        if start_date > end_date:
+            print("❌ Начальная дата позже конечной!")
+            return
+
+        category = None
+        category_input = input(f"Номер категории (1-{len(self.categories)}) или Enter для всех: ").strip()
+        if category_input:
+            if not category_input.isdigit() or not 1 <= int(category_input) <= len(self.categories):
+                print("❌ Неверный выбор категории!")
+                return
+            category = self.categories[int(category_input) - 1]
+
+        rows = self.storage.summary(start_date.isoformat(), end_date.isoformat(), category)
+        print(f"\n📈 СВОДКА С {start_date} ПО {end_date}")
+        print("=" * 40)
+        if not rows:
+            print("Расходы не найдены")
+            return
+        total = sum(amount for _, amount, _ in rows)
+        for category, amount, count in rows:
+            print(f"  {category:<12}: {amount:>10.2f} ({count} зап.)")
+        print(f"💰 Итого: {total:.2f}")
+
+    def rebuild_statistics(self):
+        """Пересчет сводных данных по всем записям"""
+        print("⏳ Пересчет сводных данных...")
+        rows = self.storage.rebuild_rollups()
+        print(f"✅ Сводные данные пересчитаны ({rows} строк сводки)")
+
     def export_to_csv(self):
         """Экспорт всех расходов в CSV"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM expenses ORDER BY date, category')
-        expenses = cursor.fetchall()
-        conn.close()
-
         filename = f"expenses_export_{date.today()}.csv"
 
         with open(filename, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             writer.writerow(['ID', 'Amount', 'Category', 'Date', 'Description', 'Created At'])
-            writer.writerows(expenses)
+            writer.writerows(self.storage.export_rows())
 
         print(f"✅ Расходы экспортированы в {filename}")
 
+    def import_expenses(self):
+        """Импорт расходов из CSV/JSON (в том числе из файла export_to_csv)"""
+        file_path = input("Введите путь к файлу CSV или JSON: ").strip()
+        if not os.path.isfile(file_path):
+            print("❌ Файл не найден!")
+            return
+
+        print("⏳ Импорт...")
+        try:
+            result = ExpenseImporter(self.storage, self.categories).import_file(file_path)
+        except (OSError, ValueError) as e:
+            print(f"❌ Ошибка импорта: {e}")
+            return
+
+        print(f"✅ Импортировано: {result['imported']}, отклонено: {result['rejected']} "
+              f"({result['seconds']:.2f} с, {result['rows_per_second']:,.0f} строк/с)")
+        if result['report']:
+            print(f"⚠️  Отклоненные строки сохранены в {result['report']}")
+
     def show_menu(self):
         print("\n" + "=" * 50)
         print("💰 ДНЕВНИК РАСХОДОВ")
@@ -234,6 +271,9 @@ class ExpenseTracker:
         print("4. 📂 Просмотреть расходы по категории")
         print("5. 📊 Показать статистику")
         print("6. 📤 Экспорт в CSV")
+        print("7. 📥 Импорт из CSV/JSON")
+        print("8. 📈 Сводка за период")
+        print("9. 🔄 Пересчитать сводные данные")
         print("0. ❌ Выход")
         print("=" * 50)
 
@@ -244,6 +284,7 @@ class ExpenseTracker:
 
             if choice == '0':
                 print("👋 До свидания!")
+                self.close()
                 break
             elif choice == '1':
                 self.add_expense()
@@ -257,15 +298,18 @@ class ExpenseTracker:
                 self.show_statistics()
             elif choice == '6':
                 self.export_to_csv()
+            elif choice == '7':
+                self.import_expenses()
+            elif choice == '8':
+                self.show_summary()
+            elif choice == '9':
+                self.rebuild_statistics()
             else:
                 print("❌ Неверный выбор!")
 
             input("\nНажмите Enter для продолжения...")
 
 
-# Необходимый импорт для работы с датами
-from datetime import timedelta
-
 if __name__ == "__main__":
     tracker = ExpenseTracker()
     tracker.run()
\ No newline at end of file
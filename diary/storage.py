@@ -0,0 +1,294 @@
+import sqlite3
+import contextlib
+
+CATEGORIES = ['еда', 'транспорт', 'развлечения', 'жилье', 'здоровье', 'образование', 'другое']
+# Кэш скомпилированных запросов модуля sqlite3 (по тексту SQL)
+STATEMENT_CACHE = 256
+
+PRAGMAS = (
+    # WAL: читатели не блокируют запись, фиксация - одна запись в журнал без fsync базы
+    'PRAGMA journal_mode = WAL',
+    # В режиме WAL NORMAL не теряет целостность, а fsync делается только при контрольной точке
+    'PRAGMA synchronous = NORMAL',
+    # 64 МБ страничного кэша вместо 2 МБ по умолчанию
+    'PRAGMA cache_size = -65536',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA mmap_size = 268435456',
+)
+
+# Вторичные индексы; их DDL нужен и миграции, и массовой загрузке, которая пересоздает индексы
+INDEXES = {
+    'idx_expenses_date': 'CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date, id)',
+    'idx_expenses_category': 'CREATE INDEX IF NOT EXISTS idx_expenses_category ON expenses (category, date, amount)',
+}
+
+ROLLUP_TABLE = '''
+    CREATE TABLE IF NOT EXISTS expense_rollups (
+        date TEXT NOT NULL,
+        category TEXT NOT NULL,
+        total REAL NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (date, category)
+    ) WITHOUT ROWID
+'''
+
+# Триггеры держат сводную таблицу (дата, категория) -> сумма, число в той же
+# транзакции, что и изменение расходов, кто бы ни писал в базу.
+TRIGGERS = {
+    'expenses_rollup_insert': '''
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_insert AFTER INSERT ON expenses
+        BEGIN
+            INSERT INTO expense_rollups (date, category, total, count)
+            VALUES (NEW.date, NEW.category, NEW.amount, 1)
+            ON CONFLICT (date, category) DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END
+    ''',
+    'expenses_rollup_delete': '''
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_delete AFTER DELETE ON expenses
+        BEGIN
+            UPDATE expense_rollups SET total = total - OLD.amount, count = count - 1
+            WHERE date = OLD.date AND category = OLD.category;
+            DELETE FROM expense_rollups WHERE date = OLD.date AND category = OLD.category AND count <= 0;
+        END
+    ''',
+    'expenses_rollup_update': '''
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_update AFTER UPDATE OF amount, category, date ON expenses
+        BEGIN
+            UPDATE expense_rollups SET total = total - OLD.amount, count = count - 1
+            WHERE date = OLD.date AND category = OLD.category;
+            DELETE FROM expense_rollups WHERE date = OLD.date AND category = OLD.category AND count <= 0;
+            INSERT INTO expense_rollups (date, category, total, count)
+            VALUES (NEW.date, NEW.category, NEW.amount, 1)
+            ON CONFLICT (date, category) DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END
+    ''',
+}
+
+CLEAR_ROLLUPS = 'DELETE FROM expense_rollups'
+# Группировка идет по покрывающему индексу категорий, без обращения к таблице
+FILL_ROLLUPS = '''
+    INSERT INTO expense_rollups (date, category, total, count)
+    SELECT date, category, SUM(amount), COUNT(*) FROM expenses GROUP BY category, date
+'''
+
+# Миграции: номер версии схемы -> список запросов. Версия хранится в PRAGMA user_version,
+# поэтому существующие expenses.db (версия 0) дополняются без потери данных.
+# rowid входит в каждый индекс неявно, так что (date, id) отдает порядок просмотра
+# без сортировки, а amount в индексе категорий делает суммы по категориям покрывающими.
+MIGRATIONS = {
+    1: ['''
+        CREATE TABLE IF NOT EXISTS expenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            amount REAL NOT NULL,
+            category TEXT NOT NULL,
+            date TEXT NOT NULL,
+            description TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    '''],
+    2: list(INDEXES.values()),
+    3: [ROLLUP_TABLE, *TRIGGERS.values(), CLEAR_ROLLUPS, FILL_ROLLUPS],
+}
+
+INSERT_EXPENSE = 'INSERT INTO expenses (amount, category, date, description) VALUES (?, ?, ?, ?)'
+INSERT_IMPORTED = '''
+    INSERT INTO expenses (amount, category, date, description, created_at)
+    VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+'''
+
+# Постраничный просмотр по ключу (date, id) в порядке от новых к старым: страница
+# ищется по индексу от ключа соседней, а не пропуском OFFSET строк, поэтому любая
+# страница стоит одинаково. Нарастающий итог считает оконная функция от итога до
+# страницы (:base). Для предыдущей страницы :base - итог до текущей, то есть после
+# последней строки искомой, поэтому из него вычитается сумма самой страницы.
+PAGE_OLDER = '''
+    SELECT id, amount, category, date, description, created_at,
+           :base + SUM(amount) OVER (ORDER BY date DESC, id DESC ROWS UNBOUNDED PRECEDING)
+    FROM (SELECT * FROM expenses WHERE {filter}(date, id) < (:date, :id)
+          ORDER BY date DESC, id DESC LIMIT :limit)
+    ORDER BY date DESC, id DESC
+'''
+PAGE_NEWER = '''
+    SELECT id, amount, category, date, description, created_at,
+           :base - SUM(amount) OVER () + SUM(amount) OVER (ORDER BY date DESC, id DESC ROWS UNBOUNDED PRECEDING)
+    FROM (SELECT * FROM expenses WHERE {filter}(date, id) > (:date, :id)
+          ORDER BY date ASC, id ASC LIMIT :limit)
+    ORDER BY date DESC, id DESC
+'''
+# Просмотры: все записи, за дату, по категории
+VIEW_FILTERS = {'all': '', 'date': 'date = :value AND ', 'category': 'category = :value AND '}
+PAGE_QUERIES = {(view, newer): (PAGE_NEWER if newer else PAGE_OLDER).format(filter=condition)
+                for view, condition in VIEW_FILTERS.items() for newer in (False, True)}
+VIEW_TOTALS = {
+    'all': 'SELECT SUM(total), SUM(count) FROM expense_rollups',
+    'date': 'SELECT SUM(total), SUM(count) FROM expense_rollups WHERE date = :value',
+    'category': 'SELECT SUM(total), SUM(count) FROM expense_rollups WHERE category = :value',
+}
+# Ключ перед самой новой записью - начало первой страницы
+FIRST_PAGE_KEY = ('9999-12-31', 2 ** 63 - 1)
+PAGE_SIZE = 20
+SELECT_FOR_EXPORT = 'SELECT * FROM expenses ORDER BY date, category'
+# Итоги считаются по сводной таблице: ее размер - дни x категории, а не число записей
+TOTAL_AMOUNT = 'SELECT SUM(total) FROM expense_rollups'
+CATEGORY_TOTALS = 'SELECT category, SUM(total) FROM expense_rollups GROUP BY category ORDER BY SUM(total) DESC'
+TOTAL_SINCE = 'SELECT SUM(total) FROM expense_rollups WHERE date >= ?'
+RANGE_SUMMARY = '''
+    SELECT category, SUM(total), SUM(count) FROM expense_rollups
+    WHERE date BETWEEN ? AND ? GROUP BY category ORDER BY SUM(total) DESC
+'''
+RANGE_CATEGORY_SUMMARY = '''
+    SELECT category, SUM(total), SUM(count) FROM expense_rollups
+    WHERE date BETWEEN ? AND ? AND category = ? GROUP BY category
+'''
+
+
+class ExpenseStorage:
+    """Общий слой хранения дневника расходов.
+
+    Держит одно долгоживущее соединение вместо подключения на каждую
+    операцию, настраивает WAL и кэш страниц, применяет миграции схемы.
+    Тексты запросов постоянны, поэтому sqlite3 компилирует каждый один
+    раз и дальше берет из кэша.
+    """
+
+    def __init__(self, db_name='expenses.db'):
+        self.db_name = db_name
+        self.conn = sqlite3.connect(db_name, cached_statements=STATEMENT_CACHE)
+        for pragma in PRAGMAS:
+            self.conn.execute(pragma)
+        self.migrate()
+        # Индексы и триггеры могли остаться удаленными, если массовая загрузка была прервана
+        self.create_indexes()
+        if not self.has_triggers():
+            self.create_triggers()
+
+    def migrate(self):
+        """Применение недостающих миграций, каждая в своей транзакции"""
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        for target in sorted(MIGRATIONS):
+            if target <= version:
+                continue
+            with self.conn:
+                # Явный BEGIN: модуль sqlite3 сам открывает транзакцию только перед DML, а не перед DDL
+                self.conn.execute('BEGIN')
+                for statement in MIGRATIONS[target]:
+                    self.conn.execute(statement)
+                self.conn.execute(f'PRAGMA user_version = {target}')
+
+    @property
+    def schema_version(self):
+        return self.conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def add_expense(self, amount, category, expense_date, description=None):
+        """Добавление записи; возвращает ее id"""
+        with self.conn:
+            cursor = self.conn.execute(INSERT_EXPENSE, (amount, category, expense_date, description))
+        return cursor.lastrowid
+
+    def create_indexes(self):
+        with self.conn:
+            for statement in INDEXES.values():
+                self.conn.execute(statement)
+
+    def has_triggers(self):
+        names = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+        return set(TRIGGERS) <= names
+
+    def create_triggers(self):
+        """Триггеры сводной таблицы и ее пересчет - в одной транзакции"""
+        with self.conn:
+            self.conn.execute('BEGIN')
+            for statement in TRIGGERS.values():
+                self.conn.execute(statement)
+            self.conn.execute(CLEAR_ROLLUPS)
+            self.conn.execute(FILL_ROLLUPS)
+
+    def rebuild_rollups(self):
+        """Пересчет сводной таблицы по всем записям; возвращает число строк сводки"""
+        with self.conn:
+            self.conn.execute(CLEAR_ROLLUPS)
+            self.conn.execute(FILL_ROLLUPS)
+        return self.conn.execute('SELECT COUNT(*) FROM expense_rollups').fetchone()[0]
+
+    @contextlib.contextmanager
+    def bulk_load(self):
+        """Массовая загрузка без поддержки индексов и сводки: все строится заново в конце.
+
+        Построение индекса сортировкой и пересчет сводки одной группировкой
+        обходятся дешевле, чем обновление их для каждой строки, когда
+        загружается не меньше строк, чем уже есть в таблице.
+        """
+        with self.conn:
+            for name in TRIGGERS:
+                self.conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+            for name in INDEXES:
+                self.conn.execute(f'DROP INDEX IF EXISTS {name}')
+        try:
+            yield self
+        finally:
+            self.create_indexes()
+            self.create_triggers()
+
+    def approximate_rows(self):
+        """Оценка числа записей по максимальному id - без просмотра таблицы"""
+        return self.conn.execute('SELECT MAX(id) FROM expenses').fetchone()[0] or 0
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Общая транзакция для нескольких операций: фиксация в конце, откат при ошибке"""
+        with self.conn:
+            self.conn.execute('BEGIN')
+            yield self
+
+    def insert_many(self, rows, commit=True):
+        """Вставка пачки (сумма, категория, дата, описание, создано); commit=False - внутри transaction()"""
+        if not commit:
+            self.conn.executemany(INSERT_IMPORTED, rows)
+            return len(rows)
+        with self.conn:
+            self.conn.executemany(INSERT_IMPORTED, rows)
+        return len(rows)
+
+    def page(self, view, value=None, key=FIRST_PAGE_KEY, size=PAGE_SIZE, base=0, newer=False):
+        """Курсор по странице просмотра: строки расходов с нарастающим итогом последней колонкой.
+
+        key - (date, id) строки, от которой ищется страница: старше нее или,
+        с newer, новее. base - нарастающий итог до страницы (с newer - до key).
+        Строки читаются из курсора по мере вывода (fetchmany), а не списком.
+        """
+        params = {'value': value, 'date': key[0], 'id': key[1], 'limit': size, 'base': base}
+        return self.conn.execute(PAGE_QUERIES[(view, newer)], params)
+
+    def view_totals(self, view, value=None):
+        """(сумма, число записей) просмотра по сводной таблице"""
+        total, count = self.conn.execute(VIEW_TOTALS[view], {'value': value}).fetchone()
+        return total or 0, count or 0
+
+    def export_rows(self):
+        """Курсор по всем записям в порядке экспорта (без загрузки в память)"""
+        return self.conn.execute(SELECT_FOR_EXPORT)
+
+    def total_amount(self):
+        return self.conn.execute(TOTAL_AMOUNT).fetchone()[0] or 0
+
+    def category_totals(self):
+        return self.conn.execute(CATEGORY_TOTALS).fetchall()
+
+    def total_since(self, start_date):
+        return self.conn.execute(TOTAL_SINCE, (start_date,)).fetchone()[0] or 0
+
+    def summary(self, start_date, end_date, category=None):
+        """Сводка за период по сводной таблице: [(категория, сумма, число записей)]"""
+        if category is None:
+            return self.conn.execute(RANGE_SUMMARY, (start_date, end_date)).fetchall()
+        return self.conn.execute(RANGE_CATEGORY_SUMMARY, (start_date, end_date, category)).fetchall()
+
+    def close(self):
+        """Закрытие соединения; при закрытии последнего соединения SQLite переносит WAL в базу"""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
@@ -0,0 +1,169 @@
+import os
+import re
+import glob
+from concurrent.futures import ProcessPoolExecutor
+
+from text_stats import TextStats
+from text_source import ENCODINGS, READ_SIZE, TextSource
+
+RANGE_SIZE = 64 * 1024 * 1024
+SPLIT_SEARCH_SIZE = 64 * 1024
+# Безопасный разрез: ASCII-пробел, перед которым не перевод строки.
+# Такой байт всегда на границе символа во всех поддерживаемых
+# кодировках, и разрез не рвет ни слово, ни пару '\r\n', ни '\n\n'
+SPLIT_PATTERN = re.compile(rb'[^\r\n][ \t\n\r]')
+
+
+def collect_files(pattern):
+    """Список файлов по пути к папке (рекурсивно) или glob-шаблону"""
+    if os.path.isdir(pattern):
+        paths = []
+        for dirpath, dirnames, filenames in os.walk(pattern):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                paths.append(os.path.join(dirpath, filename))
+        return paths
+    return sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+
+
+def find_split_point(file, position, end):
+    """Первая безопасная точка разреза в диапазоне (position, end) или None"""
+    file.seek(position - 1)
+    previous = file.read(1)
+    while position < end:
+        window = file.read(min(SPLIT_SEARCH_SIZE, end - position))
+        if not window:
+            break
+        match = SPLIT_PATTERN.search(previous + window)
+        if match:
+            split = position + match.start()
+            return split if split < end else None
+        position += len(window)
+        previous = window[-1:]
+    return None
+
+
+def split_ranges(file_path, size, range_size=RANGE_SIZE):
+    """Разбиение файла на диапазоны байтов примерно по range_size"""
+    ranges = []
+    start = 0
+    with open(file_path, 'rb') as file:
+        while size - start > range_size:
+            split = find_split_point(file, start + range_size, size)
+            if split is None:
+                break
+            ranges.append((start, split))
+            start = split
+    ranges.append((start, size))
+    return ranges
+
+
+def analyze_ranges(tasks, block_size=READ_SIZE, stats_options=None):
+    """Работа процесса: частичные результаты для списка (путь, кодировка, начало, конец).
+
+    Для диапазона, который не декодируется выбранной кодировкой,
+    возвращается None - кодировку уточняет основной процесс.
+    """
+    results = []
+    for file_path, encoding, start, end in tasks:
+        source = TextSource(file_path, encoding, block_size=block_size)
+        stats = TextStats(**(stats_options or {}))
+        try:
+            for chunk in source.iter_chunks(start, end):
+                stats.feed(chunk)
+        except UnicodeDecodeError:
+            results.append(None)
+            continue
+        results.append(stats.flush())
+    return results
+
+
+class BatchAnalyzer:
+    """Параллельный анализ множества файлов в пуле процессов.
+
+    Файлы (и диапазоны больших файлов) распределяются по процессам,
+    каждый возвращает частичный TextStats. Частичные результаты
+    склеиваются по порядку файлов и диапазонов, поэтому итог совпадает
+    с последовательным анализом файлов один за другим.
+    """
+
+    def __init__(self, workers=None, range_size=RANGE_SIZE, block_size=READ_SIZE, top_n=10, stats_options=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.range_size = range_size
+        self.block_size = block_size
+        self.top_n = top_n
+        self.stats_options = stats_options or {}
+        # Общий TextStats последнего запуска (полная таблица частот для выгрузки)
+        self.total_stats = None
+
+    def _plan(self, sources):
+        """Группировка диапазонов в задания размером около range_size"""
+        ranges = []
+        for file_path, source in sources.items():
+            for index, (start, end) in enumerate(split_ranges(file_path, source.size, self.range_size)):
+                ranges.append((end - start, file_path, index, (file_path, source.encoding, start, end)))
+
+        # Крупные диапазоны первыми, мелкие файлы докладываем в общие задания
+        ranges.sort(key=lambda item: item[0], reverse=True)
+        groups = []
+        group, group_size = [], 0
+        for size, file_path, index, task in ranges:
+            if group and group_size + size > self.range_size:
+                groups.append(group)
+                group, group_size = [], 0
+            group.append((file_path, index, task))
+            group_size += size
+        if group:
+            groups.append(group)
+        return groups
+
+    def _analyze_file(self, pool, file_path, source):
+        """Повторный анализ одного файла после смены кодировки"""
+        tasks = [(file_path, source.encoding, start, end)
+                 for start, end in split_ranges(file_path, source.size, self.range_size)]
+        futures = [pool.submit(analyze_ranges, [task], self.block_size, self.stats_options) for task in tasks]
+        return [future.result()[0] for future in futures]
+
+    def run(self, pattern):
+        """Анализ файлов по шаблону; возвращает (общий анализ, анализы по файлам, пропущенные)"""
+        paths = collect_files(pattern)
+        sources = {}
+        skipped = []
+        for file_path in paths:
+            source = TextSource.open(file_path, ENCODINGS, block_size=self.block_size)
+            if source is None:
+                skipped.append(file_path)
+            else:
+                sources[file_path] = source
+
+        total = TextStats(**self.stats_options)
+        reports = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            parts = {}
+            for group in self._plan(sources):
+                future = pool.submit(analyze_ranges, [task for _, _, task in group],
+                                     self.block_size, self.stats_options)
+                for position, (file_path, index, _) in enumerate(group):
+                    parts.setdefault(file_path, {})[index] = (future, position)
+
+            # Склейка строго по порядку файлов и диапазонов
+            for file_path, source in sources.items():
+                file_parts = parts[file_path]
+                results = [file_parts[index][0].result()[file_parts[index][1]] for index in sorted(file_parts)]
+                while None in results:
+                    if source.fallback() is None:
+                        break
+                    results = self._analyze_file(pool, file_path, source)
+                if None in results:
+                    skipped.append(file_path)
+                    continue
+
+                stats = results[0]
+                for part in results[1:]:
+                    stats.merge(part)
+                stats.finish()
+                reports[file_path] = stats.analysis(self.top_n)
+                total.merge(stats)
+
+        self.total_stats = total.finish()
+        return total.analysis(self.top_n), reports, skipped
@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import contextlib
+import multiprocessing
+
+from main import TextAnalyzer
+from text_source import TextSource
+
+SIZES = {'1MB': 1024 ** 2, '100MB': 100 * 1024 ** 2, '1GB': 1024 ** 3}
+DATA_DIR = 'bench_data'
+SEED = 42
+TOLERANCE = 0.2
+PARAGRAPH_POOL = 512
+
+RUSSIAN_WORDS = (
+    'и в не на я быть он с что а по это она этот к но они мы как из у который то за свой '
+    'весь год от так о для ты же все тот мочь вы человек такой его сказать только или еще '
+    'бы себя один когда уже до время если сам другой вот говорить наш мой знать стать при '
+    'чтобы дело жизнь кто первый очень два день её новый рука даже во со раз где там под '
+    'можно ну какой после их работа без самый потом надо хотеть ли слово идти большой '
+    'должен место иметь ничто город дом страна вопрос глаз сторона друг голова лицо'
+).split()
+
+ENGLISH_WORDS = (
+    'the be to of and a in that have i it for not on with he as you do at this but his by '
+    'from they we say her she or an will my one all would there their what so up out if '
+    'about who get which go me when make can like time no just him know take people into '
+    'year your good some could them see other than then now look only come its over think '
+    'also back after use two how our work first well way even new want because any these '
+    'give day most us city house country question eye side friend head face world'
+).split()
+
+CORPORA = {
+    'ru-utf8': (RUSSIAN_WORDS, 'utf-8'),
+    'ru-cp1251': (RUSSIAN_WORDS, 'cp1251'),
+    'ru-koi8r': (RUSSIAN_WORDS, 'koi8-r'),
+    'en-utf8': (ENGLISH_WORDS, 'utf-8'),
+}
+
+
+def make_paragraph(rng, words):
+    """Абзац из предложений с частотами слов по закону Ципфа"""
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    sentences = []
+    for _ in range(rng.randint(2, 8)):
+        sentence = rng.choices(words, weights, k=rng.randint(4, 20))
+        sentence[0] = sentence[0].capitalize()
+        sentences.append(' '.join(sentence) + rng.choice('...!?'))
+    return ' '.join(sentences)
+
+
+def generate_corpus(file_path, words, encoding, size, seed=SEED):
+    """Воспроизводимая генерация текстового файла заданного размера"""
+    rng = random.Random(seed)
+    pool = [(make_paragraph(rng, words) + '\n\n').encode(encoding) for _ in range(PARAGRAPH_POOL)]
+    written = 0
+    with open(file_path, 'wb') as file:
+        while written < size:
+            block = b''.join(rng.choices(pool, k=64))
+            if len(block) > size - written:
+                # Обрезка по границе абзаца, а не посреди многобайтового символа;
+                # остаток до точного размера добивается переводами строк
+                boundary = block.rfind(b'\n\n', 0, size - written)
+                block = block[:boundary + 2] if boundary >= 0 else b''
+                block += b'\n' * (size - written - len(block))
+            file.write(block)
+            written += len(block)
+
+
+def ensure_corpora(data_dir, sizes):
+    """Генерация недостающих корпусов; возвращает {имя: путь}"""
+    os.makedirs(data_dir, exist_ok=True)
+    corpora = {}
+    for size_name in sizes:
+        for corpus_name, (words, encoding) in CORPORA.items():
+            name = f"{corpus_name}-{size_name}"
+            file_path = os.path.join(data_dir, f"{name}.txt")
+            if not os.path.exists(file_path) or os.path.getsize(file_path) != SIZES[size_name]:
+                print(f"🛠️  Генерация корпуса {name}...")
+                generate_corpus(file_path, words, encoding, SIZES[size_name])
+            corpora[name] = file_path
+    return corpora
+
+
+def run_metric(metric, file_path):
+    """Выполнение одной метрики; возвращает время в секундах"""
+    # Кэш и контрольные точки отключены, чтобы мерить сам подсчет
+    analyzer = TextAnalyzer(cache_dir=None)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if metric != 'try_decode':
+            analyzer.source = TextSource.open(file_path, block_size=analyzer.chunk_size)
+        if metric == 'analyze_text_approx':
+            analyzer.approximate = True
+
+        started = time.perf_counter()
+        if metric == 'try_decode':
+            analyzer.try_decode(file_path)
+        elif metric in ('analyze_text', 'analyze_text_approx'):
+            analyzer.analyze_text()
+        else:
+            getattr(analyzer, metric)()
+        return time.perf_counter() - started
+
+
+METRICS = ['try_decode', 'count_words', 'count_characters', 'count_sentences',
+           'top_frequent_words', 'analyze_text', 'analyze_text_approx']
+
+
+def _measure_worker(metric, file_path, repeat, connection):
+    """Дочерний процесс: лучшее время из repeat запусков и пиковый RSS"""
+    best = min(run_metric(metric, file_path) for _ in range(repeat))
+    # ru_maxrss в Linux измеряется в килобайтах
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    connection.send((best, peak_rss))
+    connection.close()
+
+
+def measure(metric, file_path, repeat):
+    """Замер в отдельном процессе, чтобы пиковый RSS относился только к метрике"""
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure_worker, args=(metric, file_path, repeat, sender))
+    process.start()
+    seconds, peak_rss = receiver.recv()
+    process.join()
+    size_mb = os.path.getsize(file_path) / 1024 ** 2
+    return {
+        'seconds': seconds,
+        'throughput_mb_s': size_mb / seconds if seconds > 0 else 0,
+        'peak_rss_mb': peak_rss / 1024 ** 2,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Список регрессий относительно базовой линии"""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if not previous:
+            continue
+        if current['throughput_mb_s'] < previous['throughput_mb_s'] * (1 - tolerance):
+            regressions.append(f"{key}: скорость {previous['throughput_mb_s']:.1f} → "
+                               f"{current['throughput_mb_s']:.1f} МБ/с")
+        if current['peak_rss_mb'] > previous['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{key}: память {previous['peak_rss_mb']:.1f} → "
+                               f"{current['peak_rss_mb']:.1f} МБ")
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Бенчмарк анализатора текста")
+    parser.add_argument('--sizes', default='1MB',
+                        help=f"размеры корпусов через запятую ({', '.join(SIZES)})")
+    parser.add_argument('--metrics', default=','.join(METRICS), help="метрики через запятую")
+    parser.add_argument('--repeat', type=int, default=3, help="число повторов (берется лучшее время)")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="папка для сгенерированных корпусов")
+    parser.add_argument('--output', default='bench_results.json', help="файл для результатов")
+    parser.add_argument('--baseline', default='bench_baseline.json', help="файл базовой линии")
+    parser.add_argument('--save-baseline', action='store_true', help="сохранить результаты как базовую линию")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="допустимое ухудшение (доля)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [size.strip() for size in args.sizes.split(',') if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        print(f"❌ Неизвестные размеры: {', '.join(unknown)}")
+        return 2
+
+    corpora = ensure_corpora(args.data_dir, sizes)
+    metrics = [metric.strip() for metric in args.metrics.split(',') if metric.strip()]
+
+    results = {}
+    print(f"\n{'Корпус/метрика':<42} {'Время, с':>10} {'МБ/с':>10} {'RSS, МБ':>10}")
+    print("-" * 75)
+    for name, file_path in corpora.items():
+        for metric in metrics:
+            key = f"{name}/{metric}"
+            results[key] = measure(metric, file_path, args.repeat)
+            result = results[key]
+            print(f"{key:<42} {result['seconds']:>10.3f} {result['throughput_mb_s']:>10.1f} "
+                  f"{result['peak_rss_mb']:>10.1f}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ Результаты сохранены в {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"✅ Базовая линия сохранена в {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("ℹ️  Базовая линия не найдена - сравнение пропущено")
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\n⚠️  ОБНАРУЖЕНЫ РЕГРЕССИИ:")
+        for regression in regressions:
+            print(f"• {regression}")
+        return 1
+    print("✅ Регрессий относительно базовой линии нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
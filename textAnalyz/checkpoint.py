@@ -0,0 +1,121 @@
+import os
+import pickle
+import sqlite3
+import contextlib
+import hashlib
+
+from result_cache import CACHE_DIR
+from text_stats import STATS_VERSION, TextStats
+
+FINGERPRINT_SIZE = 4096
+
+
+def file_fingerprint(file_path, offset, size=FINGERPRINT_SIZE):
+    """Хэш начала файла и участка перед offset - признак, что старая часть не менялась"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        digest.update(file.read(min(size, offset)))
+        tail_start = max(0, offset - size)
+        file.seek(tail_start)
+        digest.update(file.read(offset - tail_start))
+    return digest.hexdigest()
+
+
+class CheckpointStore:
+    """Контрольные точки для дочитывания файлов, в которые только дописывают.
+
+    Хранит смещение в байтах, незаконченный TextStats (счетчики, Counter,
+    незакрытые предложение и абзац, перенесенный хвост со словом) и
+    состояние декодера (часть многобайтового символа или '\\r' на конце).
+    Если файл тот же (inode, отпечаток начала и участка перед смещением)
+    и не стал короче, анализ продолжается только по дописанным байтам.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, 'checkpoints.db')
+        self.init_db()
+
+    def init_db(self):
+        """Создание таблицы контрольных точек"""
+        with contextlib.closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    path TEXT PRIMARY KEY,
+                    encoding TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    offset INTEGER NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    decoder_state BLOB NOT NULL,
+                    stats BLOB NOT NULL
+                )
+            ''')
+
+    def _row(self, path, columns):
+        """Строка контрольной точки файла с нужными столбцами или None"""
+        with contextlib.closing(sqlite3.connect(self.db_path)) as conn, conn:
+            return conn.execute(
+                f'SELECT encoding, version, inode, offset, fingerprint{columns} '
+                'FROM checkpoints WHERE path = ?', (path,)
+            ).fetchone()
+
+    @staticmethod
+    def _matches(source, path, encoding, version, inode, offset, fingerprint):
+        """Тот же файл, к которому только дописывали после контрольной точки"""
+        stat = os.stat(path)
+        return (encoding == source.encoding and version == STATS_VERSION
+                and inode == stat.st_ino and offset <= stat.st_size
+                and fingerprint == file_fingerprint(path, offset))
+
+    def resumable(self, source):
+        """Смещение подходящей контрольной точки или None (без чтения состояния)"""
+        path = os.path.realpath(source.file_path)
+        row = self._row(path, '')
+        if row is None or not self._matches(source, path, *row):
+            return None
+        return row[3]
+
+    def load(self, source, stats_options=None):
+        """Состояние для продолжения: (смещение, TextStats, состояние декодера) или None"""
+        path = os.path.realpath(source.file_path)
+        row = self._row(path, ', decoder_state, stats')
+        if row is None or not self._matches(source, path, *row[:5]):
+            return None
+
+        offset, decoder_state, stats = row[3], row[5], row[6]
+        stats = pickle.loads(stats)
+        if stats.options != TextStats(**(stats_options or {})).options:
+            return None
+        return offset, stats, pickle.loads(decoder_state)
+
+    def save(self, source, offset, stats, decoder_state):
+        """Сохранение незаконченного состояния анализа на смещении offset"""
+        path = os.path.realpath(source.file_path)
+        with contextlib.closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO checkpoints '
+                '(path, encoding, version, inode, offset, fingerprint, decoder_state, stats) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (path, source.encoding, STATS_VERSION, os.stat(path).st_ino, offset,
+                 file_fingerprint(path, offset),
+                 pickle.dumps(decoder_state), pickle.dumps(stats, protocol=pickle.HIGHEST_PROTOCOL))
+            )
+
+    def collect(self, source, stats_options=None):
+        """Анализ с продолжением от контрольной точки; возвращает (TextStats, дочитано байт)"""
+        end = source.size
+        resumed = self.load(source, stats_options)
+        if resumed is None:
+            offset, stats, decoder = 0, TextStats(**(stats_options or {})), source.make_decoder()
+        else:
+            offset, stats, decoder_state = resumed
+            decoder = source.make_decoder(decoder_state)
+
+        for chunk in source.iter_chunks(offset, end, decoder):
+            stats.feed(chunk)
+
+        # Сохраняем состояние до завершающего сброса декодера и закрытия абзаца
+        self.save(source, end, stats, decoder.getstate())
+        stats.feed(decoder.decode(b'', final=True))
+        return stats.finish(), end - offset
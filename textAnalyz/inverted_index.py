@@ -0,0 +1,501 @@
+import os
+import json
+import mmap
+import heapq
+import struct
+import bisect
+
+from text_stats import SENTENCE_SPLIT_PATTERN, WORD_PATTERN, TextStats
+
+INDEX_DIR = 'text_index'
+INDEX_MEMORY_BUDGET = 64 * 1024 * 1024
+# Примерная цена слова в словаре построителя сверх его списка вхождений
+WORD_OVERHEAD = 160
+# Запись лексикона: смещение и длина слова, смещение и длина списка, число вхождений
+LEXICON_RECORD = struct.Struct('<QIQIQ')
+SEGMENT_FILES = ('lex', 'words', 'post', 'files.json')
+# При большем числе сегментов после добавления нового они сливаются в один
+MAX_SEGMENTS = 8
+
+
+def write_varint(buffer, value):
+    """Запись неотрицательного числа в формате varint (7 бит на байт)"""
+    while value > 0x7F:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data, position):
+    """Чтение varint; возвращает (значение, новая позиция)"""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def decode_postings(data):
+    """Разбор списка вхождений: последовательность блоков со сжатыми дельтами.
+
+    Блок - число записей и записи (файл, смещение, предложение, позиция).
+    Если номер файла меняется, остальные поля записаны целиком, иначе -
+    как разность с предыдущей записью.
+    """
+    postings = []
+    position = 0
+    while position < len(data):
+        count, position = read_varint(data, position)
+        file_id, offset, sentence, word_position = -1, 0, 0, 0
+        for _ in range(count):
+            file_delta, position = read_varint(data, position)
+            if file_delta:
+                file_id += file_delta
+                offset = sentence = word_position = 0
+            delta, position = read_varint(data, position)
+            offset += delta
+            delta, position = read_varint(data, position)
+            sentence += delta
+            delta, position = read_varint(data, position)
+            word_position += delta
+            postings.append((file_id, offset, sentence, word_position))
+    return postings
+
+
+def encode_postings(postings):
+    """Сжатие отсортированного списка вхождений в один блок (обратное decode_postings)"""
+    data = bytearray()
+    write_varint(data, len(postings))
+    file_id, offset, sentence, word_position = -1, 0, 0, 0
+    for posting in postings:
+        if posting[0] != file_id:
+            write_varint(data, posting[0] - file_id)
+            file_id, offset, sentence, word_position = posting[0], 0, 0, 0
+        else:
+            data.append(0)
+        write_varint(data, posting[1] - offset)
+        write_varint(data, posting[2] - sentence)
+        write_varint(data, posting[3] - word_position)
+        offset, sentence, word_position = posting[1], posting[2], posting[3]
+    return data
+
+
+class IndexBuilder:
+    """Построение сегмента инвертированного индекса во время анализа.
+
+    Для каждого слова копится сжатый список вхождений (файл, смещение в
+    символах, номер предложения, номер слова в файле). При превышении
+    бюджета памяти накопленное сбрасывается на диск отсортированным
+    прогоном, в конце прогоны сливаются в сегмент: лексикон, слова и
+    списки вхождений, которые при поиске открываются через mmap.
+    """
+
+    def __init__(self, index_dir=INDEX_DIR, memory_budget=INDEX_MEMORY_BUDGET):
+        self.index_dir = index_dir
+        self.memory_budget = memory_budget
+        os.makedirs(index_dir, exist_ok=True)
+        self.segment = self._next_segment_name()
+        self.files = []
+        self._runs = []
+        self._reset_postings()
+        self._file_id = -1
+
+    def _next_segment_name(self):
+        existing = read_segment_list(self.index_dir)
+        number = 1 + max((int(name) for name in existing), default=0)
+        while os.path.exists(self._path(f"{number:06d}", 'lex')):
+            number += 1
+        return f"{number:06d}"
+
+    def _path(self, segment, extension):
+        return os.path.join(self.index_dir, f"{segment}.{extension}")
+
+    def _reset_postings(self):
+        # слово -> [данные, число записей, файл, смещение, предложение, позиция]
+        self._postings = {}
+        self._memory = 0
+
+    def start_file(self, file_path):
+        """Начало индексации очередного файла"""
+        self.files.append(os.path.abspath(file_path))
+        self._file_id = len(self.files) - 1
+        self._offset = 0
+        self._sentence = 0
+        self._position = 0
+        self._carry = ""
+
+    def feed(self, chunk):
+        """Индексация очередного фрагмента (с тем же переносом хвоста, что у TextStats)"""
+        segment = self._carry + chunk
+        cut = TextStats._find_cut(segment, len(self._carry))
+        self._index(segment[:cut])
+        self._carry = segment[cut:]
+
+    def end_file(self):
+        """Завершение индексации текущего файла"""
+        self._index(self._carry)
+        self._carry = ""
+
+    def _index(self, segment):
+        if not segment:
+            return
+        # Начала предложений внутри отрезка (позиции после серии разделителей)
+        starts = [match.end() for match in SENTENCE_SPLIT_PATTERN.finditer(segment)]
+        file_id = self._file_id
+        for match in WORD_PATTERN.finditer(segment):
+            sentence = self._sentence + bisect.bisect_right(starts, match.start())
+            self._add(match.group().lower(), file_id, self._offset + match.start(), sentence, self._position)
+            self._position += 1
+        self._sentence += len(starts)
+        self._offset += len(segment)
+        if self._memory > self.memory_budget:
+            self._flush_run()
+
+    def _add(self, word, file_id, offset, sentence, position):
+        entry = self._postings.get(word)
+        if entry is None:
+            entry = self._postings[word] = [bytearray(), 0, -1, 0, 0, 0]
+            self._memory += WORD_OVERHEAD + len(word)
+        data = entry[0]
+        before = len(data)
+        if file_id != entry[2]:
+            write_varint(data, file_id - entry[2])
+            entry[2], entry[3], entry[4], entry[5] = file_id, 0, 0, 0
+        else:
+            data.append(0)
+        write_varint(data, offset - entry[3])
+        write_varint(data, sentence - entry[4])
+        write_varint(data, position - entry[5])
+        entry[1] += 1
+        entry[3], entry[4], entry[5] = offset, sentence, position
+        self._memory += len(data) - before
+
+    def _flush_run(self):
+        """Сброс накопленных списков на диск отсортированным прогоном"""
+        if not self._postings:
+            return
+        run_path = self._path(self.segment, f"run{len(self._runs)}")
+        with open(run_path, 'wb') as file:
+            for word in sorted(self._postings, key=lambda item: item.encode('utf-8')):
+                data, count = self._postings[word][0], self._postings[word][1]
+                record = bytearray()
+                encoded = word.encode('utf-8')
+                write_varint(record, len(encoded))
+                record += encoded
+                block = bytearray()
+                write_varint(block, count)
+                block += data
+                write_varint(record, len(block))
+                record += block
+                file.write(record)
+        self._runs.append(run_path)
+        self._reset_postings()
+
+    def abort(self):
+        """Отмена построения сегмента с удалением временных файлов"""
+        for run_path in self._runs:
+            os.remove(run_path)
+        self._runs = []
+        self._reset_postings()
+
+    def finish(self):
+        """Слияние прогонов в сегмент и регистрация его в индексе"""
+        self._flush_run()
+        runs = [_iter_run(run_path) for run_path in self._runs]
+        words_file = open(self._path(self.segment, 'words'), 'wb')
+        postings_file = open(self._path(self.segment, 'post'), 'wb')
+        lexicon_file = open(self._path(self.segment, 'lex'), 'wb')
+        with words_file, postings_file, lexicon_file:
+            current, blocks, total = None, [], 0
+            for word, run_index, block, count in heapq.merge(*runs):
+                if word != current and current is not None:
+                    self._write_word(current, blocks, total, words_file, postings_file, lexicon_file)
+                    blocks, total = [], 0
+                current = word
+                blocks.append(block)
+                total += count
+            if current is not None:
+                self._write_word(current, blocks, total, words_file, postings_file, lexicon_file)
+
+        with open(self._path(self.segment, 'files.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.files, f, ensure_ascii=False)
+        for run_path in self._runs:
+            os.remove(run_path)
+        self._runs = []
+        segments = read_segment_list(self.index_dir) + [self.segment]
+        live = [name for name, files in _live_files(self.index_dir, segments) if files]
+        write_segment_list(self.index_dir, live)
+        # Сегменты, все файлы которых переиндексированы, больше не нужны
+        for name in set(segments) - set(live):
+            _remove_segment(self.index_dir, name)
+        if len(live) > MAX_SEGMENTS:
+            return compact_index(self.index_dir)
+        return self.segment
+
+    @staticmethod
+    def _write_word(word, blocks, count, words_file, postings_file, lexicon_file):
+        word_offset = words_file.tell()
+        words_file.write(word)
+        postings_offset = postings_file.tell()
+        length = 0
+        for block in blocks:
+            postings_file.write(block)
+            length += len(block)
+        lexicon_file.write(LEXICON_RECORD.pack(word_offset, len(word), postings_offset, length, count))
+
+
+def _iter_run(run_path):
+    """Чтение прогона через mmap: (слово в байтах, номер прогона, блок, число записей)"""
+    run_index = int(run_path.rsplit('run', 1)[1])
+    with open(run_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        position = 0
+        while position < len(data):
+            length, position = read_varint(data, position)
+            word = data[position:position + length]
+            position += length
+            length, position = read_varint(data, position)
+            block = data[position:position + length]
+            position += length
+            yield word, run_index, block, read_varint(block, 0)[0]
+
+
+def read_segment_list(index_dir):
+    path = os.path.join(index_dir, 'segments.json')
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_segment_list(index_dir, segments):
+    # Запись через временный файл, чтобы список сегментов не оказался битым
+    path = os.path.join(index_dir, 'segments.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(segments, f)
+    os.replace(path + '.tmp', path)
+
+
+def _read_segment_files(index_dir, name):
+    with open(os.path.join(index_dir, f"{name}.files.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _live_files(index_dir, segments):
+    """Для каждого сегмента - (имя, его файлы, не проиндексированные в более новых сегментах)"""
+    newer_files = set()
+    live = []
+    for name in reversed(segments):
+        files = _read_segment_files(index_dir, name)
+        live.append((name, set(files) - newer_files))
+        newer_files.update(files)
+    live.reverse()
+    return live
+
+
+def _remove_segment(index_dir, name):
+    for extension in SEGMENT_FILES:
+        path = os.path.join(index_dir, f"{name}.{extension}")
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _iter_lexicon(segment, number):
+    """Слова сегмента по порядку: (слово в байтах, номер сегмента, номер записи)"""
+    for index in range(segment.size):
+        yield segment._word(index), number, index
+
+
+def compact_index(index_dir=INDEX_DIR):
+    """Слияние всех сегментов в один без вхождений переиндексированных файлов.
+
+    Лексиконы сегментов уже отсортированы, поэтому слияние идет одним
+    проходом heapq.merge; в памяти держатся вхождения только одного слова.
+    Возвращает имя нового сегмента.
+    """
+    names = read_segment_list(index_dir)
+    if len(names) < 2:
+        return names[0] if names else None
+
+    live = _live_files(index_dir, names)
+    files = [path for _, segment_files in live for path in sorted(segment_files)]
+    file_ids = {path: file_id for file_id, path in enumerate(files)}
+    builder = IndexBuilder(index_dir)
+    segments = [IndexSegment(index_dir, name) for name in names]
+    try:
+        words_file = open(builder._path(builder.segment, 'words'), 'wb')
+        postings_file = open(builder._path(builder.segment, 'post'), 'wb')
+        lexicon_file = open(builder._path(builder.segment, 'lex'), 'wb')
+        with words_file, postings_file, lexicon_file:
+            current, postings = None, []
+            lexicons = [_iter_lexicon(segment, number) for number, segment in enumerate(segments)]
+            for word, number, index in heapq.merge(*lexicons):
+                if word != current and current is not None:
+                    _write_postings(current, postings, words_file, postings_file, lexicon_file)
+                    postings = []
+                current = word
+                segment, segment_files = segments[number], live[number][1]
+                _, _, postings_offset, length, _ = segment._record(index)
+                data = segment._maps['post'][postings_offset:postings_offset + length]
+                postings.extend(
+                    (file_ids[segment.files[file_id]], offset, sentence, position)
+                    for file_id, offset, sentence, position in decode_postings(data)
+                    if segment.files[file_id] in segment_files
+                )
+            if current is not None:
+                _write_postings(current, postings, words_file, postings_file, lexicon_file)
+    finally:
+        for segment in segments:
+            segment.close()
+
+    with open(builder._path(builder.segment, 'files.json'), 'w', encoding='utf-8') as f:
+        json.dump(files, f, ensure_ascii=False)
+    write_segment_list(index_dir, [builder.segment])
+    for name in names:
+        _remove_segment(index_dir, name)
+    return builder.segment
+
+
+def _write_postings(word, postings, words_file, postings_file, lexicon_file):
+    """Запись слова слитого сегмента; слова без оставшихся вхождений пропускаются"""
+    if postings:
+        postings.sort()
+        IndexBuilder._write_word(word, [encode_postings(postings)], len(postings),
+                                 words_file, postings_file, lexicon_file)
+
+
+class IndexSegment:
+    """Сегмент индекса, открытый только для чтения через mmap"""
+
+    def __init__(self, index_dir, name):
+        self.name = name
+        self.files = _read_segment_files(index_dir, name)
+        self._maps = {}
+        for extension in ('lex', 'words', 'post'):
+            path = os.path.join(index_dir, f"{name}.{extension}")
+            with open(path, 'rb') as file:
+                self._maps[extension] = (
+                    mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b''
+                )
+        self.size = len(self._maps['lex']) // LEXICON_RECORD.size
+
+    def close(self):
+        for mapped in self._maps.values():
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+    def _record(self, index):
+        return LEXICON_RECORD.unpack_from(self._maps['lex'], index * LEXICON_RECORD.size)
+
+    def _word(self, index):
+        word_offset, word_length = self._record(index)[:2]
+        return self._maps['words'][word_offset:word_offset + word_length]
+
+    def _lower_bound(self, key):
+        """Первая запись лексикона, слово которой не меньше key (в байтах UTF-8)"""
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self._word(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _postings(self, index):
+        _, _, postings_offset, length, _ = self._record(index)
+        data = self._maps['post'][postings_offset:postings_offset + length]
+        return [(self.files[file_id], offset, sentence, position)
+                for file_id, offset, sentence, position in decode_postings(data)]
+
+    def lookup(self, word):
+        """Вхождения слова: список (файл, смещение, предложение, позиция)"""
+        key = word.encode('utf-8')
+        index = self._lower_bound(key)
+        if index < self.size and self._word(index) == key:
+            return self._postings(index)
+        return []
+
+    def prefix(self, prefix, limit=None):
+        """Слова с заданным началом: список (слово, число вхождений)"""
+        key = prefix.encode('utf-8')
+        index = self._lower_bound(key)
+        words = []
+        while index < self.size and (limit is None or len(words) < limit):
+            word = self._word(index)
+            if not word.startswith(key):
+                break
+            words.append((word.decode('utf-8'), self._record(index)[4]))
+            index += 1
+        return words
+
+    def prefix_postings(self, prefix):
+        """Вхождения всех слов с заданным началом"""
+        key = prefix.encode('utf-8')
+        index = self._lower_bound(key)
+        postings = []
+        while index < self.size and self._word(index).startswith(key):
+            postings.extend(self._postings(index))
+            index += 1
+        return postings
+
+
+class InvertedIndex:
+    """Поиск по всем сегментам индекса.
+
+    Если файл проиндексирован повторно, вхождения из старых сегментов
+    для него отбрасываются - действует самый новый сегмент.
+    Сегменты, все файлы которых переиндексированы, удаляются при
+    добавлении нового, а при числе сегментов больше MAX_SEGMENTS они
+    сливаются в один (compact_index).
+    """
+
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = index_dir
+        self.segments = [IndexSegment(index_dir, name) for name in read_segment_list(index_dir)]
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+
+    def _collect(self, query):
+        """Объединение ответов сегментов с учетом переиндексации файлов"""
+        results = []
+        newer_files = set()
+        for segment in reversed(self.segments):
+            results.extend(posting for posting in query(segment) if posting[0] not in newer_files)
+            newer_files.update(segment.files)
+        results.sort()
+        return results
+
+    def search_word(self, word):
+        """Вхождения слова"""
+        return self._collect(lambda segment: segment.lookup(word.lower()))
+
+    def search_prefix(self, prefix):
+        """Вхождения слов, начинающихся с prefix"""
+        return self._collect(lambda segment: segment.prefix_postings(prefix.lower()))
+
+    def words_with_prefix(self, prefix, limit=20):
+        """Слова с заданным началом и их частоты"""
+        counts = {}
+        for segment in self.segments:
+            for word, count in segment.prefix(prefix.lower(), limit):
+                counts[word] = counts.get(word, 0) + count
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def search_phrase(self, phrase):
+        """Вхождения фразы: слова подряд в одном файле"""
+        words = WORD_PATTERN.findall(phrase.lower())
+        if not words:
+            return []
+        matches = self.search_word(words[0])
+        for shift, word in enumerate(words[1:], 1):
+            following = {(path, position - shift) for path, _, _, position in self.search_word(word)}
+            matches = [posting for posting in matches if (posting[0], posting[3]) in following]
+            if not matches:
+                break
+        return matches
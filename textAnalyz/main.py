@@ -1,31 +1,51 @@
 import os
-import re
-from collections import Counter
+import struct
+
+from batch import BatchAnalyzer
+from checkpoint import CheckpointStore
+from inverted_index import INDEX_DIR, IndexBuilder, InvertedIndex
+from report_formats import FORMATS, compare_reports, write_report
+from result_cache import CACHE_DIR, ResultCache
+from text_stats import APPROX_MEMORY_BUDGET, TextStats
+from text_source import ENCODINGS, TextSource
+
+CHUNK_SIZE = 1024 * 1024
 
 
 class TextAnalyzer:
-    def __init__(self):
-        self.text = ""
+    def __init__(self, chunk_size=CHUNK_SIZE, cache_dir=CACHE_DIR, incremental=True):
+        self.source = None
         self.encoding = "utf-8"
+        self.chunk_size = chunk_size
+        self.cache_dir = cache_dir
+        self.cache = None
+        self.incremental = incremental
+        self.checkpoints = None
+        self.approximate = False
+        self.memory_budget = APPROX_MEMORY_BUDGET
+        # Папка инвертированного индекса; None - индекс при анализе не строится
+        self.index_dir = None
+        self.ngrams = False
+        # TextStats последнего анализа - источник полной таблицы частот для отчетов
+        self.last_stats = None
+
+    @property
+    def stats_options(self):
+        """Параметры TextStats для текущего режима подсчета"""
+        options = {}
+        if self.approximate:
+            options.update(approximate=True, memory_budget=self.memory_budget)
+        if self.ngrams:
+            options['ngrams'] = True
+        return options
 
     def try_decode(self, file_path):
-        """Попытка декодирования файла разными кодировками"""
-        encodings = ['utf-8', 'cp1251', 'koi8-r', 'iso-8859-1', 'windows-1251']
-
-        for encoding in encodings:
-            try:
-                with open(file_path, 'r', encoding=encoding) as file:
-                    content = file.read()
-                    # Проверяем, что файл читается нормально
-                    if content.strip():
-                        print(f"✅ Успешно загружено с кодировкой: {encoding}")
-                        return content, encoding
-            except (UnicodeDecodeError, UnicodeError):
-                continue
-            except Exception as e:
-                continue
-
-        return None, None
+        """Определение кодировки по началу файла без чтения его целиком"""
+        source = TextSource.open(file_path, ENCODINGS, block_size=self.chunk_size)
+        if source is None:
+            return None, None
+        print(f"✅ Успешно загружено с кодировкой: {source.encoding}")
+        return source, source.encoding
 
     def load_file(self):
         """Загрузка файла с попыткой разных кодировок"""
@@ -37,13 +57,13 @@ class TextAnalyzer:
 
         try:
             # Пробуем разные кодировки
-            content, encoding = self.try_decode(file_path)
+            source, encoding = self.try_decode(file_path)
 
-            if content is None:
+            if source is None:
                 print("❌ Не удалось определить кодировку файла!")
                 return False
 
-            self.text = content
+            self.source = source
             self.encoding = encoding
             print("✅ Файл успешно загружен!")
             return True
@@ -61,7 +81,7 @@ class TextAnalyzer:
             return False
 
         print("\n📝 Доступные кодировки:")
-        encodings = ['utf-8', 'cp1251', 'koi8-r', 'iso-8859-1', 'windows-1251']
+        encodings = ENCODINGS
         for i, encoding in enumerate(encodings, 1):
             print(f"{i}. {encoding}")
 
@@ -75,80 +95,219 @@ class TextAnalyzer:
             encoding = 'utf-8'
 
         try:
-            with open(file_path, 'r', encoding=encoding) as file:
-                self.text = file.read()
-                self.encoding = encoding
+            source = TextSource(file_path, encoding, block_size=self.chunk_size)
+            if not source.check_sample():
+                print("❌ Ошибка декодирования! Попробуйте другую кодировку.")
+                return False
+            self.source = source
+            self.encoding = encoding
             print("✅ Файл успешно загружен!")
             return True
-        except UnicodeDecodeError:
-            print("❌ Ошибка декодирования! Попробуйте другую кодировку.")
-            return False
         except Exception as e:
             print(f"❌ Ошибка при чтении файла: {e}")
             return False
 
     def count_words(self):
         """Подсчет общего количества слов"""
-        words = re.findall(r'\b\w+\b', self.text)
-        return len(words)
+        return self.collect_stats().total_words
 
     def count_characters(self):
         """Подсчет символов (с пробелами и без)"""
-        with_spaces = len(self.text)
-        without_spaces = len(self.text.replace(' ', '').replace('\n', '').replace('\t', ''))
-        return with_spaces, without_spaces
+        stats = self.collect_stats()
+        return stats.characters_with_spaces, stats.characters_without_spaces
 
     def count_sentences(self):
         """Подсчет количества предложений"""
-        # Разделяем по . ! ? и проверяем, что есть текст
-        sentences = re.split(r'[.!?]+', self.text)
-        sentences = [s.strip() for s in sentences if s.strip() and len(s.strip()) > 1]
-        return len(sentences)
+        return self.collect_stats().sentences
 
     def count_unique_words(self):
         """Подсчет уникальных слов"""
-        words = re.findall(r'\b\w+\b', self.text.lower())
-        return len(set(words))
+        return self.collect_stats().unique_words
 
     def top_frequent_words(self, n=10):
         """Топ-N самых частых слов"""
-        words = re.findall(r'\b\w+\b', self.text.lower())
-        # Исключаем короткие слова (меньше 3 букв)
-        words = [word for word in words if len(word) > 2]
-        word_counts = Counter(words)
-        return word_counts.most_common(n)
+        return self.collect_stats().top_words(n)
 
     def count_paragraphs(self):
         """Подсчет количества абзацев"""
-        paragraphs = [p for p in self.text.split('\n\n') if p.strip()]
-        return len(paragraphs)
+        return self.collect_stats().paragraphs
+
+    def iter_chunks(self):
+        """Ленивый поток фрагментов загруженного файла"""
+        return self.source.iter_chunks()
+
+    def collect_stats(self, build_index=False):
+        """Однопроходный подсчет всех метрик по потоку фрагментов"""
+        while True:
+            builder = IndexBuilder(self.index_dir) if build_index else None
+            try:
+                checkpoints = self.get_checkpoints()
+                if checkpoints and builder is None:
+                    stats, appended = checkpoints.collect(self.source, self.stats_options)
+                    if 0 < appended < self.source.size:
+                        print(f"📎 Дочитано новых байт: {appended:,}")
+                    return stats
+
+                stats = TextStats(**self.stats_options)
+                if builder:
+                    builder.start_file(self.source.file_path)
+                for chunk in self.iter_chunks():
+                    stats.feed(chunk)
+                    if builder:
+                        builder.feed(chunk)
+                if builder:
+                    builder.end_file()
+                    builder.finish()
+                    print(f"🗂️  Индекс обновлен: {self.index_dir}")
+                return stats.finish()
+            except UnicodeDecodeError:
+                if builder:
+                    builder.abort()
+                # Начало файла обмануло автоопределение - пробуем следующую кодировку
+                if self.source.fallback() is None:
+                    raise
+                self.encoding = self.source.encoding
+                print(f"⚠️  Кодировка уточнена по всему файлу: {self.encoding}")
 
     def analyze_text(self):
         """Полный анализ текста"""
-        if not self.text:
+        if self.source is None:
             print("❌ Сначала загрузите файл!")
             return None
 
         print("\n🔍 ВЫПОЛНЯЕТСЯ АНАЛИЗ ТЕКСТА...")
 
-        total_words = self.count_words()
-        chars_with_spaces, chars_without_spaces = self.count_characters()
-        sentences = self.count_sentences()
-        unique_words = self.count_unique_words()
-        paragraphs = self.count_paragraphs()
-        top_words = self.top_frequent_words(10)
-
-        analysis = {
-            'total_words': total_words,
-            'characters_with_spaces': chars_with_spaces,
-            'characters_without_spaces': chars_without_spaces,
-            'sentences': sentences,
-            'paragraphs': paragraphs,
-            'unique_words': unique_words,
-            'top_words': top_words,
-            'word_length_avg': chars_without_spaces / total_words if total_words > 0 else 0,
-            'sentence_length_avg': total_words / sentences if sentences > 0 else 0
-        }
+        # Для построения индекса нужен проход по тексту, кэш не подходит
+        build_index = self.index_dir is not None
+        cache = self.get_cache()
+        key = None
+        if cache and not build_index:
+            # Для дописанного файла хэш продолжается только по новым байтам,
+            # иначе повторный анализ был бы линейным по всей истории файла
+            checkpoints = self.get_checkpoints()
+            appended_from = checkpoints.resumable(self.source) if checkpoints else None
+            key = cache.make_key(self.source.file_path, appended_from, encoding=self.source.encoding,
+                                 **self.stats_options)
+        stats = cache.get(key) if key else None
+
+        if stats is None:
+            try:
+                stats = self.collect_stats(build_index)
+            except UnicodeDecodeError:
+                print("❌ Ошибка декодирования! Попробуйте другую кодировку.")
+                return None
+            if key:
+                cache.put(key, stats)
+        else:
+            print("⚡ Результат взят из кэша (файл не изменился)")
+
+        self.last_stats = stats
+        analysis = stats.analysis(10)
+        if cache:
+            analysis['cache'] = cache.counters()
+        return analysis
+
+    def toggle_approximate(self):
+        """Переключение точного и приближенного подсчета уникальных слов и топа"""
+        if self.approximate:
+            self.approximate = False
+            print("✅ Включен точный подсчет")
+            return
+
+        try:
+            budget_mb = int(input(f"Бюджет памяти в МБ (Enter - {APPROX_MEMORY_BUDGET // (1024 * 1024)}): ") or 0)
+        except ValueError:
+            budget_mb = 0
+        self.memory_budget = budget_mb * 1024 * 1024 if budget_mb > 0 else APPROX_MEMORY_BUDGET
+        self.approximate = True
+        print(f"✅ Включен приближенный подсчет (память: {self.memory_budget // (1024 * 1024)} МБ)")
+
+    def toggle_ngrams(self):
+        """Включение и выключение подсчета биграмм, триграмм и коллокаций"""
+        self.ngrams = not self.ngrams
+        print("✅ Подсчет n-грамм " + ("включен" if self.ngrams else "выключен"))
+
+    def toggle_indexing(self):
+        """Включение и выключение построения индекса при анализе"""
+        if self.index_dir:
+            self.index_dir = None
+            print("✅ Индексация при анализе выключена")
+            return
+        self.index_dir = input(f"Папка индекса (Enter - {INDEX_DIR}): ").strip() or INDEX_DIR
+        print(f"✅ При анализе файл будет добавляться в индекс: {self.index_dir}")
+
+    def search_index(self):
+        """Поиск слова, префикса (слово*) или фразы ("слово слово") по индексу"""
+        index_dir = self.index_dir or INDEX_DIR
+        if not os.path.exists(os.path.join(index_dir, 'segments.json')):
+            print("❌ Индекс не найден! Включите индексацию и выполните анализ.")
+            return
+
+        query = input('Запрос (слово, префикс* или "фраза"): ').strip()
+        if not query:
+            return
+
+        index = InvertedIndex(index_dir)
+        try:
+            if query.startswith('"') and query.endswith('"') and len(query) > 1:
+                results = index.search_phrase(query.strip('"'))
+            elif query.endswith('*'):
+                prefix = query.rstrip('*')
+                words = index.words_with_prefix(prefix)
+                if words:
+                    print("📚 Слова: " + ", ".join(f"{word} ({count:,})" for word, count in words))
+                results = index.search_prefix(prefix)
+            else:
+                results = index.search_word(query)
+        finally:
+            index.close()
+
+        if not results:
+            print("Ничего не найдено")
+            return
+
+        print(f"\n🔎 НАЙДЕНО ВХОЖДЕНИЙ: {len(results):,}")
+        for file_path, offset, sentence, position in results[:20]:
+            print(f"• {file_path}: символ {offset:,}, предложение {sentence + 1:,}, слово {position + 1:,}")
+        if len(results) > 20:
+            print(f"... и еще {len(results) - 20:,}")
+
+    def get_checkpoints(self):
+        """Хранилище контрольных точек для дописываемых файлов"""
+        if self.checkpoints is None and self.incremental and self.cache_dir:
+            self.checkpoints = CheckpointStore(self.cache_dir)
+        return self.checkpoints
+
+    def get_cache(self):
+        """Кэш результатов; None, если кэширование отключено"""
+        if self.cache is None and self.cache_dir:
+            self.cache = ResultCache(self.cache_dir)
+        return self.cache
+
+    def analyze_batch(self):
+        """Параллельный анализ всех файлов папки или glob-шаблона"""
+        pattern = input("Введите путь к папке или шаблон (например, logs/*.txt): ").strip()
+        try:
+            workers = int(input(f"Количество процессов (Enter - {os.cpu_count()}): ") or 0)
+        except ValueError:
+            workers = 0
+
+        print("\n🔍 ВЫПОЛНЯЕТСЯ ПАКЕТНЫЙ АНАЛИЗ...")
+        batch = BatchAnalyzer(workers=workers or None, block_size=self.chunk_size,
+                              stats_options=self.stats_options)
+        analysis, reports, skipped = batch.run(pattern)
+        self.last_stats = batch.total_stats
+
+        if not reports:
+            print("❌ Не найдено ни одного файла для анализа!")
+            return None
+
+        print(f"\n📚 ФАЙЛОВ ПРОАНАЛИЗИРОВАНО: {len(reports)}")
+        for file_path, report in reports.items():
+            print(f"• {file_path}: {report['total_words']:,} слов, "
+                  f"{report['sentences']:,} предложений, {report['unique_words']:,} уникальных")
+        for file_path in skipped:
+            print(f"⚠️  Пропущен (не удалось декодировать): {file_path}")
 
         return analysis
 
@@ -157,6 +316,10 @@ class TextAnalyzer:
         if not analysis:
             return
 
+        approx = analysis.get('approximate')
+        unique_mark = "≈" if approx else ""
+        unique_note = f" (оценка, ±{approx['unique_words_error'] * 100:.1f}%)" if approx else ""
+
         report = f"""📊 ОТЧЕТ АНАЛИЗА ТЕКСТА
 {'=' * 50}
 
@@ -166,25 +329,59 @@ class TextAnalyzer:
 • Количество символов (без пробелов): {analysis['characters_without_spaces']:,}
 • Количество предложений: {analysis['sentences']:,}
 • Количество абзацев: {analysis['paragraphs']:,}
-• Количество уникальных слов: {analysis['unique_words']:,}
+• Количество уникальных слов: {unique_mark}{analysis['unique_words']:,}{unique_note}
 
 📈 ПЛОТНОСТЬ ТЕКСТА:
 • Средняя длина слова: {analysis['word_length_avg']:.1f} символов
 • Средняя длина предложения: {analysis['sentence_length_avg']:.1f} слов
-• Процент уникальных слов: {(analysis['unique_words'] / analysis['total_words'] * 100):.1f}%
+• Процент уникальных слов: {unique_mark}{(analysis['unique_words'] / analysis['total_words'] * 100):.1f}%
 
 🔥 ТОП-10 САМЫХ ЧАСТОТНЫХ СЛОВ:
 """
+        if approx:
+            report += (f"(оценки Space-Saving на {approx['counters']:,} счетчиках: "
+                       f"частота завышена не более чем на указанную погрешность)\n")
 
         for i, (word, count) in enumerate(analysis['top_words'], 1):
             frequency = (count / analysis['total_words']) * 100
-            report += f"{i:2d}. '{word}': {count:,} раз ({frequency:.2f}%)\n"
+            if approx:
+                error = approx['top_words_errors'][i - 1]
+                report += f"{i:2d}. '{word}': ≈{count:,} раз (±{error:,}) ({frequency:.2f}%)\n"
+            else:
+                report += f"{i:2d}. '{word}': {count:,} раз ({frequency:.2f}%)\n"
+
+        if 'top_bigrams' in analysis:
+            report += self.format_ngrams(analysis)
+
+        if 'cache' in analysis:
+            cache = analysis['cache']
+            report += f"""
+💾 КЭШ РЕЗУЛЬТАТОВ:
+• Попаданий: {cache['hits']:,}
+• Промахов: {cache['misses']:,}
+• Хэширований пропущено (файл не менялся): {cache['hashes_skipped']:,}
+"""
 
         report += f"\n{'=' * 50}"
         report += f"\n📅 Отчет сгенерирован: {self.get_timestamp()}"
 
         return report
 
+    def format_ngrams(self, analysis):
+        """Раздел отчета с n-граммами и коллокациями"""
+        text = ""
+        if analysis.get('ngrams_pruned_below'):
+            text += (f"\n(редкие n-граммы с частотой ниже {analysis['ngrams_pruned_below']} "
+                     f"отброшены, частоты - оценки снизу)\n")
+        for title, key in (("ТОП БИГРАММ", 'top_bigrams'), ("ТОП ТРИГРАММ", 'top_trigrams')):
+            text += f"\n🔗 {title}:\n"
+            for i, (phrase, count) in enumerate(analysis[key], 1):
+                text += f"{i:2d}. '{phrase}': {count:,} раз\n"
+        text += "\n🧲 КОЛЛОКАЦИИ (PMI):\n"
+        for i, (phrase, pmi, count) in enumerate(analysis['collocations'], 1):
+            text += f"{i:2d}. '{phrase}': PMI {pmi:.2f} ({count:,} раз)\n"
+        return text
+
     def get_timestamp(self):
         """Получение текущей даты и времени"""
         from datetime import datetime
@@ -207,6 +404,48 @@ class TextAnalyzer:
             print(f"❌ Ошибка при сохранении отчета: {e}")
             return None
 
+    def save_machine_report(self, analysis):
+        """Потоковая выгрузка сводки и полной таблицы частот в JSON Lines, CSV или двоичный формат"""
+        if not analysis or self.last_stats is None:
+            return None
+
+        timestamp = self.get_timestamp().replace(':', '-').replace(' ', '_')
+        report_format = input(f"Формат ({', '.join(FORMATS)}): ").strip().lower()
+        if report_format not in FORMATS:
+            print("❌ Неизвестный формат!")
+            return None
+        output_file = f"text_analysis_report_{timestamp}.{report_format}"
+
+        try:
+            count = write_report(output_file, analysis, self.last_stats, report_format)
+            print(f"✅ Отчет сохранен в файл: {output_file} (слов в таблице: {count:,})")
+            return output_file
+        except Exception as e:
+            print(f"❌ Ошибка при сохранении отчета: {e}")
+            return None
+
+    def compare_saved_reports(self):
+        """Сравнение двух машиночитаемых отчетов"""
+        old_path = input("Путь к старому отчету: ").strip()
+        new_path = input("Путь к новому отчету: ").strip()
+        try:
+            difference = compare_reports(old_path, new_path)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"❌ Ошибка при чтении отчетов: {e}")
+            return
+
+        print("\n📊 СРАВНЕНИЕ ОТЧЕТОВ:")
+        if not difference['summary']:
+            print("• Основные статистики совпадают")
+        for key, (old, new) in difference['summary'].items():
+            print(f"• {key}: {old:,} → {new:,}")
+        print(f"• Новых слов: {difference['appeared']:,}, исчезнувших: {difference['disappeared']:,}")
+
+        if difference['words']:
+            print("\n🔀 НАИБОЛЬШИЕ ИЗМЕНЕНИЯ ЧАСТОТ:")
+            for word, old, new in difference['words']:
+                print(f"  '{word}': {old:,} → {new:,} ({new - old:+,})")
+
     def show_menu(self):
         print("\n" + "=" * 50)
         print("📖 АНАЛИЗАТОР ТЕКСТА")
@@ -217,6 +456,16 @@ class TextAnalyzer:
         print("4. 💾 Сохранить отчет")
         print("5. 📊 Показать статистику")
         print("6. 📝 Показать образец текста")
+        print("7. 📚 Пакетный анализ (папка или шаблон)")
+        mode = "приближенный" if self.approximate else "точный"
+        print(f"8. ⚙️  Режим подсчета (сейчас: {mode})")
+        indexing = "вкл" if self.index_dir else "выкл"
+        print(f"9. 🗂️  Индексация при анализе (сейчас: {indexing})")
+        print("10. 🔎 Поиск по индексу")
+        ngrams = "вкл" if self.ngrams else "выкл"
+        print(f"11. 🔗 N-граммы и коллокации (сейчас: {ngrams})")
+        print("12. 📦 Выгрузить таблицу частот (JSON Lines / CSV / двоичный)")
+        print("13. 🔀 Сравнить два выгруженных отчета")
         print("0. ❌ Выход")
         print("=" * 50)
 
@@ -231,30 +480,47 @@ class TextAnalyzer:
         print(f"• 🔡 Символов (без пробелов): {analysis['characters_without_spaces']:,}")
         print(f"• 📄 Предложений: {analysis['sentences']:,}")
         print(f"• 📑 Абзацев: {analysis['paragraphs']:,}")
-        print(f"• 🎯 Уникальных слов: {analysis['unique_words']:,}")
+        approx = analysis.get('approximate')
+        if approx:
+            print(f"• 🎯 Уникальных слов: ≈{analysis['unique_words']:,} "
+                  f"(±{approx['unique_words_error'] * 100:.1f}%)")
+        else:
+            print(f"• 🎯 Уникальных слов: {analysis['unique_words']:,}")
 
         print(f"\n📈 ПЛОТНОСТЬ:")
         print(f"• 📏 Средняя длина слова: {analysis['word_length_avg']:.1f} симв.")
         print(f"• 📐 Средняя длина предложения: {analysis['sentence_length_avg']:.1f} слов")
 
-        print("\n🔥 ТОП-10 СЛОВ:")
+        print("\n🔥 ТОП-10 СЛОВ:" + (" (приближенные оценки)" if approx else ""))
         for i, (word, count) in enumerate(analysis['top_words'], 1):
             percentage = (count / analysis['total_words']) * 100
-            print(f"  {i:2d}. '{word}': {count:,} раз ({percentage:.1f}%)")
+            if approx:
+                error = approx['top_words_errors'][i - 1]
+                print(f"  {i:2d}. '{word}': ≈{count:,} раз (±{error:,}) ({percentage:.1f}%)")
+            else:
+                print(f"  {i:2d}. '{word}': {count:,} раз ({percentage:.1f}%)")
+
+        if 'top_bigrams' in analysis:
+            print(self.format_ngrams(analysis), end="")
+
+        if 'cache' in analysis:
+            cache = analysis['cache']
+            print(f"\n💾 Кэш: попаданий {cache['hits']:,}, промахов {cache['misses']:,}")
 
     def show_text_sample(self):
         """Показать образец текста"""
-        if not self.text:
+        if self.source is None:
             print("❌ Текст не загружен!")
             return
 
-        sample_length = min(500, len(self.text))
-        sample = self.text[:sample_length]
+        # Читаем на один символ больше, чтобы понять, продолжается ли текст
+        sample = self.source.read_sample(501)
+        sample_length = min(500, len(sample))
 
         print(f"\n📝 ОБРАЗЕЦ ТЕКСТА (первые {sample_length} символов):")
         print("=" * 50)
-        print(sample)
-        if len(self.text) > sample_length:
+        print(sample[:sample_length])
+        if len(sample) > sample_length:
             print("... [текст продолжается]")
         print("=" * 50)
 
@@ -270,10 +536,10 @@ class TextAnalyzer:
                 break
             elif choice == '1':
                 if self.load_file():
-                    print(f"📖 Загружено символов: {len(self.text):,}")
+                    print(f"📖 Размер файла: {self.source.size:,} байт")
             elif choice == '2':
                 if self.load_file_manual():
-                    print(f"📖 Загружено символов: {len(self.text):,}")
+                    print(f"📖 Размер файла: {self.source.size:,} байт")
             elif choice == '3':
                 current_analysis = self.analyze_text()
                 if current_analysis:
@@ -291,6 +557,25 @@ class TextAnalyzer:
                     print("❌ Сначала выполните анализ текста!")
             elif choice == '6':
                 self.show_text_sample()
+            elif choice == '7':
+                current_analysis = self.analyze_batch()
+                if current_analysis:
+                    self.display_statistics(current_analysis)
+            elif choice == '8':
+                self.toggle_approximate()
+            elif choice == '9':
+                self.toggle_indexing()
+            elif choice == '10':
+                self.search_index()
+            elif choice == '11':
+                self.toggle_ngrams()
+            elif choice == '12':
+                if current_analysis:
+                    self.save_machine_report(current_analysis)
+                else:
+                    print("❌ Сначала выполните анализ текста!")
+            elif choice == '13':
+                self.compare_saved_reports()
             else:
                 print("❌ Неверный выбор!")
 
@@ -0,0 +1,173 @@
+import math
+import heapq
+from collections import Counter
+
+MAX_NGRAMS = 2_000_000
+ID_BITS = 32
+ID_MASK = (1 << ID_BITS) - 1
+MIN_COLLOCATION_COUNT = 5
+
+
+def pack(ids):
+    """Упаковка кортежа номеров слов в одно целое число"""
+    key = 0
+    for word_id in ids:
+        key = (key << ID_BITS) | word_id
+    return key
+
+
+def unpack(key, n):
+    """Обратное преобразование ключа в кортеж номеров слов"""
+    ids = []
+    for _ in range(n):
+        ids.append(key & ID_MASK)
+        key >>= ID_BITS
+    return tuple(reversed(ids))
+
+
+class NgramCounter:
+    """Компактный подсчет биграмм и триграмм.
+
+    Слова заменяются номерами (интернирование), n-грамма хранится как
+    одно целое число из упакованных номеров, поэтому словарь счетчиков
+    не содержит кортежей строк. Если число n-грамм превышает max_ngrams,
+    редкие удаляются, и их частоты становятся оценками снизу.
+    """
+
+    def __init__(self, orders=(2, 3), max_ngrams=MAX_NGRAMS):
+        self.orders = tuple(orders)
+        self.max_ngrams = max_ngrams
+        self.word_ids = {}
+        self.unigrams = Counter()
+        self.counts = {n: Counter() for n in self.orders}
+        self.pruned_below = {n: 0 for n in self.orders}
+        self.length = 0
+        self._context = max(self.orders) - 1
+        # Первые и последние номера слов - для склейки соседних частей
+        self.head = []
+        self.tail = []
+
+    def feed(self, words):
+        """Учет очередной последовательности слов"""
+        if not words:
+            return
+        word_ids = self.word_ids
+        ids = [word_ids.setdefault(word, len(word_ids)) for word in words]
+        self.unigrams.update(ids)
+        self._count_windows(self.tail + ids, len(self.tail))
+
+        if len(self.head) < self._context:
+            self.head = (self.head + ids)[:self._context]
+        self.tail = (self.tail + ids)[-self._context:] if self._context else []
+        self.length += len(ids)
+
+    def _count_windows(self, ids, skip):
+        """Подсчет n-грамм, заканчивающихся после позиции skip"""
+        for n in self.orders:
+            start = max(0, skip - n + 1)
+            windows = zip(*(ids[start + i:] for i in range(n)))
+            self.counts[n].update(pack(window) for window in windows)
+            if len(self.counts[n]) > self.max_ngrams:
+                self._prune(n)
+
+    def _prune(self, n):
+        """Удаление редких n-грамм, пока их не станет вдвое меньше лимита"""
+        counts = self.counts[n]
+        threshold = self.pruned_below[n]
+        while len(counts) > self.max_ngrams // 2:
+            threshold += 1
+            for key in [key for key, count in counts.items() if count < threshold]:
+                del counts[key]
+        self.pruned_below[n] = threshold
+
+    def merge(self, other, adjacent=True):
+        """Присоединение счетчика части текста, идущей сразу после этой.
+
+        При adjacent=False (законченные результаты разных файлов) частоты
+        только суммируются: n-граммы через границу файлов не добавляются.
+        """
+        remap = {}
+        word_ids = self.word_ids
+        for word, other_id in other.word_ids.items():
+            remap[other_id] = word_ids.setdefault(word, len(word_ids))
+
+        for other_id, count in other.unigrams.items():
+            self.unigrams[remap[other_id]] += count
+        for n in self.orders:
+            counts = self.counts[n]
+            for key, count in other.counts[n].items():
+                counts[pack(remap[word_id] for word_id in unpack(key, n))] += count
+            self.pruned_below[n] = max(self.pruned_below[n], other.pruned_below[n])
+
+        if not adjacent:
+            self.length += other.length
+            return self
+
+        # N-граммы на стыке частей
+        other_head = [remap[word_id] for word_id in other.head]
+        other_tail = [remap[word_id] for word_id in other.tail]
+        boundary = self.tail + other_head
+        for n in self.orders:
+            for start in range(max(0, len(self.tail) - n + 1), len(self.tail)):
+                window = boundary[start:start + n]
+                if len(window) == n:
+                    self.counts[n][pack(window)] += 1
+            if len(self.counts[n]) > self.max_ngrams:
+                self._prune(n)
+
+        if self.length < self._context:
+            self.head = (self.head + other_head)[:self._context]
+        if other.length < self._context:
+            self.tail = (self.tail + other_tail)[-self._context:]
+        else:
+            self.tail = other_tail
+        self.length += other.length
+        return self
+
+    def _words(self):
+        """Номер слова -> слово"""
+        words = [None] * len(self.word_ids)
+        for word, word_id in self.word_ids.items():
+            words[word_id] = word
+        return words
+
+    def top(self, n, limit=10, min_length=3):
+        """Топ n-грамм из слов не короче min_length: список (фраза, частота).
+
+        При равных частотах фразы идут по алфавиту - порядок не зависит
+        от того, как текст делился на части при пакетном анализе.
+        """
+        words = self._words()
+
+        def candidates():
+            for key, count in self.counts[n].items():
+                ids = unpack(key, n)
+                if all(len(words[word_id]) >= min_length for word_id in ids):
+                    yield ids, count
+
+        largest = heapq.nlargest(limit, (count for _, count in candidates()))
+        if not largest:
+            return []
+        # Строки собираются только для n-грамм не реже limit-й по частоте
+        selected = [(' '.join(words[word_id] for word_id in ids), count)
+                    for ids, count in candidates() if count >= largest[-1]]
+        selected.sort(key=lambda item: (-item[1], item[0]))
+        return selected[:limit]
+
+    def collocations(self, limit=10, min_count=MIN_COLLOCATION_COUNT, min_length=3):
+        """Биграммы с наибольшей поточечной взаимной информацией (PMI)"""
+        if 2 not in self.counts or not self.length:
+            return []
+        words = self._words()
+        total = self.length
+        unigrams = self.unigrams
+        scored = []
+        for key, count in self.counts[2].items():
+            if count < min_count:
+                continue
+            first, second = unpack(key, 2)
+            if len(words[first]) < min_length or len(words[second]) < min_length:
+                continue
+            pmi = math.log2(count * total / (unigrams[first] * unigrams[second]))
+            scored.append((f"{words[first]} {words[second]}", pmi, count))
+        return heapq.nsmallest(limit, scored, key=lambda item: (-item[1], item[0]))
@@ -0,0 +1,156 @@
+import csv
+import json
+import struct
+
+FORMATS = ('jsonl', 'csv', 'bin')
+BINARY_MAGIC = b'TXAR'
+BINARY_VERSION = 1
+# Заголовок: сигнатура, версия, длина JSON со сводкой, число слов
+BINARY_HEADER = struct.Struct('<4sHIQ')
+# Запись слова: длина в байтах UTF-8, частота
+BINARY_WORD = struct.Struct('<IQ')
+WRITE_BUFFER = 1024 * 1024
+
+
+def frequency_items(stats):
+    """Поток (слово, частота) из TextStats без построения промежуточных списков"""
+    if stats.word_counts is not None:
+        return len(stats.word_counts), stats.word_counts.items()
+    # В приближенном режиме полной таблицы нет - выгружаем оценки наброска
+    counters = stats.heavy_hitters.counters
+    return len(counters), ((word, entry[0]) for word, entry in counters.items())
+
+
+def _summary(analysis):
+    """Сводка анализа в виде, пригодном для JSON"""
+    return json.loads(json.dumps(analysis, ensure_ascii=False, default=list))
+
+
+def write_report(file_path, analysis, stats, report_format):
+    """Потоковая запись сводки и полной таблицы частот; возвращает число слов"""
+    count, items = frequency_items(stats)
+    summary = _summary(analysis)
+
+    if report_format == 'jsonl':
+        with open(file_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER) as f:
+            f.write(json.dumps({'type': 'summary', 'analysis': summary}, ensure_ascii=False) + '\n')
+            for word, frequency in items:
+                f.write(json.dumps({'type': 'word', 'word': word, 'count': frequency}, ensure_ascii=False) + '\n')
+
+    elif report_format == 'csv':
+        with open(file_path, 'w', newline='', encoding='utf-8', buffering=WRITE_BUFFER) as f:
+            writer = csv.writer(f)
+            writer.writerow(['kind', 'key', 'value'])
+            for key, value in summary.items():
+                writer.writerow(['summary', key, json.dumps(value, ensure_ascii=False)])
+            for word, frequency in items:
+                writer.writerow(['word', word, frequency])
+
+    elif report_format == 'bin':
+        header = json.dumps(summary, ensure_ascii=False).encode('utf-8')
+        with open(file_path, 'wb', buffering=WRITE_BUFFER) as f:
+            f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(header), count))
+            f.write(header)
+            for word, frequency in items:
+                encoded = word.encode('utf-8')
+                f.write(BINARY_WORD.pack(len(encoded), frequency))
+                f.write(encoded)
+
+    else:
+        raise ValueError(f"Неизвестный формат отчета: {report_format}")
+    return count
+
+
+def detect_format(file_path):
+    """Формат отчета по расширению файла"""
+    extension = file_path.rsplit('.', 1)[-1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Неизвестный формат отчета: {file_path}")
+    return extension
+
+
+def read_report(file_path):
+    """Чтение отчета: (сводка, поток пар (слово, частота))"""
+    report_format = detect_format(file_path)
+    if report_format == 'jsonl':
+        f = open(file_path, 'r', encoding='utf-8')
+        summary = json.loads(f.readline())['analysis']
+        return summary, _iter_jsonl(f)
+
+    if report_format == 'csv':
+        f = open(file_path, 'r', newline='', encoding='utf-8')
+        reader = csv.reader(f)
+        next(reader)
+        summary = {}
+        for kind, key, value in reader:
+            if kind != 'summary':
+                return summary, _iter_csv(f, reader, (key, int(value)))
+            summary[key] = json.loads(value)
+        f.close()
+        return summary, iter(())
+
+    f = open(file_path, 'rb')
+    magic, version, header_length, count = BINARY_HEADER.unpack(f.read(BINARY_HEADER.size))
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        f.close()
+        raise ValueError(f"Файл не является отчетом анализатора: {file_path}")
+    summary = json.loads(f.read(header_length).decode('utf-8'))
+    return summary, _iter_binary(f, count)
+
+
+def _iter_jsonl(f):
+    with f:
+        for line in f:
+            record = json.loads(line)
+            yield record['word'], record['count']
+
+
+def _iter_csv(f, reader, first):
+    with f:
+        yield first
+        for _, word, frequency in reader:
+            yield word, int(frequency)
+
+
+def _iter_binary(f, count):
+    with f:
+        for _ in range(count):
+            length, frequency = BINARY_WORD.unpack(f.read(BINARY_WORD.size))
+            yield f.read(length).decode('utf-8'), frequency
+
+
+def compare_reports(old_path, new_path, limit=10):
+    """Сравнение двух отчетов: изменения сводки и слова с наибольшим изменением частоты.
+
+    В память загружается только таблица первого отчета, второй читается потоком.
+    """
+    old_summary, old_items = read_report(old_path)
+    new_summary, new_items = read_report(new_path)
+    old_counts = dict(old_items)
+
+    changes = []
+    appeared = 0
+    for word, frequency in new_items:
+        previous = old_counts.pop(word, 0)
+        if not previous:
+            appeared += 1
+        if frequency != previous:
+            changes.append((word, previous, frequency))
+            if len(changes) > 4 * limit:
+                changes.sort(key=lambda change: abs(change[2] - change[1]), reverse=True)
+                del changes[limit:]
+    changes.extend((word, frequency, 0) for word, frequency in old_counts.items())
+    changes.sort(key=lambda change: abs(change[2] - change[1]), reverse=True)
+
+    summary_changes = {
+        key: (old_summary.get(key), new_summary.get(key))
+        for key in ('total_words', 'characters_with_spaces', 'characters_without_spaces',
+                    'sentences', 'paragraphs', 'unique_words')
+        if old_summary.get(key) != new_summary.get(key)
+    }
+    return {
+        'summary': summary_changes,
+        'words': changes[:limit],
+        'appeared': appeared,
+        'disappeared': len(old_counts),
+    }
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import zlib
+import pickle
+import sqlite3
+import contextlib
+import hashlib
+
+from text_stats import STATS_VERSION
+
+CACHE_DIR = 'text_analysis_cache'
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_content_hash(file_path, block_size=HASH_BLOCK_SIZE, start=0):
+    """SHA-256 содержимого файла (начиная с байта start), читаемого блоками"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Постоянный кэш результатов анализа, адресуемый по содержимому.
+
+    Ключ - хэш содержимого файла, версия анализатора и параметры
+    анализа. Сохраняется законченный TextStats целиком, включая полный
+    Counter слов. Если размер, время изменения и inode файла не
+    изменились с прошлого раза, хэш берется из таблицы files без
+    повторного чтения файла, а для файла, дописанного после известного
+    смещения, хэш продолжается цепочкой по одним новым байтам. При
+    превышении max_bytes вытесняются
+    записи, к которым дольше всего не обращались.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.hashes_skipped = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, 'cache.db')
+        self.init_db()
+
+    def init_db(self):
+        """Создание таблиц кэша"""
+        with contextlib.closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    payload BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access)')
+
+    def content_hash(self, file_path, appended_from=None):
+        """Хэш содержимого с быстрым путем по метаданным файла.
+
+        appended_from - смещение, до которого файл не менялся (по контрольной
+        точке): если прошлый хэш снят ровно на этом размере, новый хэш
+        получается из него и хэша дописанных байт без чтения всего файла.
+        """
+        path = os.path.realpath(file_path)
+        stat = os.stat(path)
+        with contextlib.closing(sqlite3.connect(self.db_path)) as conn, conn:
+            row = conn.execute(
+                'SELECT mtime_ns, size, inode, content_hash FROM files WHERE path = ?', (path,)
+            ).fetchone()
+            if row and row[:3] == (stat.st_mtime_ns, stat.st_size, stat.st_ino):
+                self.hashes_skipped += 1
+                return row[3]
+
+            if appended_from is not None and row and row[1:3] == (appended_from, stat.st_ino):
+                tail_hash = file_content_hash(path, start=appended_from)
+                content_hash = hashlib.sha256(f"{row[3]}:{tail_hash}".encode('ascii')).hexdigest()
+            else:
+                content_hash = file_content_hash(path)
+            conn.execute(
+                'INSERT OR REPLACE INTO files (path, mtime_ns, size, inode, content_hash) VALUES (?, ?, ?, ?, ?)',
+                (path, stat.st_mtime_ns, stat.st_size, stat.st_ino, content_hash)
+            )
+            return content_hash
+
+    def make_key(self, file_path, appended_from=None, **options):
+        """Ключ кэша: хэш содержимого + версия анализатора + параметры"""
+        material = json.dumps({
+            'content': self.content_hash(file_path, appended_from),
+            'version': STATS_VERSION,
+            'options': options,
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Законченный TextStats из кэша или None"""
+        with contextlib.closing(sqlite3.connect(self.db_path)) as conn, conn:
+            row = conn.execute('SELECT payload FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+        self.hits += 1
+        return pickle.loads(zlib.decompress(row[0]))
+
+    def put(self, key, stats):
+        """Сохранение результата и вытеснение старых записей"""
+        payload = zlib.compress(pickle.dumps(stats, protocol=pickle.HIGHEST_PROTOCOL))
+        with contextlib.closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries (key, payload, size, last_access) VALUES (?, ?, ?, ?)',
+                (key, payload, len(payload), time.time())
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        """Удаление давно не использованных записей сверх лимита размера"""
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        cursor = conn.execute('SELECT key, size FROM entries ORDER BY last_access')
+        evicted = []
+        for key, size in cursor:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        conn.executemany('DELETE FROM entries WHERE key = ?', evicted)
+
+    def counters(self):
+        """Счетчики обращений к кэшу за сессию"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hashes_skipped': self.hashes_skipped,
+        }
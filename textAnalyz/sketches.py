@@ -0,0 +1,135 @@
+import math
+import heapq
+import hashlib
+from operator import itemgetter
+
+
+def stable_hash64(word):
+    """64-битный хэш слова, одинаковый во всех процессах и запусках"""
+    return int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class SpaceSaving:
+    """Алгоритм Space-Saving для поиска самых частых элементов.
+
+    Хранит не более capacity счетчиков. Новый элемент при заполнении
+    вытесняет элемент с минимальным счетчиком и наследует его значение
+    как погрешность. Оценка частоты завышена не более чем на error,
+    а error не превосходит total / capacity.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.total = 0
+        self.counters = {}
+        # Ленивая куча (count, item): устаревшие записи пропускаются при извлечении
+        self._heap = []
+
+    def update(self, item, count=1):
+        """Учет count вхождений элемента"""
+        self.total += count
+        counters = self.counters
+        entry = counters.get(item)
+        if entry is None:
+            if len(counters) < self.capacity:
+                entry = counters[item] = [0, 0]
+            else:
+                minimum, evicted = self._pop_min()
+                del counters[evicted]
+                entry = counters[item] = [minimum, minimum]
+        entry[0] += count
+        heapq.heappush(self._heap, (entry[0], item))
+        if len(self._heap) > 4 * self.capacity + 64:
+            self._rebuild_heap()
+
+    def update_counts(self, counts):
+        """Учет пар (элемент, количество)"""
+        for item, count in counts:
+            self.update(item, count)
+
+    def _pop_min(self):
+        """Элемент с минимальным счетчиком (пропуская устаревшие записи кучи)"""
+        heap = self._heap
+        while True:
+            count, item = heapq.heappop(heap)
+            entry = self.counters.get(item)
+            if entry is not None and entry[0] == count:
+                return count, item
+
+    def _rebuild_heap(self):
+        self._heap = [(entry[0], item) for item, entry in self.counters.items()]
+        heapq.heapify(self._heap)
+
+    @property
+    def max_error(self):
+        """Наибольшая возможная переоценка частоты (не больше total / capacity)"""
+        return self._min_count()
+
+    def top(self, n):
+        """Топ-N как список (элемент, оценка, погрешность)"""
+        items = ((item, entry[0], entry[1]) for item, entry in self.counters.items())
+        return heapq.nlargest(n, items, key=itemgetter(1))
+
+    def merge(self, other):
+        """Объединение с другим наброском той же емкости"""
+        own_min = self._min_count()
+        other_min = other._min_count()
+        merged = {}
+        for item in set(self.counters) | set(other.counters):
+            own = self.counters.get(item, [own_min, own_min])
+            theirs = other.counters.get(item, [other_min, other_min])
+            merged[item] = [own[0] + theirs[0], own[1] + theirs[1]]
+        largest = heapq.nlargest(self.capacity, merged.items(), key=lambda pair: pair[1][0])
+        self.counters = dict(largest)
+        self.total += other.total
+        self._rebuild_heap()
+        return self
+
+    def _min_count(self):
+        """Минимальный счетчик заполненного наброска (0, если есть место)"""
+        if len(self.counters) < self.capacity or not self.counters:
+            return 0
+        return min(entry[0] for entry in self.counters.values())
+
+
+class HyperLogLog:
+    """Оценка числа различных элементов (HyperLogLog) в 2^precision байтах"""
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add_hash(self, value):
+        """Учет элемента по его 64-битному хэшу"""
+        precision = self.precision
+        index = value >> (64 - precision)
+        rest = value & ((1 << (64 - precision)) - 1)
+        rank = (64 - precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, items):
+        """Учет элементов (повторы не влияют на результат)"""
+        for item in items:
+            self.add_hash(stable_hash64(item))
+
+    @property
+    def relative_error(self):
+        """Стандартная относительная погрешность оценки"""
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def estimate(self):
+        """Оценка числа различных элементов"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Поправка для малых мощностей (линейный подсчет)
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        """Объединение с другим наброском той же точности"""
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
@@ -0,0 +1,65 @@
+import random
+
+from batch import BatchAnalyzer
+from main import TextAnalyzer
+from text_source import TextSource
+from text_stats import TextStats
+
+
+def make_analyzer(tmp_path, file_path):
+    analyzer = TextAnalyzer(cache_dir=str(tmp_path / 'cache'))
+    analyzer.source = TextSource(str(file_path), 'utf-8')
+    return analyzer
+
+
+def test_unchanged_file_is_served_from_cache(tmp_path):
+    file_path = tmp_path / 'log.txt'
+    file_path.write_text("Привет мир. Раз два.\n" * 100, encoding='utf-8')
+    analyzer = make_analyzer(tmp_path, file_path)
+
+    first = analyzer.analyze_text()
+    second = analyzer.analyze_text()
+
+    assert first['cache']['hits'] == 0
+    assert second['cache']['hits'] == 1
+    assert second['total_words'] == first['total_words'] == 400
+
+
+def test_appended_file_is_hashed_by_tail_and_cached(tmp_path, monkeypatch):
+    import result_cache
+
+    file_path = tmp_path / 'log.txt'
+    file_path.write_text("Привет мир. Раз два.\n" * 100, encoding='utf-8')
+    make_analyzer(tmp_path, file_path).analyze_text()
+
+    with open(file_path, 'a', encoding='utf-8') as f:
+        f.write("Еще строка.\n")
+    starts = []
+    original = result_cache.file_content_hash
+    monkeypatch.setattr(result_cache, 'file_content_hash',
+                        lambda path, *args, start=0, **kwargs: starts.append(start) or original(path, *args, start=start, **kwargs))
+
+    grown = make_analyzer(tmp_path, file_path).analyze_text()
+    again = make_analyzer(tmp_path, file_path).analyze_text()
+
+    assert starts and all(start > 0 for start in starts)
+    assert grown['total_words'] == again['total_words'] == 402
+    assert again['cache']['hits'] == 1
+
+
+def test_batch_ngrams_match_sequential_analysis(tmp_path):
+    # Много n-грамм с равными частотами: порядок топа решают только правила разрыва ничьих
+    rng = random.Random(7)
+    words = [f"слово{i}" for i in range(12)]
+    text = ' '.join(rng.choice(words) + ('.' if rng.random() < 0.1 else '') for _ in range(3000))
+    file_path = tmp_path / 'text.txt'
+    file_path.write_text(text, encoding='utf-8')
+
+    sequential = TextStats(ngrams=True)
+    sequential.feed(text)
+    expected = sequential.finish().analysis(10)
+    analysis, _, _ = BatchAnalyzer(workers=2, range_size=997, block_size=256,
+                                   stats_options={'ngrams': True}).run(str(file_path))
+
+    for key in ('top_bigrams', 'top_trigrams', 'collocations'):
+        assert analysis[key] == expected[key]
@@ -0,0 +1,165 @@
+import os
+import io
+import mmap
+import codecs
+
+ENCODINGS = ['utf-8', 'cp1251', 'koi8-r', 'iso-8859-1', 'windows-1251']
+SAMPLE_SIZE = 64 * 1024
+READ_SIZE = 1024 * 1024
+
+
+def _decoder(encoding):
+    """Инкрементальный декодер с универсальными переводами строк, как у open()"""
+    return io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), translate=True)
+
+
+def _read_sample(file_path, sample_size):
+    """Чтение начала файла; второй элемент - поместился ли файл целиком"""
+    with open(file_path, 'rb') as file:
+        sample = file.read(sample_size)
+        return sample, not file.read(1)
+
+
+def validate_encoding(file_path, encoding, block_size=READ_SIZE):
+    """Потоковая проверка всего файла: декодируется и содержит непробельный текст"""
+    decoder = _decoder(encoding)
+    has_text = False
+    try:
+        with open(file_path, 'rb') as file:
+            while True:
+                block = file.read(block_size)
+                text = decoder.decode(block, final=not block)
+                if not has_text and text.strip():
+                    has_text = True
+                if not block:
+                    break
+    except (UnicodeDecodeError, UnicodeError, LookupError):
+        return False
+    return has_text
+
+
+def detect_encoding(file_path, encodings=ENCODINGS, sample_size=SAMPLE_SIZE):
+    """Определение кодировки по началу файла с полной проверкой при неоднозначности"""
+    sample, complete = _read_sample(file_path, sample_size)
+
+    for encoding in encodings:
+        try:
+            text = _decoder(encoding).decode(sample, final=complete)
+        except (UnicodeDecodeError, UnicodeError, LookupError):
+            continue
+        if text.strip():
+            return encoding
+        # Начало файла пустое - решаем по всему файлу
+        if not complete and validate_encoding(file_path, encoding):
+            return encoding
+
+    return None
+
+
+class TextSource:
+    """Ленивый доступ к текстовому файлу в виде потока фрагментов.
+
+    Кодировка выбирается по началу файла. Если дальше в файле встретится
+    байт, недопустимый для выбранной кодировки, fallback() переходит к
+    следующей кодировке из списка, проверив ее на всем файле.
+    """
+
+    def __init__(self, file_path, encoding, encodings=None, block_size=READ_SIZE, use_mmap=False):
+        self.file_path = file_path
+        self.encoding = encoding
+        self.encodings = list(encodings) if encodings is not None else [encoding]
+        self.block_size = block_size
+        self.use_mmap = use_mmap
+
+    @classmethod
+    def open(cls, file_path, encodings=ENCODINGS, **kwargs):
+        """Создание источника с автоопределением кодировки; None, если не удалось"""
+        encoding = detect_encoding(file_path, encodings)
+        if encoding is None:
+            return None
+        return cls(file_path, encoding, encodings, **kwargs)
+
+    @property
+    def size(self):
+        return os.path.getsize(self.file_path)
+
+    def fallback(self):
+        """Переход к следующей кодировке, проходящей проверку на всем файле"""
+        if self.encoding in self.encodings:
+            remaining = self.encodings[self.encodings.index(self.encoding) + 1:]
+        else:
+            remaining = []
+        for encoding in remaining:
+            if validate_encoding(self.file_path, encoding, self.block_size):
+                self.encoding = encoding
+                return encoding
+        return None
+
+    def iter_blocks(self, start=0, end=None):
+        """Поток байтовых блоков файла в диапазоне [start, end)"""
+        size = self.size
+        end = size if end is None else min(end, size)
+        if start >= end:
+            return
+
+        with open(self.file_path, 'rb') as file:
+            if self.use_mmap:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    for position in range(start, end, self.block_size):
+                        yield mapped[position:min(position + self.block_size, end)]
+                return
+
+            file.seek(start)
+            position = start
+            while position < end:
+                block = file.read(min(self.block_size, end - position))
+                if not block:
+                    break
+                position += len(block)
+                yield block
+
+    def make_decoder(self, state=None):
+        """Инкрементальный декодер выбранной кодировки, при необходимости с сохраненным состоянием"""
+        decoder = _decoder(self.encoding)
+        if state is not None:
+            decoder.setstate(state)
+        return decoder
+
+    def iter_chunks(self, start=0, end=None, decoder=None):
+        """Поток декодированных фрагментов текста в диапазоне байтов [start, end).
+
+        Если передан собственный decoder, завершающий сброс не выполняется:
+        недочитанный хвост (часть многобайтового символа, '\r') остается в
+        декодере, и его состояние можно сохранить для продолжения.
+        """
+        finish = decoder is None
+        if finish:
+            decoder = self.make_decoder()
+        for block in self.iter_blocks(start, end):
+            text = decoder.decode(block)
+            if text:
+                yield text
+        if finish:
+            text = decoder.decode(b'', final=True)
+            if text:
+                yield text
+
+    def read_sample(self, length):
+        """Первые length символов текста"""
+        parts = []
+        collected = 0
+        for chunk in self.iter_chunks():
+            parts.append(chunk[:length - collected])
+            collected += len(parts[-1])
+            if collected >= length:
+                break
+        return ''.join(parts)
+
+    def check_sample(self, sample_size=SAMPLE_SIZE):
+        """Проверка, что начало файла декодируется выбранной кодировкой"""
+        sample, complete = _read_sample(self.file_path, sample_size)
+        try:
+            _decoder(self.encoding).decode(sample, final=complete)
+        except (UnicodeDecodeError, UnicodeError):
+            return False
+        return True
@@ -0,0 +1,262 @@
+import re
+import heapq
+from collections import Counter
+from operator import itemgetter
+
+from ngrams import NgramCounter
+from sketches import HyperLogLog, SpaceSaving
+
+# Версия алгоритма подсчета: меняется при любом изменении результатов
+STATS_VERSION = 3
+
+# Бюджет памяти приближенного режима и примерная цена одного счетчика
+APPROX_MEMORY_BUDGET = 64 * 1024 * 1024
+APPROX_BYTES_PER_COUNTER = 256
+HLL_PRECISION = 14
+
+WORD_PATTERN = re.compile(r'\b\w+\b')
+SENTENCE_SPLIT_PATTERN = re.compile(r'[.!?]+')
+
+
+class TextStats:
+    """Однопроходный подсчет статистики текста по потоку фрагментов.
+
+    Фрагменты подаются через feed() в порядке следования в тексте.
+    Хвост фрагмента, начиная с последней серии пробельных символов,
+    переносится в следующий фрагмент, поэтому слова, разделители
+    предложений и абзацев никогда не разрываются границей фрагмента.
+    Память ограничена размером фрагмента и словарем слов.
+
+    В приближенном режиме (approximate=True) полный Counter не строится:
+    топ-N оценивается наброском Space-Saving, число уникальных слов -
+    HyperLogLog, и память ограничена memory_budget вместо словаря.
+    С ngrams=True дополнительно считаются биграммы и триграммы.
+    """
+
+    def __init__(self, approximate=False, memory_budget=APPROX_MEMORY_BUDGET, ngrams=False):
+        self.total_words = 0
+        self.characters_with_spaces = 0
+        self.characters_without_spaces = 0
+        self.sentences = 0
+        self.paragraphs = 0
+        self.approximate = approximate
+        self.memory_budget = memory_budget
+        if approximate:
+            self.word_counts = None
+            self.heavy_hitters = SpaceSaving(
+                max(100, (memory_budget - (1 << HLL_PRECISION)) // APPROX_BYTES_PER_COUNTER))
+            self.distinct_words = HyperLogLog(HLL_PRECISION)
+        else:
+            self.word_counts = Counter()
+        self.ngrams = NgramCounter() if ngrams else None
+        # Граничное состояние предложений и абзацев: начальный кусок до
+        # первого разделителя (head), был ли разделитель и открытый кусок
+        # в конце (tail). Для предложения храним число непробельных
+        # символов (не более 2), для абзаца - есть ли в нем текст.
+        # Это позволяет склеивать результаты соседних частей файла.
+        self._sentence_head = 0
+        self._sentence_split = False
+        self._sentence_open = 0
+        self._paragraph_head = False
+        self._paragraph_split = False
+        self._paragraph_open = False
+        self._carry = ""
+        self._finished = False
+
+    def feed(self, chunk):
+        """Обработка очередного фрагмента текста"""
+        if not chunk:
+            return
+        self.characters_with_spaces += len(chunk)
+        self.characters_without_spaces += (
+            len(chunk) - chunk.count(' ') - chunk.count('\n') - chunk.count('\t')
+        )
+
+        segment = self._carry + chunk
+        cut = self._find_cut(segment, len(self._carry))
+        self._process(segment[:cut])
+        self._carry = segment[cut:]
+
+    def flush(self):
+        """Обработка перенесенного хвоста без закрытия предложения и абзаца"""
+        self._process(self._carry)
+        self._carry = ""
+        return self
+
+    def finish(self):
+        """Обработка остатка и закрытие последнего предложения и абзаца"""
+        if self._finished:
+            return self
+        self.flush()
+        self.sentences += (self._sentence_head > 1) + (self._sentence_open > 1)
+        self.paragraphs += self._paragraph_head + self._paragraph_open
+        self._sentence_head = self._sentence_open = 0
+        self._paragraph_head = self._paragraph_open = False
+        self._sentence_split = self._paragraph_split = True
+        self._finished = True
+        return self
+
+    def merge(self, other):
+        """Присоединение результата части текста, идущей сразу после этой.
+
+        Обе части должны быть сброшены через flush() или finish() и
+        разрезаны по началу серии пробельных символов. Для законченных
+        (finish) результатов разных файлов это обычное суммирование.
+        """
+        self.total_words += other.total_words
+        self.characters_with_spaces += other.characters_with_spaces
+        self.characters_without_spaces += other.characters_without_spaces
+        if self.approximate:
+            self.heavy_hitters.merge(other.heavy_hitters)
+            self.distinct_words.merge(other.distinct_words)
+        else:
+            self.word_counts.update(other.word_counts)
+        if self.ngrams is not None:
+            # Законченная часть - это целый файл, склеивать n-граммы с ней не нужно
+            self.ngrams.merge(other.ngrams, adjacent=not (self._finished or other._finished))
+
+        self.sentences += other.sentences
+        self._sentence_head, self._sentence_split, self._sentence_open, joined = _join_pieces(
+            (self._sentence_head, self._sentence_split, self._sentence_open),
+            (other._sentence_head, other._sentence_split, other._sentence_open),
+            lambda left, right: min(2, left + right),
+        )
+        self.sentences += joined > 1
+
+        self.paragraphs += other.paragraphs
+        self._paragraph_head, self._paragraph_split, self._paragraph_open, joined = _join_pieces(
+            (self._paragraph_head, self._paragraph_split, self._paragraph_open),
+            (other._paragraph_head, other._paragraph_split, other._paragraph_open),
+            lambda left, right: left or right,
+        )
+        self.paragraphs += joined
+
+        self._finished = self._finished and other._finished
+        return self
+
+    @property
+    def options(self):
+        """Параметры подсчета, влияющие на результат"""
+        options = {'approximate': self.approximate, 'ngrams': self.ngrams is not None}
+        if self.approximate:
+            options['memory_budget'] = self.memory_budget
+        return options
+
+    @property
+    def unique_words(self):
+        if self.approximate:
+            return self.distinct_words.estimate()
+        return len(self.word_counts)
+
+    def top_words(self, n=10):
+        """Топ-N слов длиннее 2 символов (порядок как у Counter.most_common)"""
+        if self.approximate:
+            return [(word, count) for word, count, _ in self.heavy_hitters.top(n)]
+        candidates = ((word, count) for word, count in self.word_counts.items() if len(word) > 2)
+        return heapq.nlargest(n, candidates, key=itemgetter(1))
+
+    def analysis(self, top_n=10):
+        """Словарь результатов в формате TextAnalyzer.analyze_text"""
+        total_words = self.total_words
+        chars_without_spaces = self.characters_without_spaces
+        sentences = self.sentences
+        analysis = {
+            'total_words': total_words,
+            'characters_with_spaces': self.characters_with_spaces,
+            'characters_without_spaces': chars_without_spaces,
+            'sentences': sentences,
+            'paragraphs': self.paragraphs,
+            'unique_words': self.unique_words,
+            'top_words': self.top_words(top_n),
+            'word_length_avg': chars_without_spaces / total_words if total_words > 0 else 0,
+            'sentence_length_avg': total_words / sentences if sentences > 0 else 0
+        }
+        if self.approximate:
+            # Какие значения - оценки и с какой погрешностью
+            analysis['approximate'] = {
+                'unique_words_error': self.distinct_words.relative_error,
+                'top_words_errors': [error for _, _, error in self.heavy_hitters.top(top_n)],
+                'top_words_max_error': self.heavy_hitters.max_error,
+                'counters': self.heavy_hitters.capacity,
+            }
+        if self.ngrams is not None:
+            analysis['top_bigrams'] = self.ngrams.top(2, top_n)
+            analysis['top_trigrams'] = self.ngrams.top(3, top_n)
+            analysis['collocations'] = self.ngrams.collocations(top_n)
+            # Ненулевой порог - частоты n-грамм после отсечения редких занижены
+            analysis['ngrams_pruned_below'] = max(self.ngrams.pruned_below.values())
+        return analysis
+
+    @staticmethod
+    def _find_cut(segment, carry_length):
+        """Позиция начала последней серии пробельных символов"""
+        i = len(segment)
+        while i and not segment[i - 1].isspace():
+            i -= 1
+            if i < carry_length:
+                # В новом фрагменте нет пробелов - переносим все целиком
+                return 0
+        while i and segment[i - 1].isspace():
+            i -= 1
+        return i
+
+    def _process(self, segment):
+        """Подсчет слов, предложений и абзацев в безопасном отрезке текста"""
+        if not segment:
+            return
+
+        self.total_words += len(WORD_PATTERN.findall(segment))
+        words = WORD_PATTERN.findall(segment.lower())
+        if self.approximate:
+            # Локальный Counter ограничен размером отрезка
+            segment_counts = Counter(words)
+            self.distinct_words.update(segment_counts)
+            self.heavy_hitters.update_counts(
+                (word, count) for word, count in segment_counts.items() if len(word) > 2)
+        else:
+            self.word_counts.update(words)
+        if self.ngrams is not None:
+            self.ngrams.feed(words)
+
+        # Предложение засчитывается, если в нем не меньше 2 непробельных символов
+        pieces = SENTENCE_SPLIT_PATTERN.split(segment)
+        sentence_open = min(2, self._sentence_open + len(pieces[0].strip()))
+        if len(pieces) > 1:
+            if self._sentence_split:
+                self.sentences += sentence_open > 1
+            else:
+                self._sentence_head = sentence_open
+                self._sentence_split = True
+            for piece in pieces[1:-1]:
+                self.sentences += len(piece.strip()) > 1
+            sentence_open = min(2, len(pieces[-1].strip()))
+        self._sentence_open = sentence_open
+
+        pieces = segment.split('\n\n')
+        paragraph_open = self._paragraph_open or bool(pieces[0].strip())
+        if len(pieces) > 1:
+            if self._paragraph_split:
+                self.paragraphs += paragraph_open
+            else:
+                self._paragraph_head = paragraph_open
+                self._paragraph_split = True
+            for piece in pieces[1:-1]:
+                self.paragraphs += bool(piece.strip())
+            paragraph_open = bool(pieces[-1].strip())
+        self._paragraph_open = paragraph_open
+
+
+def _join_pieces(left, right, combine):
+    """Склейка граничных состояний (head, split, tail) двух соседних частей.
+
+    Пока разделитель не встречен, весь кусок хранится в tail. Возвращает
+    новое состояние и значение куска, закрытого на стыке (0/False, если
+    закрытия не произошло).
+    """
+    left_head, left_split, left_tail = left
+    right_head, right_split, right_tail = right
+    if not right_split:
+        return left_head, left_split, combine(left_tail, right_tail), 0
+    if not left_split:
+        return combine(left_tail, right_head), True, right_tail, 0
+    return left_head, True, right_tail, combine(left_tail, right_head)
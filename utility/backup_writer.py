@@ -0,0 +1,320 @@
+import os
+import json
+import queue
+import hashlib
+import threading
+
+from manifest import MANIFEST_NAME
+from journal import partial_path
+from parallel_zip import ParallelCompressor, ZipEntry, ZipWriter
+
+VOLUME_MANIFEST_NAME = '.backup_volume.json'
+PARTS_DIR = '.backup_parts'
+# Буфер между архивацией и медленным приемником (канал, сокет)
+STREAM_BUFFER = 16 * 1024 * 1024
+STREAM_BLOCK = 256 * 1024
+# Запас на заголовки, дескриптор, запись центрального каталога и строку описи тома
+ENTRY_OVERHEAD = 512
+# Сжатые данные могут быть чуть больше исходных (несжимаемые блоки)
+EXPANSION = 1.01
+# Меньше этого остаток тома не заполняется частью файла - начинается новый том
+MIN_SEGMENT = 1024 * 1024
+MIN_VOLUME_SIZE = 4 * MIN_SEGMENT
+
+
+def volume_name(backup_name, number):
+    """Имя промежуточного тома: backup_x_ts.part001.zip"""
+    stem, extension = os.path.splitext(backup_name)
+    return f"{stem}.part{number:03d}{extension}"
+
+
+class StreamOutput:
+    """Вывод архива в несекуемый поток (stdout, канал, сокет).
+
+    Запись идет из отдельного потока через очередь ограниченного размера:
+    сжатие не ждет каждой записи в медленный приемник, а память под
+    буфер не превышает buffer_size.
+    """
+
+    def __init__(self, fileobj, buffer_size=STREAM_BUFFER, block_size=STREAM_BLOCK):
+        self.fileobj = fileobj
+        self.block_size = block_size
+        self.buffer = bytearray()
+        self.error = None
+        self.queue = queue.Queue(maxsize=max(1, buffer_size // block_size))
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            block = self.queue.get()
+            if block is None:
+                break
+            if self.error is not None:
+                # После ошибки очередь только опустошается, чтобы не блокировать запись
+                continue
+            try:
+                self.fileobj.write(block)
+            except OSError as e:
+                self.error = e
+        if self.error is None:
+            try:
+                self.fileobj.flush()
+            except OSError as e:
+                self.error = e
+
+    def _put(self, block):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(block)
+
+    def seekable(self):
+        return False
+
+    def tell(self):
+        raise OSError("поток не поддерживает позиционирование")
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.block_size:
+            self._put(bytes(self.buffer))
+            self.buffer.clear()
+        return len(data)
+
+    def flush(self):
+        if self.buffer:
+            self._put(bytes(self.buffer))
+            self.buffer.clear()
+
+    def close(self):
+        """Дописать буфер и дождаться окончания записи"""
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class BackupWriter:
+    """Запись резервной копии: один архив, поток или набор томов.
+
+    В режиме томов (volume_size) каждый том - самостоятельный ZIP не больше
+    volume_size со своей описью тома (SHA-256 всех записей), поэтому любой
+    том проверяется отдельно. Файлы, не помещающиеся в остаток тома,
+    делятся на части. Тома пишутся как backup_x_ts.partNNN.zip, последний
+    получает имя самой копии и содержит общую опись: в ней у каждого файла
+    указан том ('archive') или список частей ('parts').
+    """
+
+    def __init__(self, backup_path, workers=None, volume_size=None, output=None, throttle=None, resume=None):
+        if volume_size is not None and output is not None:
+            raise ValueError("Разбиение на тома несовместимо с выводом в поток")
+        if volume_size is not None and volume_size < MIN_VOLUME_SIZE:
+            raise ValueError(f"Размер тома должен быть не меньше {MIN_VOLUME_SIZE // 1024 ** 2} МБ")
+        self.backup_path = backup_path
+        self.backup_name = os.path.basename(backup_path)
+        self.volume_size = volume_size
+        self.volumes = []
+        # Записи текущего тома: имя в архиве -> (размер, SHA-256); записи описи со ссылкой на том
+        self.volume_entries = {}
+        self.volume_records = []
+        self.reserved = 0
+        # Объем уже закрытых томов
+        self.closed_size = 0
+        # Путь -> запись архива (смещение заголовка и сжатый размер) для файлов, сохраненных целиком
+        self.entries = {}
+        self.stream = StreamOutput(output) if output is not None else None
+        self.fileobj = None
+        if resume is not None:
+            writer = self._reopen(*resume)
+            # Файлы, сохраненные до сбоя, тоже попадают в locations для индекса
+            self.entries = {entry.arcname: entry for entry in writer.entries}
+        else:
+            writer = ZipWriter(self._open_volume())
+        # Сколько записей архива уже внесено в журнал
+        self.journaled = len(writer.entries)
+        self.compressor = ParallelCompressor(writer, workers, throttle=throttle)
+
+    @property
+    def stats(self):
+        return self.compressor.stats
+
+    @property
+    def timings(self):
+        return self.compressor.timings
+
+    @property
+    def bytes_written(self):
+        return self.closed_size + self.compressor.writer.position
+
+    @property
+    def current_name(self):
+        return volume_name(self.backup_name, len(self.volumes) + 1) if self.volume_size else self.backup_name
+
+    @property
+    def resumable(self):
+        """Продолжение после сбоя поддерживается для копии одним архивом в файл"""
+        return not self.volume_size and self.stream is None
+
+    def _open_volume(self):
+        if self.stream is not None:
+            return self.stream
+        if self.volume_size:
+            path = os.path.join(os.path.dirname(self.backup_path), self.current_name)
+        else:
+            path = partial_path(self.backup_path)
+        self.fileobj = open(path, 'wb')
+        return self.fileobj
+
+    def _reopen(self, offset, entries):
+        """Недописанный архив: отрезается все после последней контрольной точки"""
+        if not self.resumable:
+            raise ValueError("Продолжение поддерживается только для копии одним архивом")
+        self.fileobj = open(partial_path(self.backup_path), 'r+b')
+        self.fileobj.truncate(offset)
+        self.fileobj.seek(offset)
+        return ZipWriter(self.fileobj, [ZipEntry.from_dict(data) for data in entries])
+
+    def checkpoint(self):
+        """Сбросить архив на диск: (смещение, новые записи архива) для журнала"""
+        self.compressor.flush()
+        self.fileobj.flush()
+        os.fsync(self.fileobj.fileno())
+        entries = self.compressor.writer.entries[self.journaled:]
+        self.journaled += len(entries)
+        return self.compressor.writer.position, [entry.to_dict() for entry in entries]
+
+    def _add_entry(self, file_path, arcname, *args, **kwargs):
+        entry, digest = self.compressor.add_file(file_path, arcname, *args, **kwargs)
+        if self.volume_size:
+            self.volume_entries[arcname] = {'size': entry.size, 'sha256': digest}
+            self.reserved += ENTRY_OVERHEAD + 3 * len(arcname.encode('utf-8'))
+        return entry, digest
+
+    def _free_space(self, exact=False):
+        """Сколько несжатых данных гарантированно поместится в текущий том"""
+        if exact:
+            self.compressor.flush()
+        used = self.compressor.writer.position + self.compressor.pending_bytes * EXPANSION + self.reserved
+        return int((self.volume_size - used - ENTRY_OVERHEAD * 4) / EXPANSION)
+
+    def _fits(self, size):
+        # Сначала дешевая оценка с учетом блоков в очереди, затем точная после их записи
+        return size <= self._free_space() or size <= self._free_space(exact=True)
+
+    def _write_volume_manifest(self, last):
+        data = {'backup': self.backup_name, 'volume': len(self.volumes) + 1, 'last': last,
+                'entries': self.volume_entries}
+        self.compressor.add_bytes(VOLUME_MANIFEST_NAME, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+    def _assign_volume(self, name):
+        """Проставить имя тома записям описи, сохраненным в нем"""
+        for record, index in self.volume_records:
+            if index is None:
+                record['archive'] = name
+            else:
+                record['parts'][index][0] = name
+                if index == 0:
+                    # Разделенный файл числится в томе своей первой части
+                    record['archive'] = name
+        self.volume_records = []
+
+    def _next_volume(self):
+        """Закрыть текущий том и начать следующий"""
+        name = self.current_name
+        self._assign_volume(name)
+        self._write_volume_manifest(last=False)
+        previous = self.fileobj
+        previous_writer = self.compressor.writer
+        self.volumes.append(name)
+        self.volume_entries = {}
+        self.reserved = 0
+        self.compressor.switch_writer(ZipWriter(self._open_volume()))
+        self.closed_size += previous_writer.position
+        previous.close()
+
+    def add_file(self, arcname, file_path, size, mtime, codec='deflate', level=None):
+        """Добавление файла; возвращает запись для общей описи (без mtime)"""
+        if not self.volume_size:
+            entry, digest = self._add_entry(file_path, arcname, size, mtime, codec, level)
+            self.entries[arcname] = entry
+            return {'size': entry.size, 'sha256': digest, 'archive': self.backup_name}
+
+        if not self._fits(size) and self.volume_entries:
+            # Файл, помещающийся в пустой том, не делим; остаток меньше MIN_SEGMENT не заполняем
+            empty_volume = int((self.volume_size - ENTRY_OVERHEAD * 4) / EXPANSION)
+            if size <= empty_volume or self._free_space() < MIN_SEGMENT:
+                self._next_volume()
+        if self._fits(size):
+            entry, digest = self._add_entry(file_path, arcname, size, mtime, codec, level)
+            self.entries[arcname] = entry
+            record = {'size': entry.size, 'sha256': digest, 'archive': None}
+            self.volume_records.append((record, None))
+            return record
+
+        # Файл делится на части: остаток текущего тома, затем следующие тома
+        whole = hashlib.sha256()
+        record = {'size': 0, 'sha256': None, 'archive': None, 'parts': []}
+        offset = 0
+        while True:
+            free = self._free_space(exact=True)
+            if free < MIN_SEGMENT and self.volume_entries:
+                self._next_volume()
+                continue
+            part_name = f"{PARTS_DIR}/{arcname}/{len(record['parts']) + 1:03d}"
+            length = min(size - offset, free)
+            entry, _ = self._add_entry(file_path, part_name, length, mtime, codec, level,
+                                       offset=offset, length=length, digest=whole)
+            record['parts'].append([None, part_name])
+            self.volume_records.append((record, len(record['parts']) - 1))
+            offset += entry.size
+            # Файл уменьшился во время копирования - частей больше не будет
+            if entry.size < length or offset >= size:
+                break
+        record['size'] = offset
+        record['sha256'] = whole.hexdigest()
+        return record
+
+    def finish(self, manifest):
+        """Запись общей описи и завершение; возвращает пути всех томов"""
+        if not self.volume_size:
+            self.compressor.add_bytes(MANIFEST_NAME, manifest.to_bytes())
+            self.compressor.close()
+            if self.stream is not None:
+                self.stream.close()
+                return []
+            self.fileobj.flush()
+            os.fsync(self.fileobj.fileno())
+            self.fileobj.close()
+            # Под своим именем архив появляется только целиком
+            os.replace(partial_path(self.backup_path), self.backup_path)
+            return [self.backup_path]
+
+        # Все тома, кроме последнего, уже названы; последний получает имя самой копии
+        if self.volume_entries and not self._fits(len(manifest.to_bytes()) + ENTRY_OVERHEAD):
+            self._next_volume()
+        self._assign_volume(self.backup_name)
+        manifest.volumes = self.volumes + [self.backup_name]
+        data = manifest.to_bytes()
+        self.compressor.add_bytes(MANIFEST_NAME, data)
+        self.volume_entries[MANIFEST_NAME] = {'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+        self._write_volume_manifest(last=True)
+        self.compressor.close()
+        self.fileobj.flush()
+        os.fsync(self.fileobj.fileno())
+        self.fileobj.close()
+
+        directory = os.path.dirname(self.backup_path)
+        os.replace(os.path.join(directory, self.current_name), self.backup_path)
+        self.volumes.append(self.backup_name)
+        return [os.path.join(directory, name) for name in self.volumes]
+
+    def locations(self):
+        """Путь -> (смещение локального заголовка в томе, сжатый размер) после finish"""
+        return {path: (entry.offset, entry.compressed_size) for path, entry in self.entries.items()}
+
+    def abort(self):
+        """Остановка после ошибки: пул освобождается, недописанные тома остаются для разбора"""
+        self.compressor.pool.shutdown(cancel_futures=True)
+        if self.fileobj is not None:
+            self.fileobj.close()
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from main import BackupUtility
+from backup_writer import MIN_VOLUME_SIZE
+from compression_policy import PROFILES, parse_rules
+from manifest import BACKUP_TYPES, BackupChain
+from metrics import METRICS_FILE
+from retention import prune
+
+# Коды завершения
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_CONFIG = 2
+EXIT_FAILED = 3
+EXIT_VERIFY = 4
+EXIT_INTERRUPTED = 130
+
+# Значения по умолчанию для заданий из файла настроек
+DEFAULTS = {
+    'backup_dir': None,
+    'type': 'incremental',
+    'jobs': 1,
+    'workers': None,
+    'compression': 'balanced',
+    'compression_rules': None,
+    'volume_size_mb': None,
+    'bandwidth_mb': None,
+    'keep_daily': None,
+    'keep_weekly': None,
+    'verify': False,
+    'resume': False,
+}
+SOURCE_KEYS = ('type', 'backup_dir', 'compression', 'compression_rules', 'volume_size_mb')
+
+
+class RateLimiter:
+    """Общее ограничение скорости чтения (маркерное ведро) для всех заданий"""
+
+    def __init__(self, bytes_per_second):
+        self.rate = bytes_per_second
+        self.allowance = bytes_per_second
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __call__(self, size):
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.updated) * self.rate)
+            self.updated = now
+            self.allowance -= size
+            # Долг по объему ожидается вне блокировки: остальные задания тоже копят долг и ждут
+            delay = -self.allowance / self.rate if self.allowance < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Пакетное резервное копирование без диалога")
+    parser.add_argument('sources', nargs='*', help="исходные папки (дополняют список из файла настроек)")
+    parser.add_argument('-c', '--config', help="файл настроек JSON со списком источников")
+    parser.add_argument('-o', '--backup-dir', help="папка для резервных копий")
+    parser.add_argument('-t', '--type', choices=BACKUP_TYPES, help="тип копии")
+    parser.add_argument('-j', '--jobs', type=int, help="сколько папок копировать одновременно")
+    parser.add_argument('-w', '--workers', type=int, help="потоков сжатия на одно задание")
+    parser.add_argument('--compression', help="профиль сжатия")
+    parser.add_argument('--volume-size-mb', type=int, help="размер тома в МБ")
+    parser.add_argument('--bandwidth-mb', type=float, help="общий предел скорости чтения, МБ/с")
+    parser.add_argument('--keep-daily', type=int, help="сколько дневных копий хранить")
+    parser.add_argument('--keep-weekly', type=int, help="сколько недельных копий хранить")
+    parser.add_argument('--verify', action='store_true', default=None, help="проверить копии после создания")
+    parser.add_argument('--resume', action='store_true', default=None,
+                        help="продолжить прерванные копии с последней контрольной точки")
+    parser.add_argument('--metrics', default=METRICS_FILE, help="файл метрик")
+    parser.add_argument('--stats-interval', type=float, help="период строки статистики, с")
+    parser.add_argument('--dry-run', action='store_true', help="только показать задания и удаляемые копии")
+    return parser.parse_args(argv)
+
+
+def load_jobs(args):
+    """Настройки запуска и список заданий; ValueError при ошибках в настройках"""
+    settings = dict(DEFAULTS)
+    sources = []
+    if args.config:
+        try:
+            with open(args.config, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"файл настроек {args.config}: {e}")
+        unknown = set(config) - set(DEFAULTS) - {'sources'}
+        if unknown:
+            raise ValueError(f"неизвестные параметры: {', '.join(sorted(unknown))}")
+        settings.update(config)
+        sources = list(config.get('sources', []))
+    for key in DEFAULTS:
+        value = getattr(args, key, None)
+        if value is not None:
+            settings[key] = value
+    sources.extend(args.sources)
+
+    jobs = []
+    for source in sources:
+        job = {key: settings[key] for key in SOURCE_KEYS}
+        if isinstance(source, dict):
+            unknown = set(source) - set(SOURCE_KEYS) - {'path'}
+            if unknown or 'path' not in source:
+                raise ValueError(f"неверное описание источника: {source}")
+            job.update(source)
+        else:
+            job['path'] = source
+        if not os.path.isdir(job['path']):
+            raise ValueError(f"папка не существует: {job['path']}")
+        if not job['backup_dir']:
+            raise ValueError(f"не задана папка для копий: {job['path']}")
+        if job['type'] not in BACKUP_TYPES:
+            raise ValueError(f"неизвестный тип копии: {job['type']}")
+        if job['compression'] not in PROFILES:
+            raise ValueError(f"неизвестный профиль сжатия: {job['compression']}")
+        if job['volume_size_mb'] and job['volume_size_mb'] * 1024 ** 2 < MIN_VOLUME_SIZE:
+            raise ValueError(f"размер тома меньше {MIN_VOLUME_SIZE // 1024 ** 2} МБ: {job['path']}")
+        if isinstance(job['compression_rules'], str):
+            job['compression_rules'] = parse_rules(job['compression_rules'])
+        jobs.append(job)
+    if not jobs:
+        raise ValueError("не задано ни одной исходной папки")
+
+    # Копии связываются в цепочку по имени папки - имена в одной папке копий не должны совпадать
+    chains = {}
+    for job in jobs:
+        key = (os.path.abspath(job['backup_dir']), os.path.basename(os.path.normpath(job['path'])))
+        if key in chains:
+            raise ValueError(f"папки {chains[key]} и {job['path']} дают одну цепочку копий в {job['backup_dir']}")
+        chains[key] = job['path']
+    if settings['jobs'] < 1:
+        raise ValueError("число одновременных заданий должно быть положительным")
+    settings['metrics'] = args.metrics
+    settings['stats_interval'] = args.stats_interval
+    return settings, jobs
+
+
+def run_job(job, settings, throttle, logger):
+    """Одна папка: копия, проверка, чистка по политике хранения; возвращает код завершения"""
+    utility = BackupUtility(settings['workers'], compression=job['compression'],
+                            compression_rules=job['compression_rules'],
+                            metrics_path=settings['metrics'], stats_interval=settings['stats_interval'],
+                            throttle=throttle, show_progress=False)
+    source_dir = job['path']
+    backup_dir = job['backup_dir']
+    os.makedirs(backup_dir, exist_ok=True)
+
+    snapshot = utility.scan_source(source_dir)
+    interrupted = utility.find_resumable(source_dir, backup_dir) if settings['resume'] else None
+    if interrupted:
+        success = utility.resume_backup(source_dir, interrupted, snapshot)
+    else:
+        backup_type, base = utility.resolve_backup_type(source_dir, backup_dir, job['type'])
+        backup_path = os.path.join(backup_dir, utility.create_backup_name(source_dir, backup_type))
+        volume_size = job['volume_size_mb'] * 1024 ** 2 if job['volume_size_mb'] else None
+        success = utility.create_backup(source_dir, backup_path, backup_type, base, snapshot, volume_size)
+    if not success:
+        return EXIT_FAILED
+
+    code = EXIT_PARTIAL if utility.last_metrics.errors or snapshot.errors else EXIT_OK
+    if settings['verify'] and not utility.verify_backup(backup_dir, utility.last_manifest):
+        code = EXIT_VERIFY
+
+    # Копии не удаляются, пока новая не прошла проверку
+    if code != EXIT_VERIFY and (settings['keep_daily'] is not None or settings['keep_weekly'] is not None):
+        chain = BackupChain(backup_dir, utility.get_folder_name(source_dir))
+        for path in prune(chain, settings['keep_daily'] or 0, settings['keep_weekly'] or 0):
+            logger.info(f"🧹 Удалена копия вне политики хранения: {path}")
+    return code
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        settings, jobs = load_jobs(args)
+    except ValueError as e:
+        print(f"❌ Ошибка настроек: {e}", file=sys.stderr)
+        return EXIT_CONFIG
+
+    if args.dry_run:
+        for job in jobs:
+            print(f"• {job['path']} → {job['backup_dir']} ({job['type']}, {job['compression']})")
+            retention = settings['keep_daily'] is not None or settings['keep_weekly'] is not None
+            if retention and os.path.isdir(job['backup_dir']):
+                chain = BackupChain(job['backup_dir'], os.path.basename(os.path.normpath(job['path'])))
+                for path in prune(chain, settings['keep_daily'] or 0, settings['keep_weekly'] or 0, dry_run=True):
+                    print(f"  🧹 будет удалена: {path}")
+        return EXIT_OK
+
+    throttle = RateLimiter(settings['bandwidth_mb'] * 1024 ** 2) if settings['bandwidth_mb'] else None
+    # Логирование настраивает первый созданный экземпляр утилиты
+    logger = BackupUtility(show_progress=False).logger
+    codes = []
+    try:
+        with ThreadPoolExecutor(max_workers=settings['jobs']) as pool:
+            futures = {pool.submit(run_job, job, settings, throttle, logger): job for job in jobs}
+            for future, job in futures.items():
+                try:
+                    code = future.result()
+                except Exception as e:
+                    logger.error(f"❌ Задание {job['path']} завершилось с ошибкой: {e}")
+                    code = EXIT_FAILED
+                codes.append(code)
+                logger.info(f"{'✅' if code == EXIT_OK else '⚠️ '} {job['path']}: код {code}")
+    except KeyboardInterrupt:
+        logger.info("⚠️  Пакетное копирование прервано")
+        return EXIT_INTERRUPTED
+
+    if all(code == EXIT_OK for code in codes):
+        return EXIT_OK
+    if all(code == EXIT_FAILED for code in codes):
+        return EXIT_FAILED
+    if EXIT_VERIFY in codes:
+        return EXIT_VERIFY
+    return EXIT_PARTIAL
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import sqlite3
+import contextlib
+import zipfile
+import argparse
+
+from manifest import BackupChain, Manifest
+
+INDEX_SUFFIX = '.index.db'
+INDEX_VERSION = 1
+FILES_QUERY = 'SELECT path, archive, size, mtime_ns, sha256, offset, compressed_size, parts FROM files'
+# Путей в одном запросе WHERE path IN (...) - ниже лимита параметров SQLite
+QUERY_CHUNK = 500
+
+
+def index_path(backup_dir, backup_name):
+    """Файл индекса рядом с архивом: backup_x_ts.zip.index.db"""
+    return os.path.join(backup_dir, backup_name + INDEX_SUFFIX)
+
+
+def _rows_by_path(conn, query, paths):
+    """Строки для заданных путей запросами path IN (...) по QUERY_CHUNK путей"""
+    paths = list(paths)
+    for start in range(0, len(paths), QUERY_CHUNK):
+        chunk = paths[start:start + QUERY_CHUNK]
+        yield from conn.execute(f"{query} WHERE path IN ({', '.join('?' * len(chunk))})", chunk)
+
+
+def write_index(backup_dir, manifest, locations=None):
+    """Индекс состояния копии: все файлы описи с архивом, смещением и сжатым размером.
+
+    locations - {путь: (смещение, сжатый размер)} для файлов, сохраненных в
+    самой копии; для остальных смещения переносятся из индекса базовой
+    копии, если он есть. Индекс пишется во временный файл и подменяется
+    атомарно, так что прерванная запись не оставляет испорченный индекс.
+    """
+    locations = dict(locations or {})
+    inherited = [path for path in manifest.files if path not in locations]
+    if inherited and manifest.base:
+        base_index = BackupIndex(backup_dir, manifest.base)
+        if base_index.exists():
+            locations.update({path: location for path, location in base_index.locations(inherited).items()
+                              if location[0] is not None})
+
+    path = index_path(backup_dir, manifest.name)
+    temp_path = path + '.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    conn = sqlite3.connect(temp_path)
+    try:
+        with conn:
+            conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            conn.execute('''
+                CREATE TABLE files (
+                    path TEXT PRIMARY KEY,
+                    archive TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    offset INTEGER,
+                    compressed_size INTEGER,
+                    parts TEXT
+                ) WITHOUT ROWID
+            ''')
+            meta = manifest.to_dict()
+            del meta['files']
+            meta['index_version'] = INDEX_VERSION
+            conn.executemany('INSERT INTO meta VALUES (?, ?)',
+                             [(key, json.dumps(value, ensure_ascii=False)) for key, value in meta.items()])
+            conn.executemany('INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (
+                (file_path, entry['archive'], entry['size'], entry['mtime_ns'], entry['sha256'],
+                 *locations.get(file_path, (None, None)),
+                 json.dumps(entry['parts'], ensure_ascii=False) if 'parts' in entry else None)
+                for file_path, entry in manifest.files.items()))
+    finally:
+        conn.close()
+    os.replace(temp_path, path)
+    return path
+
+
+class BackupIndex:
+    """Индекс одной копии: список и поиск файлов без чтения ZIP"""
+
+    def __init__(self, backup_dir, backup_name):
+        self.backup_dir = backup_dir
+        self.backup_name = backup_name
+        self.path = index_path(backup_dir, backup_name)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def build(self):
+        """Индекс по описи из архива - для копий, созданных без индекса"""
+        manifest = Manifest.read_from(os.path.join(self.backup_dir, self.backup_name))
+        if manifest is None:
+            raise ValueError(f"в архиве {self.backup_name} нет описи")
+        manifest.name = self.backup_name
+        locations = {}
+        try:
+            with zipfile.ZipFile(os.path.join(self.backup_dir, self.backup_name)) as zipf:
+                locations = {info.filename: (info.header_offset, info.compress_size) for info in zipf.infolist()
+                             if manifest.files.get(info.filename, {}).get('archive') == self.backup_name}
+        except (OSError, zipfile.BadZipFile):
+            pass
+        write_index(self.backup_dir, manifest, locations)
+
+    def ensure(self):
+        if not self.exists():
+            self.build()
+        return self
+
+    def files(self, pattern=None):
+        """Записи [(путь, архив, размер, mtime_ns, sha256, смещение, сжатый размер, части)], по шаблону glob"""
+        with contextlib.closing(sqlite3.connect(self.path)) as conn, conn:
+            if pattern is None:
+                return conn.execute(FILES_QUERY + ' ORDER BY path').fetchall()
+            return conn.execute(FILES_QUERY + ' WHERE path GLOB ? ORDER BY path', (pattern,)).fetchall()
+
+    def locations(self, paths):
+        """Путь -> (смещение, сжатый размер) для заданных путей"""
+        with contextlib.closing(sqlite3.connect(self.path)) as conn, conn:
+            return {path: (offset, compressed_size) for path, offset, compressed_size in
+                    _rows_by_path(conn, 'SELECT path, offset, compressed_size FROM files', paths)}
+
+    def manifest(self, patterns=None, paths=None):
+        """Опись из индекса; с patterns - только файлы под шаблоны, с paths - только эти пути"""
+        with contextlib.closing(sqlite3.connect(self.path)) as conn, conn:
+            meta = {key: json.loads(value) for key, value in conn.execute('SELECT key, value FROM meta')}
+            rows = {}
+            if paths is not None:
+                rows = {row[0]: row for row in _rows_by_path(conn, FILES_QUERY, paths)}
+        if paths is None:
+            for pattern in patterns or [None]:
+                rows.update((row[0], row) for row in self.files(pattern))
+        files = {}
+        for path, archive, size, mtime_ns, sha256, offset, compressed_size, parts in rows.values():
+            files[path] = {'size': size, 'mtime_ns': mtime_ns, 'sha256': sha256, 'archive': archive}
+            if parts:
+                files[path]['parts'] = json.loads(parts)
+            elif offset is not None:
+                # Смещение записи позволяет восстановить файл без чтения каталога ZIP
+                files[path].update(offset=offset, compressed_size=compressed_size)
+        return Manifest(self.backup_name, meta['type'], meta.get('base'), meta.get('created'), files,
+                        meta.get('deleted'), meta.get('volumes'))
+
+
+class BackupCatalog:
+    """Поиск и выборочное восстановление по индексам всех копий каталога"""
+
+    def __init__(self, backup_dir, workers=None):
+        self.backup_dir = backup_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.chain = BackupChain(backup_dir)
+
+    def index(self, backup_name):
+        return BackupIndex(self.backup_dir, backup_name).ensure()
+
+    def backups(self):
+        return self.chain.backups()
+
+    def search(self, pattern):
+        """Самая новая версия каждого подходящего файла: {путь: (копия, запись индекса)}.
+
+        Копии просматриваются от новых к старым; файл, удаленный из папки,
+        все равно находится - в последней копии, где он еще был.
+        """
+        found = {}
+        for name, _ in reversed(self.backups()):
+            try:
+                rows = self.index(name).files(pattern)
+            except (ValueError, sqlite3.Error):
+                continue
+            for row in rows:
+                found.setdefault(row[0], (name, row))
+        return found
+
+    def extract(self, backup_name, patterns, target_dir, progress=None, paths=None):
+        """Параллельное извлечение файлов копии по шаблонам или точным путям: (число файлов, ошибки)"""
+        manifest = self.index(backup_name).manifest(patterns, paths)
+        return self.chain.restore(manifest, target_dir, progress, self.workers)
+
+    def extract_latest(self, pattern, target_dir, progress=None):
+        """Извлечение самых новых версий файлов по шаблону из всех копий"""
+        by_backup = {}
+        for path, (name, _) in self.search(pattern).items():
+            by_backup.setdefault(name, []).append(path)
+        restored = 0
+        errors = []
+        for name, paths in sorted(by_backup.items()):
+            count, backup_errors = self.extract(name, None, target_dir, progress, paths)
+            restored += count
+            errors.extend(backup_errors)
+        return restored, errors
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Список, поиск и выборочное восстановление файлов из копий")
+    parser.add_argument('backup_dir', help="папка с резервными копиями")
+    commands = parser.add_subparsers(dest='command', required=True)
+    list_parser = commands.add_parser('list', help="файлы копии")
+    list_parser.add_argument('backup', help="имя архива копии")
+    list_parser.add_argument('pattern', nargs='?', help="шаблон пути (glob)")
+    search_parser = commands.add_parser('search', help="самые новые версии файлов во всех копиях")
+    search_parser.add_argument('pattern', help="шаблон пути (glob)")
+    extract_parser = commands.add_parser('extract', help="извлечь файлы")
+    extract_parser.add_argument('patterns', nargs='+', help="пути или шаблоны")
+    extract_parser.add_argument('-o', '--target', required=True, help="папка для извлечения")
+    extract_parser.add_argument('-b', '--backup', help="из этой копии (по умолчанию - самые новые версии)")
+    extract_parser.add_argument('-w', '--workers', type=int, help="потоков извлечения")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.isdir(args.backup_dir):
+        print(f"❌ Папка не существует: {args.backup_dir}", file=sys.stderr)
+        return 2
+    catalog = BackupCatalog(args.backup_dir, getattr(args, 'workers', None))
+
+    if args.command == 'list':
+        try:
+            rows = catalog.index(args.backup).files(args.pattern)
+        except (ValueError, sqlite3.Error) as e:
+            print(f"❌ {e}", file=sys.stderr)
+            return 2
+        for path, archive, size, mtime_ns, *_ in rows:
+            print(f"{size:>14} {mtime_ns // 10 ** 9:>12} {path} [{archive}]")
+        return 0
+
+    if args.command == 'search':
+        for path, (name, row) in sorted(catalog.search(args.pattern).items()):
+            print(f"{row[2]:>14} {path} [{name}, версия в {row[1]}]")
+        return 0
+
+    os.makedirs(args.target, exist_ok=True)
+    if args.backup:
+        restored, errors = catalog.extract(args.backup, args.patterns, args.target)
+    else:
+        restored, errors = 0, []
+        for pattern in args.patterns:
+            count, pattern_errors = catalog.extract_latest(pattern, args.target)
+            restored += count
+            errors.extend(pattern_errors)
+    for error in errors:
+        print(f"❌ {error}", file=sys.stderr)
+    print(f"{'✅' if not errors else '⚠️ '} Извлечено файлов: {restored}, ошибок: {len(errors)}")
+    return 0 if not errors else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import os
+import zlib
+import fnmatch
+
+from parallel_zip import CODECS
+
+SAMPLE_SIZE = 64 * 1024
+# Если пробное сжатие экономит меньше 5%, файл сохраняется без сжатия
+MIN_SAVING = 0.05
+# Мелкие файлы сжимать бессмысленно: заголовки съедают выигрыш
+MIN_COMPRESS_SIZE = 128
+
+INCOMPRESSIBLE_EXTENSIONS = {
+    # изображения
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.heif', '.avif', '.jp2',
+    # архивы и сжатые потоки
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.txz', '.lz', '.lzma', '.zst', '.lz4', '.7z', '.rar', '.cab',
+    '.jar', '.apk', '.whl', '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.epub',
+    # аудио и видео
+    '.mp3', '.aac', '.m4a', '.ogg', '.opus', '.flac', '.mp4', '.m4v', '.mkv', '.avi', '.mov', '.webm', '.wmv',
+}
+
+# Профили: метод и уровень для файлов без явного правила
+PROFILES = {
+    'fast': ('deflate', 1),
+    'balanced': ('deflate', 6),
+    'small': ('lzma', 6),
+}
+
+
+def parse_rules(text):
+    """Правила вида "*.log=lzma:9; *.csv=bzip2; *.iso=store" -> [(шаблон, метод, уровень)]"""
+    rules = []
+    for part in text.replace('\n', ';').split(';'):
+        part = part.strip()
+        if not part:
+            continue
+        pattern, _, spec = part.partition('=')
+        codec, _, level = spec.strip().partition(':')
+        codec = codec.strip().lower()
+        if not pattern.strip() or codec not in CODECS:
+            raise ValueError(f"Неверное правило сжатия: {part}")
+        rules.append((pattern.strip(), codec, int(level) if level.strip() else None))
+    return rules
+
+
+class CompressionPolicy:
+    """Выбор метода и уровня сжатия для каждого файла.
+
+    Порядок: явные правила по шаблонам имени, затем известные несжимаемые
+    типы (JPEG, ZIP, видео...), затем пробное сжатие первого блока для
+    остальных; файлы, которые почти не сжимаются, сохраняются как есть.
+    """
+
+    def __init__(self, profile='balanced', rules=None):
+        if profile not in PROFILES:
+            raise ValueError(f"Неизвестный профиль сжатия: {profile}")
+        self.profile = profile
+        self.codec, self.level = PROFILES[profile]
+        self.rules = rules or []
+
+    def choose(self, arcname, file_path, size):
+        """(метод, уровень, причина) для файла"""
+        for pattern, codec, level in self.rules:
+            if fnmatch.fnmatch(arcname, pattern) or fnmatch.fnmatch(os.path.basename(arcname), pattern):
+                return codec, level, 'rule'
+        if size < MIN_COMPRESS_SIZE:
+            return 'store', None, 'small'
+        if os.path.splitext(arcname)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+            return 'store', None, 'type'
+        if not self.is_compressible(file_path):
+            return 'store', None, 'sample'
+        return self.codec, self.level, 'profile'
+
+    @staticmethod
+    def is_compressible(file_path):
+        """Оценка по первому блоку: быстрое сжатие deflate уровня 1"""
+        try:
+            with open(file_path, 'rb') as f:
+                sample = f.read(SAMPLE_SIZE)
+        except OSError:
+            # Ошибку чтения сообщит сама архивация
+            return True
+        if not sample:
+            return True
+        return len(zlib.compress(sample, 1)) <= len(sample) * (1 - MIN_SAVING)
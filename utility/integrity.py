@@ -0,0 +1,163 @@
+import os
+import json
+import zipfile
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from manifest import HASH_BLOCK, MANIFEST_NAME
+from backup_writer import VOLUME_MANIFEST_NAME
+
+
+def expected_entries(zipf, archive_name, manifest):
+    """Записи архива с ожидаемыми размером и SHA-256: {имя в архиве: (размер, SHA-256)}.
+
+    Том хранит собственную опись, для обычного архива ожидания берутся из
+    общей описи копии (файлы, версия которых лежит в этом архиве).
+    """
+    try:
+        data = json.loads(zipf.read(VOLUME_MANIFEST_NAME))
+    except KeyError:
+        return {path: (entry['size'], entry['sha256']) for path, entry in manifest.files.items()
+                if entry['archive'] == archive_name and 'parts' not in entry}
+    return {name: (entry['size'], entry['sha256']) for name, entry in data['entries'].items()
+            if name != MANIFEST_NAME}
+
+
+class ArchiveVerifier:
+    """Проверка целостности архивов копии.
+
+    Каждая запись читается потоково: zipfile сверяет CRC-32 в конце записи,
+    а содержимое сверяется с размером и SHA-256 из описи. Записи проверяются
+    параллельно: у каждого потока свои открытые архивы, а распаковка и
+    хеширование отпускают GIL.
+    """
+
+    def __init__(self, backup_dir, workers=None):
+        self.backup_dir = backup_dir
+        self.workers = workers or os.cpu_count() or 1
+        self._local = threading.local()
+        self._opened = []
+        self._lock = threading.Lock()
+
+    def _archive(self, name):
+        archives = getattr(self._local, 'archives', None)
+        if archives is None:
+            archives = self._local.archives = {}
+        if name not in archives:
+            zipf = zipfile.ZipFile(os.path.join(self.backup_dir, name))
+            archives[name] = zipf
+            with self._lock:
+                self._opened.append(zipf)
+        return archives[name]
+
+    def _check_entry(self, archive_name, arcname, size, sha256):
+        digest = hashlib.sha256()
+        read = 0
+        try:
+            with self._archive(archive_name).open(arcname) as src:
+                for block in iter(lambda: src.read(HASH_BLOCK), b''):
+                    digest.update(block)
+                    read += len(block)
+        except (OSError, KeyError, zipfile.BadZipFile) as e:
+            return read, f"{archive_name}: {arcname}: {e}"
+        if read != size:
+            return read, f"{archive_name}: {arcname}: размер {read} вместо {size}"
+        if digest.hexdigest() != sha256:
+            return read, f"{archive_name}: {arcname}: SHA-256 не совпадает с описью"
+        return read, None
+
+    def _plan(self, manifest, errors):
+        """Задания на проверку записей всех томов копии"""
+        tasks = []
+        members = set()
+        for archive_name in manifest.volumes:
+            try:
+                zipf = self._archive(archive_name)
+                expected = expected_entries(zipf, archive_name, manifest)
+            except (OSError, ValueError, zipfile.BadZipFile) as e:
+                errors.append(f"{archive_name}: архив недоступен ({e})")
+                continue
+            names = set(zipf.namelist())
+            for arcname, (size, sha256) in expected.items():
+                if arcname not in names:
+                    errors.append(f"{archive_name}: {arcname}: запись отсутствует в архиве")
+                    continue
+                tasks.append((size, archive_name, arcname, sha256))
+                members.add((archive_name, arcname))
+            for arcname in sorted(names - set(expected) - {MANIFEST_NAME, VOLUME_MANIFEST_NAME}):
+                errors.append(f"{archive_name}: {arcname}: запись не указана в описи")
+
+        # Каждая версия файла, которую опись относит к этой копии, должна быть в ее томах
+        volumes = set(manifest.volumes)
+        for path, entry in sorted(manifest.files.items()):
+            if entry['archive'] not in volumes:
+                continue
+            locations = [tuple(part) for part in entry['parts']] if 'parts' in entry else [(entry['archive'], path)]
+            for location in locations:
+                if location not in members and location[0] in volumes:
+                    errors.append(f"{location[0]}: {location[1]}: файл описи {path} не найден в томе")
+        # Крупные записи первыми - потоки загружены равномернее
+        tasks.sort(reverse=True)
+        return tasks
+
+    def verify(self, manifest, progress=None):
+        """Проверка всех томов копии: (число записей, объем, список ошибок)"""
+        errors = []
+        checked = 0
+        total = 0
+        try:
+            tasks = self._plan(manifest, errors)
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(self._check_entry, archive_name, arcname, size, sha256)
+                           for size, archive_name, arcname, sha256 in tasks]
+                for future in futures:
+                    read, error = future.result()
+                    checked += 1
+                    total += read
+                    if error:
+                        errors.append(error)
+                    if progress:
+                        progress(read)
+        finally:
+            for zipf in self._opened:
+                zipf.close()
+            self._opened = []
+            self._local = threading.local()
+        return checked, total, errors
+
+
+def diff_manifests(old_files, new_files):
+    """Сравнение двух описей без распаковки: {'added', 'removed', 'modified', 'unchanged'}"""
+    added = sorted(path for path in new_files if path not in old_files)
+    removed = sorted(path for path in old_files if path not in new_files)
+    modified = []
+    unchanged = 0
+    for path in sorted(new_files):
+        old = old_files.get(path)
+        if old is None:
+            continue
+        new = new_files[path]
+        if old['size'] != new['size'] or old['sha256'] != new['sha256']:
+            modified.append(path)
+        else:
+            unchanged += 1
+    return {'added': added, 'removed': removed, 'modified': modified, 'unchanged': unchanged}
+
+
+def diff_with_snapshot(manifest, snapshot):
+    """Сравнение описи с текущим состоянием папки по размеру и mtime, без чтения файлов"""
+    live = {arcname: (size, mtime_ns) for arcname, _, size, mtime_ns in snapshot}
+    added = sorted(path for path in live if path not in manifest.files)
+    removed = sorted(path for path in manifest.files if path not in live)
+    modified = []
+    unchanged = 0
+    for path, (size, mtime_ns) in sorted(live.items()):
+        entry = manifest.files.get(path)
+        if entry is None:
+            continue
+        if entry['size'] != size or entry['mtime_ns'] != mtime_ns:
+            modified.append(path)
+        else:
+            unchanged += 1
+    return {'added': added, 'removed': removed, 'modified': modified, 'unchanged': unchanged}
@@ -0,0 +1,101 @@
+import os
+import json
+import time
+
+from manifest import parse_backup_name
+
+JOURNAL_SUFFIX = '.journal'
+PARTIAL_SUFFIX = '.partial'
+# Контрольная точка - не реже чем раз в 30 с или после 256 МБ исходных данных
+CHECKPOINT_SECONDS = 30
+CHECKPOINT_BYTES = 256 * 1024 * 1024
+
+
+def journal_path(backup_path):
+    return backup_path + JOURNAL_SUFFIX
+
+
+def partial_path(backup_path):
+    """Временное имя архива до успешного завершения"""
+    return backup_path + PARTIAL_SUFFIX
+
+
+def find_interrupted(backup_dir, folder_name):
+    """Журнал последней прерванной копии папки или None"""
+    found = []
+    for name in os.listdir(backup_dir):
+        if not name.endswith(JOURNAL_SUFFIX):
+            continue
+        parsed = parse_backup_name(name[:-len(JOURNAL_SUFFIX)])
+        if parsed and parsed[0] == folder_name:
+            found.append((parsed[1], os.path.join(backup_dir, name)))
+    return max(found)[1] if found else None
+
+
+class BackupJournal:
+    """Журнал архивации для продолжения после сбоя.
+
+    Первая строка - параметры копии, далее строки контрольных точек:
+    смещение, до которого архив записан и сброшен на диск, записи архива
+    и записи описи файлов, завершенных с прошлой точки. Каждая строка
+    сбрасывается на диск (fsync) после того, как на диск сброшен сам архив,
+    поэтому журнал никогда не ссылается на незаписанные данные; недописанная
+    последняя строка при чтении отбрасывается.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.last_checkpoint = time.monotonic()
+        self.bytes_since = 0
+
+    def _append(self, data):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(data, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    @classmethod
+    def create(cls, path, header):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(header, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        return cls(path)
+
+    def load(self):
+        """(параметры копии, {путь: запись описи}, [записи архива], смещение)"""
+        header = None
+        files = {}
+        entries = []
+        offset = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    # Строка, недописанная при сбое, - всегда последняя
+                    break
+                if header is None:
+                    header = data
+                    continue
+                files.update(data['files'])
+                entries.extend(data['entries'])
+                offset = data['offset']
+        if header is None:
+            raise ValueError(f"журнал {self.path} пуст")
+        return header, files, entries, offset
+
+    def due(self, size):
+        """Пора ли делать контрольную точку после очередного файла"""
+        self.bytes_since += size
+        return (self.bytes_since >= CHECKPOINT_BYTES
+                or time.monotonic() - self.last_checkpoint >= CHECKPOINT_SECONDS)
+
+    def checkpoint(self, offset, files, entries):
+        self._append({'offset': offset, 'files': files, 'entries': entries})
+        self.last_checkpoint = time.monotonic()
+        self.bytes_since = 0
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -1,12 +1,44 @@
 import os
-import zipfile
+import sys
+import sqlite3
 import datetime
 import logging
 from pathlib import Path
 
+from manifest import (TIMESTAMP_FORMAT, TYPE_SUFFIXES, BackupChain, Manifest,
+                      parse_backup_name)
+from catalog import BackupCatalog, write_index
+from integrity import ArchiveVerifier, diff_manifests, diff_with_snapshot
+from compression_policy import PROFILES, CompressionPolicy
+from backup_writer import MIN_VOLUME_SIZE, BackupWriter
+from repository import DedupRepository
+from scanner import scan_tree
+from metrics import METRICS_FILE, BackupMetrics, StatsReporter
+from journal import JOURNAL_SUFFIX, BackupJournal, find_interrupted, journal_path, partial_path
+
+BACKUP_TYPE_NAMES = {'full': 'полная', 'incremental': 'инкрементная', 'differential': 'дифференциальная'}
+# Сколько путей каждого вида показывать при сравнении
+DIFF_PREVIEW = 20
+
 
 class BackupUtility:
-    def __init__(self):
+    def __init__(self, workers=None, scan_workers=1, compression='balanced', compression_rules=None,
+                 metrics_path=METRICS_FILE, stats_interval=None, throttle=None, show_progress=True):
+        # Число потоков сжатия (по умолчанию - по числу ядер)
+        self.workers = workers or os.cpu_count() or 1
+        self.policy = CompressionPolicy(compression, compression_rules)
+        # Потоки сканирования: > 1 имеет смысл для сетевых ФС с большой задержкой stat
+        self.scan_workers = scan_workers
+        self.last_manifest = None
+        self.last_volumes = []
+        # Файл метрик (строка JSON на запуск) и период строки статистики в секундах
+        self.metrics_path = metrics_path
+        self.stats_interval = stats_interval
+        self.last_metrics = None
+        # Ограничение скорости чтения источника (общий для пакетных заданий RateLimiter)
+        self.throttle = throttle
+        # В пакетном режиме строка прогресса не выводится
+        self.show_progress = show_progress
         self.setup_logging()
 
     def setup_logging(self):
@@ -21,11 +53,30 @@ class BackupUtility:
         )
         self.logger = logging.getLogger(__name__)
 
-    def get_user_input(self):
-        """Получение путей от пользователя"""
+    def get_action(self):
+        """Выбор действия: тип резервной копии или восстановление"""
         print("\n🗃️ УТИЛИТА РЕЗЕРВНОГО КОПИРОВАНИЯ")
         print("=" * 50)
+        print("1. 📦 Полная резервная копия")
+        print("2. ➕ Инкрементная (изменения с последней копии)")
+        print("3. 🔀 Дифференциальная (изменения с последней полной копии)")
+        print("4. ♻️  Восстановление из резервной копии")
+        print("5. 🧩 Снимок в репозиторий с дедупликацией")
+        print("6. 🧷 Восстановление снимка из репозитория")
+        print("7. 🔎 Проверка целостности резервной копии")
+        print("8. 🆚 Сравнение копии с другой копией или папкой")
+        print("9. 🔍 Поиск файлов и выборочное восстановление")
+
+        actions = {'1': 'full', '2': 'incremental', '3': 'differential', '4': 'restore',
+                   '5': 'repository', '6': 'repository_restore', '7': 'verify', '8': 'diff', '9': 'search'}
+        while True:
+            choice = input("Выберите действие (1-9): ").strip()
+            if choice in actions:
+                return actions[choice]
+            print("❌ Неверный выбор! Попробуйте снова.")
 
+    def get_user_input(self):
+        """Получение путей от пользователя"""
         # Исходная папка
         while True:
             source_dir = input("Введите путь к исходной папке: ").strip()
@@ -52,23 +103,36 @@ class BackupUtility:
 
         return source_dir, backup_dir
 
-    def create_backup_name(self, source_dir):
+    def get_folder_name(self, source_dir):
+        """Имя исходной папки, по которому архивы связываются в цепочку"""
+        return os.path.basename(os.path.normpath(source_dir))
+
+    def create_backup_name(self, source_dir, backup_type='full'):
         """Создание имени для архива"""
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        folder_name = os.path.basename(os.path.normpath(source_dir))
-        return f"backup_{folder_name}_{timestamp}.zip"
+        timestamp = datetime.datetime.now().strftime(TIMESTAMP_FORMAT)
+        folder_name = self.get_folder_name(source_dir)
+        return f"backup_{folder_name}_{timestamp}{TYPE_SUFFIXES[backup_type]}.zip"
+
+    def resolve_backup_type(self, source_dir, backup_dir, backup_type):
+        """Тип копии с учетом цепочки: без базовой копии делается полная"""
+        if backup_type == 'full':
+            return backup_type, None
+        base = BackupChain(backup_dir, self.get_folder_name(source_dir)).base_for(backup_type)
+        if base is None:
+            self.logger.info("ℹ️  Предыдущая копия с описью не найдена - будет создана полная копия")
+            return 'full', None
+        return backup_type, base
+
+    def scan_source(self, source_dir):
+        """Снимок файлов источника за один проход (os.scandir)"""
+        snapshot = scan_tree(source_dir, self.scan_workers)
+        for error in snapshot.errors:
+            self.logger.warning(f"⚠️  Пропущено при сканировании: {error}")
+        return snapshot
 
     def get_total_size(self, source_dir):
         """Подсчет общего размера файлов для резервного копирования"""
-        total_size = 0
-        for dirpath, dirnames, filenames in os.walk(source_dir):
-            for filename in filenames:
-                filepath = os.path.join(dirpath, filename)
-                try:
-                    total_size += os.path.getsize(filepath)
-                except OSError:
-                    continue
-        return total_size
+        return self.scan_source(source_dir).total_size
 
     def format_size(self, size_bytes):
         """Форматирование размера в читаемый вид"""
@@ -78,78 +142,543 @@ class BackupUtility:
             size_bytes /= 1024.0
         return f"{size_bytes:.2f} TB"
 
-    def create_backup(self, source_dir, backup_path):
-        """Создание ZIP-архива"""
-        total_size = self.get_total_size(source_dir)
+    def create_backup(self, source_dir, backup_path, backup_type='full', base=None, snapshot=None,
+                      volume_size=None, output=None, resume=None):
+        """Создание ZIP-архива.
+
+        В архив попадают файлы, новые или измененные относительно описи base
+        (размер или mtime отличаются), остальные переносятся в новую опись со
+        ссылкой на архив, где уже лежит их версия. Опись пишется в конец архива.
+        Готовый снимок файлов snapshot позволяет не сканировать источник повторно.
+        volume_size разбивает копию на тома, output - поток (stdout, канал,
+        сокет), куда архив пишется вместо файла backup_path.
+
+        Архив пишется под временным именем и переименовывается после
+        завершения; ход архивации периодически фиксируется в журнале.
+        resume - (параметры, файлы, записи, смещение) из журнала прерванной
+        копии: файлы, зафиксированные в журнале и с тех пор не изменившиеся,
+        не сжимаются повторно.
+        """
+        backup_name = os.path.basename(backup_path)
+        created = resume[0]['created'] if resume else None
+        manifest = Manifest(backup_name, backup_type, base.name if base else None, created)
+        previous = base.files if base else {}
+
+        files = snapshot if snapshot is not None else self.scan_source(source_dir)
+        changed = []
+        for arcname, file_path, size, mtime_ns in files:
+            entry = previous.get(arcname)
+            if entry and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+                manifest.files[arcname] = dict(entry)
+            else:
+                changed.append((arcname, file_path, size, mtime_ns))
+        current = {arcname for arcname, _, _, _ in files}
+        manifest.deleted = sorted(path for path in previous if path not in current)
+
+        resume_state = None
+        if resume:
+            _, committed, entries, offset = resume
+            remaining = []
+            for arcname, file_path, size, mtime_ns in changed:
+                record = committed.get(arcname)
+                if record and record['size'] == size and record['mtime_ns'] == mtime_ns:
+                    manifest.files[arcname] = record
+                else:
+                    remaining.append((arcname, file_path, size, mtime_ns))
+            # Для файла, сохраненного повторно, действительна последняя запись; записи
+            # измененных с тех пор файлов остаются в архиве мертвыми байтами вне каталога
+            latest = {entry['arcname']: entry for entry in entries}
+            resume_state = (offset, [entry for arcname, entry in latest.items() if arcname in manifest.files
+                                     and manifest.files[arcname]['archive'] == backup_name])
+            self.logger.info(f"⏯️  Продолжение прерванной копии: готово файлов {len(changed) - len(remaining)}, "
+                             f"осталось {len(remaining)}")
+            changed = remaining
+
+        total_size = sum(size for _, _, size, _ in changed)
         processed_size = 0
+        # Причина выбора метода -> [число файлов, объем]
+        decisions = {}
 
-        self.logger.info(f"🚀 Начало резервного копирования: {source_dir}")
+        self.logger.info(f"🚀 Начало резервного копирования ({BACKUP_TYPE_NAMES[backup_type]}): {source_dir}")
+        if base:
+            self.logger.info(f"🔗 Базовая копия: {base.name}")
+            self.logger.info(f"📝 Изменено/добавлено: {len(changed)}, без изменений: "
+                             f"{len(files) - len(changed)}, удалено: {len(manifest.deleted)}")
         self.logger.info(f"📁 Общий размер данных: {self.format_size(total_size)}")
 
+        # При выводе архива в stdout прогресс не должен смешиваться с данными
+        progress_stream = sys.stderr if output is not None else sys.stdout
+        metrics = self.last_metrics = BackupMetrics(backup_name, backup_type, files.seconds)
+        writer = None
+        journal = None
         try:
-            with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for root, dirs, files in os.walk(source_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, source_dir)
-
-                        try:
-                            # Показываем прогресс
-                            file_size = os.path.getsize(file_path)
-                            zipf.write(file_path, arcname)
-                            processed_size += file_size
-
-                            progress = (processed_size / total_size) * 100
+            writer = metrics.writer = BackupWriter(backup_path, self.workers, volume_size, output, self.throttle,
+                                                   resume_state)
+            if writer.resumable:
+                if resume:
+                    journal = BackupJournal(journal_path(backup_path))
+                else:
+                    journal = BackupJournal.create(journal_path(backup_path), {
+                        'backup': backup_name, 'type': backup_type, 'base': manifest.base,
+                        'created': manifest.created, 'source': os.path.abspath(source_dir),
+                    })
+            # Записи описи, еще не попавшие в журнал
+            uncommitted = {}
+            with StatsReporter(metrics, self.stats_interval, self.logger.info):
+                for arcname, file_path, size, mtime_ns in changed:
+                    try:
+                        codec, level, reason = self.policy.choose(arcname, file_path, size)
+                        decision = decisions.setdefault((codec, reason), [0, 0])
+                        decision[0] += 1
+                        decision[1] += size
+                        # Показываем прогресс
+                        record = writer.add_file(arcname, file_path, size, mtime_ns / 1e9, codec, level)
+                        record['mtime_ns'] = mtime_ns
+                        manifest.files[arcname] = record
+                        processed_size += size
+                        metrics.file_done(record['size'])
+                        if journal:
+                            uncommitted[arcname] = record
+                            if journal.due(size):
+                                offset, entries = writer.checkpoint()
+                                journal.checkpoint(offset, uncommitted, entries)
+                                uncommitted = {}
+
+                        if self.show_progress:
+                            progress = (processed_size / total_size) * 100 if total_size else 100.0
                             print(
                                 f"\r📦 Прогресс: {progress:.1f}% ({self.format_size(processed_size)} / {self.format_size(total_size)})",
-                                end="", flush=True)
+                                end="", flush=True, file=progress_stream)
 
-                        except Exception as e:
-                            self.logger.error(f"❌ Ошибка при добавлении файла {file_path}: {e}")
+                    except OSError as e:
+                        metrics.errors += 1
+                        self.logger.error(f"❌ Ошибка при добавлении файла {file_path}: {e}")
 
-            print()  # Новая строка после прогресса
+                volumes = writer.finish(manifest)
+            if journal:
+                journal.remove()
+            metrics.finish('ok')
+            if output is None:
+                self.write_index(os.path.dirname(backup_path), manifest, writer.locations())
+            self.last_volumes = volumes
+            if self.show_progress:
+                print(file=progress_stream)  # Новая строка после прогресса
+            if len(volumes) > 1:
+                self.logger.info(f"🧩 Копия разбита на тома: {len(volumes)}")
+            self.log_compression(writer.stats, decisions)
+            self.logger.info(metrics.status_line())
+            self.save_metrics(metrics)
+            self.last_manifest = manifest
             return True
 
         except Exception as e:
+            if writer is not None:
+                writer.abort()
+            metrics.finish('failed')
+            self.save_metrics(metrics)
             self.logger.error(f"❌ Критическая ошибка при создании архива: {e}")
             return False
 
+    def find_resumable(self, source_dir, backup_dir):
+        """Путь прерванной копии папки, которую можно продолжить, или None"""
+        path = find_interrupted(backup_dir, self.get_folder_name(source_dir))
+        if path is None:
+            return None
+        backup_path = path[:-len(JOURNAL_SUFFIX)]
+        if not os.path.exists(partial_path(backup_path)):
+            # Журнал без архива продолжить нельзя
+            os.remove(path)
+            return None
+        return backup_path
+
+    def resume_backup(self, source_dir, backup_path, snapshot=None):
+        """Продолжение прерванной копии с последней контрольной точки журнала"""
+        try:
+            header, files, entries, offset = BackupJournal(journal_path(backup_path)).load()
+        except (OSError, ValueError) as e:
+            self.logger.error(f"❌ Журнал прерванной копии не читается: {e}")
+            return False
+        base = None
+        if header['base']:
+            base = BackupChain(os.path.dirname(backup_path)).load(header['base'])
+            if base is None:
+                self.logger.error(f"❌ Базовая копия {header['base']} недоступна - продолжение невозможно")
+                return False
+        return self.create_backup(source_dir, backup_path, header['type'], base, snapshot,
+                                  resume=(header, files, entries, offset))
+
+    def write_index(self, backup_dir, manifest, locations):
+        """Индекс рядом с архивом для поиска без чтения ZIP; без него копия остается полноценной"""
+        try:
+            write_index(backup_dir, manifest, locations)
+        except (OSError, sqlite3.Error) as e:
+            self.logger.warning(f"⚠️  Не удалось записать индекс копии: {e}")
+
+    def save_metrics(self, metrics):
+        """Запись метрик запуска; без файла метрик архивация не прерывается"""
+        if not self.metrics_path:
+            return
+        try:
+            metrics.save(self.metrics_path)
+        except OSError as e:
+            self.logger.warning(f"⚠️  Не удалось записать метрики в {self.metrics_path}: {e}")
+
+    def log_compression(self, stats, decisions):
+        """Итоги сжатия по методам и оценка сэкономленного времени"""
+        reasons = {'rule': 'по правилу', 'profile': 'по профилю', 'type': 'несжимаемый тип',
+                   'sample': 'проба: не сжимается', 'small': 'мелкий файл'}
+        for (codec, reason), (count, size) in sorted(decisions.items()):
+            self.logger.info(f"🗜️  {codec} ({reasons[reason]}): файлов {count}, {self.format_size(size)}")
+
+        total_in = sum(item['bytes'] for item in stats.values())
+        total_out = sum(item['compressed'] for item in stats.values())
+        for codec, item in sorted(stats.items()):
+            if codec == 'store' or not item['bytes']:
+                continue
+            speed = item['bytes'] / item['seconds'] / 1024 ** 2 if item['seconds'] else 0
+            self.logger.info(f"📉 {codec}: {self.format_size(item['bytes'])} → {self.format_size(item['compressed'])} "
+                             f"({item['compressed'] / item['bytes']:.1%}), время сжатия {item['seconds']:.1f} с, "
+                             f"{speed:.1f} МБ/с")
+        self.logger.info(f"💾 Сэкономлено места: {self.format_size(max(total_in - total_out, 0))}")
+
+        # Время, которое ушло бы на сжатие пропущенных файлов, - по скорости метода профиля в этом же запуске
+        skipped = sum(size for (codec, reason), (_, size) in decisions.items()
+                      if codec == 'store' and reason in ('type', 'sample'))
+        measured = stats.get(self.policy.codec)
+        if skipped and measured and measured['seconds']:
+            saved = skipped / (measured['bytes'] / measured['seconds'])
+            self.logger.info(f"⏱️  Без сжатия сохранено {self.format_size(skipped)} несжимаемых данных, "
+                             f"сэкономлено ~{saved:.1f} с процессорного времени")
+
+    def choose_profile(self):
+        """Выбор профиля сжатия"""
+        names = ', '.join(PROFILES)
+        while True:
+            profile = input(f"Профиль сжатия ({names}) [{self.policy.profile}]: ").strip().lower()
+            if not profile:
+                return
+            if profile in PROFILES:
+                self.policy = CompressionPolicy(profile, self.policy.rules)
+                return
+            print("❌ Неизвестный профиль! Попробуйте снова.")
+
+    def choose_volume_size(self):
+        """Размер тома в байтах или None - копия одним архивом"""
+        while True:
+            answer = input("Размер тома в МБ (Enter - одним архивом): ").strip()
+            if not answer:
+                return None
+            if answer.isdigit() and int(answer) * 1024 ** 2 >= MIN_VOLUME_SIZE:
+                return int(answer) * 1024 ** 2
+            print(f"❌ Укажите целое число не меньше {MIN_VOLUME_SIZE // 1024 ** 2}!")
+
+    def choose_restore_point(self, backup_dir=None):
+        """Выбор каталога копий и состояния для восстановления"""
+        while backup_dir is None:
+            backup_dir = input("Введите путь к папке с резервными копиями: ").strip()
+            if not os.path.isdir(backup_dir):
+                print("❌ Папка не существует или путь неверный! Попробуйте снова.")
+                backup_dir = None
+
+        chain = BackupChain(backup_dir)
+        backups = [(name, timestamp) for name, timestamp in chain.backups() if chain.load(name)]
+        if not backups:
+            print("❌ В папке нет резервных копий с описью!")
+            return None, None
+
+        print("\n📚 ДОСТУПНЫЕ РЕЗЕРВНЫЕ КОПИИ:")
+        for i, (name, timestamp) in enumerate(backups, 1):
+            manifest = chain.load(name)
+            print(f"{i:3}. {timestamp:%Y-%m-%d %H:%M:%S} - {name} ({BACKUP_TYPE_NAMES[manifest.backup_type]}, "
+                  f"файлов: {len(manifest.files)}, в архиве: {self.format_size(manifest.changed_size())})")
+
+        while True:
+            choice = input("\nНомер копии или момент времени (ГГГГММДД_ЧЧММСС): ").strip()
+            if choice.isdigit() and 1 <= int(choice) <= len(backups):
+                return chain, chain.load(backups[int(choice) - 1][0])
+            try:
+                point = datetime.datetime.strptime(choice, TIMESTAMP_FORMAT)
+            except ValueError:
+                print("❌ Неверный ввод! Попробуйте снова.")
+                continue
+
+            # Момент времени однозначен только в пределах цепочки одной папки
+            folders = sorted({parse_backup_name(name)[0] for name, _ in backups})
+            folder_name = folders[0]
+            if len(folders) > 1:
+                folder_name = input(f"Имя исходной папки ({', '.join(folders)}): ").strip()
+            manifest = BackupChain(backup_dir, folder_name).at(point)
+            if manifest is None:
+                print("❌ На этот момент резервных копий нет!")
+                continue
+            return chain, manifest
+
+    def restore(self):
+        """Восстановление состояния папки на выбранный момент"""
+        chain, manifest = self.choose_restore_point()
+        if manifest is None:
+            return
+
+        target_dir = input("Введите путь к папке для восстановления: ").strip()
+        os.makedirs(target_dir, exist_ok=True)
+        total_size = sum(entry['size'] for entry in manifest.files.values())
+        archives = sorted({entry['archive'] for entry in manifest.files.values()})
+        print(f"\n🔍 Восстановление {manifest.name}: файлов {len(manifest.files)}, "
+              f"{self.format_size(total_size)} из архивов: {len(archives)}")
+
+        processed = [0]
+
+        def progress(size):
+            processed[0] += size
+            percent = processed[0] / total_size * 100 if total_size else 100.0
+            print(f"\r♻️  Прогресс: {percent:.1f}% ({self.format_size(processed[0])} / {self.format_size(total_size)})",
+                  end="", flush=True)
+
+        self.logger.info(f"♻️  Начало восстановления {manifest.name} в {target_dir}")
+        restored, errors = chain.restore(manifest, target_dir, progress, self.workers)
+        print()
+        for error in errors:
+            self.logger.error(f"❌ Ошибка восстановления {error}")
+        self.logger.info(f"✅ Восстановлено файлов: {restored}, ошибок: {len(errors)}")
+        print(f"\n{'🎉' if not errors else '⚠️ '} Восстановлено файлов: {restored} из {len(manifest.files)}")
+
+    def verify_backup(self, backup_dir, manifest):
+        """Потоковая проверка CRC и SHA-256 всех томов копии; True, если ошибок нет"""
+        total_size = manifest.changed_size()
+        processed = [0]
+
+        def progress(size):
+            processed[0] += size
+            percent = processed[0] / total_size * 100 if total_size else 100.0
+            print(f"\r🔎 Проверка: {percent:.1f}% ({self.format_size(processed[0])} / {self.format_size(total_size)})",
+                  end="", flush=True)
+
+        self.logger.info(f"🔎 Проверка целостности {manifest.name} (томов: {len(manifest.volumes)})")
+        checked, size, errors = ArchiveVerifier(backup_dir, self.workers).verify(
+            manifest, progress if self.show_progress else None)
+        if self.show_progress:
+            print()
+        for error in errors:
+            self.logger.error(f"❌ Нарушена целостность: {error}")
+        self.logger.info(f"{'✅' if not errors else '⚠️ '} Проверено записей: {checked} "
+                         f"({self.format_size(size)}), ошибок: {len(errors)}")
+        return not errors
+
+    def verify(self):
+        """Проверка выбранной резервной копии"""
+        chain, manifest = self.choose_restore_point()
+        if manifest is None:
+            return
+        ok = self.verify_backup(chain.backup_dir, manifest)
+        print(f"\n{'🎉 Копия цела' if ok else '❌ Копия повреждена, подробности в backup.log'}")
+
+    def show_diff(self, diff):
+        """Вывод различий: списки добавленных, удаленных и измененных файлов"""
+        titles = (('added', '➕ Добавлено'), ('removed', '➖ Удалено'), ('modified', '✏️  Изменено'))
+        for key, title in titles:
+            print(f"\n{title}: {len(diff[key])}")
+            for path in diff[key][:DIFF_PREVIEW]:
+                print(f"   {path}")
+            if len(diff[key]) > DIFF_PREVIEW:
+                print(f"   ... и еще {len(diff[key]) - DIFF_PREVIEW}")
+        print(f"\n🟰 Без изменений: {diff['unchanged']}")
+
+    def diff(self):
+        """Сравнение копии с другой копией или с папкой - только по описям"""
+        chain, manifest = self.choose_restore_point()
+        if manifest is None:
+            return
+        target = input("Сравнить с (1) другой копией или (2) папкой? ").strip()
+        if target == '2':
+            source_dir = input("Введите путь к папке: ").strip()
+            if not os.path.isdir(source_dir):
+                print("❌ Папка не существует или путь неверный!")
+                return
+            print(f"\n🆚 {manifest.name} → {source_dir}")
+            self.show_diff(diff_with_snapshot(manifest, self.scan_source(source_dir)))
+            return
+        _, other = self.choose_restore_point(chain.backup_dir)
+        if other is None:
+            return
+        print(f"\n🆚 {manifest.name} → {other.name}")
+        self.show_diff(diff_manifests(manifest.files, other.files))
+
+    def search_and_restore(self):
+        """Поиск самых новых версий файлов по шаблону во всех копиях и их извлечение"""
+        while True:
+            backup_dir = input("Введите путь к папке с резервными копиями: ").strip()
+            if os.path.isdir(backup_dir):
+                break
+            print("❌ Папка не существует или путь неверный! Попробуйте снова.")
+
+        catalog = BackupCatalog(backup_dir, self.workers)
+        pattern = input("Путь или шаблон (например, docs/*.txt): ").strip()
+        found = catalog.search(pattern)
+        if not found:
+            print("❌ Ничего не найдено!")
+            return
+
+        print(f"\n🔍 НАЙДЕНО ФАЙЛОВ: {len(found)}")
+        for path, (name, row) in sorted(found.items())[:DIFF_PREVIEW]:
+            print(f"   {path} ({self.format_size(row[2])}) - {name}")
+        if len(found) > DIFF_PREVIEW:
+            print(f"   ... и еще {len(found) - DIFF_PREVIEW}")
+
+        if input("\nВосстановить самые новые версии? (y/n): ").lower() != 'y':
+            return
+        target_dir = input("Введите путь к папке для восстановления: ").strip()
+        os.makedirs(target_dir, exist_ok=True)
+        self.logger.info(f"♻️  Выборочное восстановление '{pattern}' из {backup_dir} в {target_dir}")
+        restored, errors = catalog.extract_latest(pattern, target_dir)
+        for error in errors:
+            self.logger.error(f"❌ Ошибка восстановления {error}")
+        self.logger.info(f"✅ Восстановлено файлов: {restored}, ошибок: {len(errors)}")
+        print(f"\n{'🎉' if not errors else '⚠️ '} Восстановлено файлов: {restored} из {len(found)}")
+
+    def backup_to_repository(self, source_dir, repository_dir, snapshot=None):
+        """Снимок папки в репозиторий с дедупликацией"""
+        repository = DedupRepository(repository_dir, self.workers)
+        files = snapshot if snapshot is not None else self.scan_source(source_dir)
+        total_size = files.total_size
+        processed = [0]
+
+        def progress(size):
+            processed[0] += size
+            percent = processed[0] / total_size * 100 if total_size else 100.0
+            print(f"\r🧩 Прогресс: {percent:.1f}% ({self.format_size(processed[0])} / {self.format_size(total_size)})",
+                  end="", flush=True)
+
+        self.logger.info(f"🚀 Начало снимка в репозиторий {repository_dir}: {source_dir}")
+        errors = []
+        snapshot, stats = repository.backup(files, self.get_folder_name(source_dir), progress, errors)
+        print()
+        for error in errors:
+            self.logger.error(f"❌ Ошибка при добавлении файла {error}")
+
+        chunk_count, chunk_bytes, stored_bytes = repository.usage()
+        self.logger.info(f"✅ Снимок создан: {snapshot}")
+        self.logger.info(f"📊 Файлов: {stats['files']} (без изменений: {stats['unchanged_files']}), "
+                         f"прочитано: {self.format_size(stats['read_bytes'])}, "
+                         f"новых чанков: {stats['new_chunks']} из {stats['chunks']}, "
+                         f"записано: {self.format_size(stats['stored_bytes'])}")
+        self.logger.info(f"💾 Репозиторий: чанков {chunk_count}, данных {self.format_size(chunk_bytes)}, "
+                         f"на диске {self.format_size(stored_bytes)}")
+        print(f"\n🎉 СНИМОК СОЗДАН: {snapshot}")
+        print(f"💾 Новых данных записано: {self.format_size(stats['stored_bytes'])} "
+              f"из {self.format_size(stats['bytes'])}")
+        return not errors
+
+    def restore_from_repository(self):
+        """Восстановление снимка из репозитория с дедупликацией"""
+        while True:
+            repository_dir = input("Введите путь к репозиторию: ").strip()
+            if os.path.isdir(os.path.join(repository_dir, 'snapshots')):
+                break
+            print("❌ Репозиторий не найден! Попробуйте снова.")
+
+        repository = DedupRepository(repository_dir, self.workers)
+        snapshots = repository.snapshots()
+        if not snapshots:
+            print("❌ В репозитории нет снимков!")
+            return
+
+        print("\n📚 СНИМКИ:")
+        for i, name in enumerate(snapshots, 1):
+            print(f"{i:3}. {name}")
+        while True:
+            choice = input("Номер снимка: ").strip()
+            if choice.isdigit() and 1 <= int(choice) <= len(snapshots):
+                snapshot = snapshots[int(choice) - 1]
+                break
+            print("❌ Неверный выбор! Попробуйте снова.")
+
+        target_dir = input("Введите путь к папке для восстановления: ").strip()
+        os.makedirs(target_dir, exist_ok=True)
+        self.logger.info(f"♻️  Начало восстановления снимка {snapshot} в {target_dir}")
+        restored, errors = repository.restore(snapshot, target_dir)
+        for error in errors:
+            self.logger.error(f"❌ Ошибка восстановления {error}")
+        self.logger.info(f"✅ Восстановлено файлов: {restored}, ошибок: {len(errors)}")
+        print(f"\n{'🎉' if not errors else '⚠️ '} Восстановлено файлов: {restored}")
+
     def run(self):
         """Основной метод запуска утилиты"""
         try:
+            action = self.get_action()
+            if action == 'restore':
+                self.restore()
+                return
+            if action == 'repository_restore':
+                self.restore_from_repository()
+                return
+            if action == 'verify':
+                self.verify()
+                return
+            if action == 'diff':
+                self.diff()
+                return
+            if action == 'search':
+                self.search_and_restore()
+                return
+
             source_dir, backup_dir = self.get_user_input()
-            backup_name = self.create_backup_name(source_dir)
-            backup_path = os.path.join(backup_dir, backup_name)
+            # Один проход по источнику: и для сводки, и для архивации
+            snapshot = self.scan_source(source_dir)
+            if action == 'repository':
+                self.backup_to_repository(source_dir, backup_dir, snapshot)
+                return
+            interrupted = self.find_resumable(source_dir, backup_dir)
+            if interrupted and input(f"\nНайдена прерванная копия {os.path.basename(interrupted)}. "
+                                     f"Продолжить ее? (y/n): ").lower() == 'y':
+                print("\n🔄 ПРОДОЛЖЕНИЕ РЕЗЕРВНОЙ КОПИИ...")
+                backup_path = interrupted
+                success = self.resume_backup(source_dir, backup_path, snapshot)
+            else:
+                backup_type, base = self.resolve_backup_type(source_dir, backup_dir, action)
+                self.choose_profile()
+                volume_size = self.choose_volume_size()
+                backup_name = self.create_backup_name(source_dir, backup_type)
+                backup_path = os.path.join(backup_dir, backup_name)
 
-            print(f"\n🔍 ИНФОРМАЦИЯ О РЕЗЕРВНОЙ КОПИИ:")
-            print(f"• Источник: {source_dir}")
-            print(f"• Назначение: {backup_path}")
-            print(f"• Размер исходных данных: {self.format_size(self.get_total_size(source_dir))}")
+                print(f"\n🔍 ИНФОРМАЦИЯ О РЕЗЕРВНОЙ КОПИИ:")
+                print(f"• Источник: {source_dir}")
+                print(f"• Назначение: {backup_path}")
+                print(f"• Тип: {BACKUP_TYPE_NAMES[backup_type]}" + (f" (база: {base.name})" if base else ""))
+                print(f"• Профиль сжатия: {self.policy.profile}")
+                if volume_size:
+                    print(f"• Размер тома: {self.format_size(volume_size)}")
+                print(f"• Размер исходных данных: {self.format_size(snapshot.total_size)} (файлов: {len(snapshot)})")
 
-            confirm = input("\nПродолжить создание резервной копии? (y/n): ").lower()
-            if confirm != 'y':
-                self.logger.info("❌ Операция отменена пользователем")
-                return
+                confirm = input("\nПродолжить создание резервной копии? (y/n): ").lower()
+                if confirm != 'y':
+                    self.logger.info("❌ Операция отменена пользователем")
+                    return
 
-            print("\n🔄 СОЗДАНИЕ РЕЗЕРВНОЙ КОПИИ...")
-            success = self.create_backup(source_dir, backup_path)
+                print("\n🔄 СОЗДАНИЕ РЕЗЕРВНОЙ КОПИИ...")
+                success = self.create_backup(source_dir, backup_path, backup_type, base, snapshot, volume_size)
 
             if success:
-                final_size = os.path.getsize(backup_path)
+                final_size = sum(os.path.getsize(path) for path in self.last_volumes)
                 self.logger.info(f"✅ Резервная копия успешно создана: {backup_path}")
                 self.logger.info(f"📊 Размер архива: {self.format_size(final_size)}")
 
                 print(f"\n🎉 РЕЗЕРВНАЯ КОПИЯ УСПЕШНО СОЗДАНА!")
                 print(f"📁 Файл: {backup_path}")
+                if len(self.last_volumes) > 1:
+                    print(f"🧩 Томов: {len(self.last_volumes)}")
                 print(f"💾 Размер: {self.format_size(final_size)}")
                 print(f"📝 Лог сохранен в: backup.log")
+
+                if input("\nПроверить целостность копии? (y/n): ").lower() == 'y':
+                    ok = self.verify_backup(backup_dir, self.last_manifest)
+                    print(f"{'🎉 Копия цела' if ok else '❌ Копия повреждена, подробности в backup.log'}")
             else:
                 self.logger.error("❌ Создание резервной копии завершилось с ошибками")
                 print("\n❌ Произошли ошибки при создании резервной копии. Проверьте backup.log для деталей.")
 
         except KeyboardInterrupt:
             self.logger.info("⚠️  Операция прервана пользователем")
-            print("\n⚠️  Операция прервана")
+            print("\n⚠️  Операция прервана (прерванную копию можно продолжить при следующем запуске)")
         except Exception as e:
             self.logger.error(f"❌ Непредвиденная ошибка: {e}")
             print(f"\n❌ Произошла ошибка: {e}")
@@ -0,0 +1,265 @@
+import os
+import re
+import json
+import zipfile
+import hashlib
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from parallel_zip import iter_entry_data, locate_entry
+
+MANIFEST_NAME = '.backup_manifest.json'
+MANIFEST_VERSION = 1
+HASH_BLOCK = 1024 * 1024
+BACKUP_TYPES = ('full', 'incremental', 'differential')
+TYPE_SUFFIXES = {'full': '', 'incremental': '_inc', 'differential': '_diff'}
+TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+BACKUP_NAME_PATTERN = re.compile(r'^backup_(?P<folder>.+)_(?P<timestamp>\d{8}_\d{6})(?:_inc|_diff)?\.zip$')
+
+
+def to_arcname(relative_path):
+    """Путь внутри архива всегда с прямыми слешами"""
+    return relative_path.replace(os.sep, '/')
+
+
+def parse_backup_name(backup_name):
+    """(папка, время создания) из имени архива или None"""
+    match = BACKUP_NAME_PATTERN.match(backup_name)
+    if not match:
+        return None
+    timestamp = datetime.datetime.strptime(match.group('timestamp'), TIMESTAMP_FORMAT)
+    return match.group('folder'), timestamp
+
+
+class Manifest:
+    """Опись резервной копии.
+
+    Для каждого файла источника на момент копирования хранится размер,
+    mtime, SHA-256 и имя архива, в котором лежит эта версия файла. Поэтому
+    опись любой копии цепочки описывает полное состояние папки, и для
+    восстановления достаточно одной описи, без обхода всей цепочки.
+    """
+
+    def __init__(self, name, backup_type='full', base=None, created=None, files=None, deleted=None, volumes=None):
+        self.name = name
+        self.backup_type = backup_type
+        self.base = base
+        self.created = created or datetime.datetime.now().strftime(TIMESTAMP_FORMAT)
+        self.files = files if files is not None else {}
+        self.deleted = deleted if deleted is not None else []
+        # Тома копии, разбитой на части; последний том носит имя самой копии
+        self.volumes = volumes if volumes is not None else [name]
+
+    def to_dict(self):
+        return {
+            'version': MANIFEST_VERSION,
+            'name': self.name,
+            'type': self.backup_type,
+            'base': self.base,
+            'created': self.created,
+            'files': self.files,
+            'deleted': self.deleted,
+            'volumes': self.volumes,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['name'], data['type'], data.get('base'), data.get('created'),
+                   data['files'], data.get('deleted', []), data.get('volumes'))
+
+    def to_bytes(self):
+        """Опись для записи последним элементом архива"""
+        return json.dumps(self.to_dict(), ensure_ascii=False).encode('utf-8')
+
+    @classmethod
+    def read_from(cls, archive_path):
+        """Чтение описи из архива; None для архивов без описи"""
+        try:
+            with zipfile.ZipFile(archive_path) as zipf:
+                with zipf.open(MANIFEST_NAME) as f:
+                    return cls.from_dict(json.load(f))
+        except (KeyError, zipfile.BadZipFile, OSError, ValueError):
+            return None
+
+    def changed_size(self):
+        """Объем файлов, сохраненных в самой этой копии (во всех ее томах)"""
+        volumes = set(self.volumes)
+        return sum(entry['size'] for entry in self.files.values() if entry['archive'] in volumes)
+
+
+class BackupChain:
+    """Цепочка копий одной папки в каталоге резервных копий"""
+
+    def __init__(self, backup_dir, folder_name=None):
+        self.backup_dir = backup_dir
+        self.folder_name = folder_name
+        self._manifests = {}
+
+    def backups(self):
+        """Имена архивов цепочки от старых к новым: [(имя, время создания)]"""
+        backups = []
+        for name in os.listdir(self.backup_dir):
+            parsed = parse_backup_name(name)
+            if parsed is None:
+                continue
+            folder, timestamp = parsed
+            if self.folder_name is None or folder == self.folder_name:
+                backups.append((timestamp, name))
+        backups.sort()
+        return [(name, timestamp) for timestamp, name in backups]
+
+    def load(self, name):
+        """Опись архива (с кэшированием)"""
+        if name not in self._manifests:
+            self._manifests[name] = Manifest.read_from(os.path.join(self.backup_dir, name))
+        return self._manifests[name]
+
+    def latest(self, backup_type=None):
+        """Последняя копия с описью (при заданном типе - только этого типа)"""
+        for name, _ in reversed(self.backups()):
+            manifest = self.load(name)
+            if manifest is not None and (backup_type is None or manifest.backup_type == backup_type):
+                return manifest
+        return None
+
+    def base_for(self, backup_type):
+        """Опись, относительно которой считаются изменения"""
+        if backup_type == 'incremental':
+            return self.latest()
+        if backup_type == 'differential':
+            return self.latest('full')
+        return None
+
+    def at(self, point):
+        """Состояние на момент времени: последняя копия, созданная не позже point"""
+        found = None
+        for name, timestamp in self.backups():
+            if timestamp > point:
+                break
+            if self.load(name) is not None:
+                found = name
+        return self.load(found) if found else None
+
+    def restore(self, manifest, target_dir, progress=None, workers=1):
+        """Восстановление состояния из описи в target_dir.
+
+        Файлы извлекаются по архивам, в которых лежат их версии, файлы,
+        разделенные между томами, собираются из частей; содержимое сверяется
+        с SHA-256 из описи. Запись с известным смещением ('offset' и
+        'compressed_size' из индекса копии) читается прямо с этого места,
+        без разбора центрального каталога архива. При workers > 1 файлы
+        извлекаются параллельно, у каждого потока свои открытые архивы.
+        Возвращает (число файлов, список ошибок).
+        """
+        local = threading.local()
+        opened = []
+        lock = threading.Lock()
+
+        def archive(name):
+            archives = getattr(local, 'archives', None)
+            if archives is None:
+                archives = local.archives = {}
+            if name not in archives:
+                try:
+                    archives[name] = zipfile.ZipFile(os.path.join(self.backup_dir, name))
+                except (OSError, zipfile.BadZipFile) as e:
+                    raise OSError(f"архив {name} недоступен ({e})")
+                with lock:
+                    opened.append(archives[name])
+            return archives[name]
+
+        def archive_file(name):
+            files = getattr(local, 'files', None)
+            if files is None:
+                files = local.files = {}
+            if name not in files:
+                try:
+                    files[name] = open(os.path.join(self.backup_dir, name), 'rb')
+                except OSError as e:
+                    raise OSError(f"архив {name} недоступен ({e})")
+                with lock:
+                    opened.append(files[name])
+            return files[name]
+
+        def extract(task):
+            path, entry = task
+            try:
+                if 'parts' in entry:
+                    self._extract_parts(path, entry, target_dir)
+                elif not ('offset' in entry and self._extract_at(archive_file(entry['archive']), path, entry,
+                                                                 target_dir)):
+                    self._extract(archive(entry['archive']), path, entry, target_dir)
+            except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+                return f"{path}: {e}"
+            return None
+
+        # По архивам, чтобы потоки читали архивы последовательно
+        tasks = sorted(manifest.files.items(), key=lambda item: (item[1]['archive'], item[0]))
+        restored = 0
+        errors = []
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                for (path, entry), error in zip(tasks, pool.map(extract, tasks)):
+                    if error:
+                        errors.append(error)
+                    else:
+                        restored += 1
+                    if progress:
+                        progress(entry['size'])
+        finally:
+            for archive_handle in opened:
+                archive_handle.close()
+        return restored, errors
+
+    @staticmethod
+    def _destination(path, target_dir):
+        destination = os.path.join(target_dir, *path.split('/'))
+        if not os.path.abspath(destination).startswith(os.path.abspath(target_dir) + os.sep):
+            raise ValueError("путь выходит за пределы папки восстановления")
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        return destination
+
+    @staticmethod
+    def _copy(src, dst, digest):
+        for block in iter(lambda: src.read(HASH_BLOCK), b''):
+            digest.update(block)
+            dst.write(block)
+
+    @staticmethod
+    def _check(destination, entry, digest):
+        if digest.hexdigest() != entry['sha256']:
+            raise ValueError("контрольная сумма не совпадает с описью")
+        mtime = entry['mtime_ns']
+        os.utime(destination, ns=(mtime, mtime))
+
+    def _extract(self, zipf, path, entry, target_dir):
+        destination = self._destination(path, target_dir)
+        digest = hashlib.sha256()
+        with zipf.open(path) as src, open(destination, 'wb') as dst:
+            self._copy(src, dst, digest)
+        self._check(destination, entry, digest)
+
+    def _extract_at(self, fileobj, path, entry, target_dir):
+        """Извлечение по смещению из индекса; False, если по смещению другая запись"""
+        method = locate_entry(fileobj, entry['offset'], path)
+        if method is None:
+            return False
+        destination = self._destination(path, target_dir)
+        digest = hashlib.sha256()
+        with open(destination, 'wb') as dst:
+            for block in iter_entry_data(fileobj, method, entry['compressed_size'], HASH_BLOCK):
+                digest.update(block)
+                dst.write(block)
+        self._check(destination, entry, digest)
+        return True
+
+    def _extract_parts(self, path, entry, target_dir):
+        """Сборка файла из частей в нескольких томах"""
+        destination = self._destination(path, target_dir)
+        digest = hashlib.sha256()
+        with open(destination, 'wb') as dst:
+            for volume, part_name in entry['parts']:
+                with zipfile.ZipFile(os.path.join(self.backup_dir, volume)) as zipf, zipf.open(part_name) as src:
+                    self._copy(src, dst, digest)
+        self._check(destination, entry, digest)
@@ -0,0 +1,122 @@
+import json
+import time
+import datetime
+import threading
+
+METRICS_FILE = 'backup_metrics.jsonl'
+MB = 1024 ** 2
+
+
+class BackupMetrics:
+    """Счетчики и таймеры этапов одной архивации.
+
+    Время делится на ввод-вывод (чтение источника, запись архива),
+    процессорную работу (хеширование в основном потоке, сжатие в пуле) и
+    ожидание основного потока, пока пул сжатия не освободится. Таймеры
+    снимаются раз на блок, поэтому накладные расходы ничтожны.
+    """
+
+    def __init__(self, backup_name, backup_type, scan_seconds=0.0):
+        self.backup_name = backup_name
+        self.backup_type = backup_type
+        self.created = datetime.datetime.now().isoformat(timespec='seconds')
+        self.scan_seconds = scan_seconds
+        self.started = time.perf_counter()
+        self.finished = None
+        self.files = 0
+        self.errors = 0
+        self.bytes_read = 0
+        self.status = 'running'
+        # BackupWriter: таймеры основного потока, статистика сжатия, записанный объем
+        self.writer = None
+
+    def file_done(self, size):
+        self.files += 1
+        self.bytes_read += size
+
+    def finish(self, status):
+        self.finished = time.perf_counter()
+        self.status = status
+
+    @property
+    def seconds(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def to_dict(self):
+        """Метрики запуска с производными скоростями"""
+        timings = dict(self.writer.timings) if self.writer else {}
+        # Копии: метрики читаются и из потока периодической статистики
+        stats = {codec: dict(item) for codec, item in list(self.writer.stats.items())} if self.writer else {}
+        written = self.writer.bytes_written if self.writer else 0
+        compress_seconds = sum(item['seconds'] for item in stats.values())
+        seconds = self.seconds
+        io_seconds = timings.get('read', 0.0) + timings.get('write', 0.0)
+        cpu_seconds = timings.get('hash', 0.0) + compress_seconds
+
+        def rate(value):
+            return round(value / seconds, 2) if seconds else 0.0
+
+        return {
+            'backup': self.backup_name,
+            'type': self.backup_type,
+            'created': self.created,
+            'status': self.status,
+            'seconds': round(seconds, 3),
+            'files': self.files,
+            'errors': self.errors,
+            'bytes_read': self.bytes_read,
+            'bytes_written': written,
+            'files_per_second': rate(self.files),
+            'read_mb_per_second': rate(self.bytes_read / MB),
+            'written_mb_per_second': rate(written / MB),
+            'compression_ratio': round(written / self.bytes_read, 4) if self.bytes_read else None,
+            'stages': {
+                'scan': round(self.scan_seconds, 3),
+                'read': round(timings.get('read', 0.0), 3),
+                'hash': round(timings.get('hash', 0.0), 3),
+                'compress_cpu': round(compress_seconds, 3),
+                'compress_wait': round(timings.get('wait', 0.0), 3),
+                'write': round(timings.get('write', 0.0), 3),
+            },
+            'io_seconds': round(io_seconds, 3),
+            'cpu_seconds': round(cpu_seconds, 3),
+            'codecs': stats,
+        }
+
+    def status_line(self):
+        """Краткая строка текущих скоростей"""
+        data = self.to_dict()
+        stages = data['stages']
+        return (f"📈 файлов {data['files']} ({data['files_per_second']}/с), чтение {data['read_mb_per_second']} МБ/с, "
+                f"запись {data['written_mb_per_second']} МБ/с, ввод-вывод {data['io_seconds']:.1f} с, "
+                f"ЦП {data['cpu_seconds']:.1f} с, ожидание сжатия {stages['compress_wait']:.1f} с")
+
+    def save(self, path=METRICS_FILE):
+        """Дописать метрики запуска строкой JSON в файл метрик"""
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.to_dict(), ensure_ascii=False) + '\n')
+
+
+class StatsReporter:
+    """Периодический вывод строки статистики во время архивации"""
+
+    def __init__(self, metrics, interval, output):
+        self.metrics = metrics
+        self.interval = interval
+        self.output = output
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.output(self.metrics.status_line())
+
+    def __enter__(self):
+        if self.interval:
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
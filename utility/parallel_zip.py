@@ -0,0 +1,533 @@
+import os
+import bz2
+import lzma
+import stat
+import time
+import zlib
+import struct
+import hashlib
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+BLOCK_SIZE = 1024 * 1024
+# Окно deflate: столько данных предыдущего блока служит словарем следующему
+WINDOW_SIZE = 32 * 1024
+DEFAULT_LEVEL = zlib.Z_DEFAULT_COMPRESSION
+ZIP64_LIMIT = (1 << 31) - 1
+MAX_UINT32 = 0xFFFFFFFF
+MAX_ENTRIES = 0xFFFF
+
+FLAG_LZMA_EOS = 0x02
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+METHOD_BZIP2 = 12
+METHOD_LZMA = 14
+CODECS = {'store': METHOD_STORED, 'deflate': METHOD_DEFLATED, 'bzip2': METHOD_BZIP2, 'lzma': METHOD_LZMA}
+# Минимальная версия формата ZIP, нужная для распаковки
+METHOD_VERSIONS = {METHOD_STORED: 10, METHOD_DEFLATED: 20, METHOD_BZIP2: 46, METHOD_LZMA: 63}
+# Словарь LZMA по уровням 0-9, как у пресетов xz
+LZMA_DICT_SIZES = [1 << 18, 1 << 20, 1 << 21, 1 << 22, 1 << 22, 1 << 23, 1 << 23, 1 << 24, 1 << 25, 1 << 26]
+UNIX_SYSTEM = 3
+DEFAULT_MODE = stat.S_IFREG | 0o644
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+END_RECORD = struct.Struct('<IHHHHIIH')
+ZIP64_END_RECORD = struct.Struct('<IQHHIIQQQQ')
+ZIP64_LOCATOR = struct.Struct('<IIQI')
+DESCRIPTOR = struct.Struct('<IIII')
+ZIP64_DESCRIPTOR = struct.Struct('<IIQQ')
+ZIP64_LOCAL_EXTRA = struct.Struct('<HHQQ')
+
+LOCAL_SIGNATURE = 0x04034b50
+CENTRAL_SIGNATURE = 0x02014b50
+END_SIGNATURE = 0x06054b50
+ZIP64_END_SIGNATURE = 0x06064b50
+ZIP64_LOCATOR_SIGNATURE = 0x07064b50
+DESCRIPTOR_SIGNATURE = 0x08074b50
+
+
+class ArchiveWriteError(Exception):
+    """Ошибка записи самого архива (в отличие от ошибки чтения файла)"""
+
+
+def dos_datetime(mtime):
+    """Время изменения в формате DOS (время, дата)"""
+    year, month, day, hour, minute, second = time.localtime(mtime)[:6]
+    if year < 1980:
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+def compress_block(data, level, zdict, final):
+    """Сжатие блока в «сырой» поток deflate.
+
+    Непоследний блок завершается Z_SYNC_FLUSH (выравнивание на границу
+    байта без признака конца потока), поэтому сжатые блоки файла можно
+    просто склеить. Хвост предыдущего блока передается как словарь, и
+    ссылки назад работают через границу блоков почти как при сжатии
+    файла целиком. zlib отпускает GIL, поэтому хватает пула потоков.
+    """
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class LZMAStream:
+    """Потоковое сжатие LZMA в формате записи ZIP (метод 14).
+
+    Перед «сырым» потоком LZMA1 пишется заголовок: версия, длина и сами
+    свойства фильтра (lc/lp/pb и размер словаря).
+    """
+
+    def __init__(self, level):
+        level = 6 if level is None or level < 0 else min(level, 9)
+        dict_size = LZMA_DICT_SIZES[level]
+        self.compressor = lzma.LZMACompressor(lzma.FORMAT_RAW, filters=[{
+            'id': lzma.FILTER_LZMA1, 'preset': level, 'dict_size': dict_size, 'lc': 3, 'lp': 0, 'pb': 2,
+        }])
+        properties = bytes([(2 * 5 + 0) * 9 + 3]) + dict_size.to_bytes(4, 'little')
+        self.header = struct.pack('<BBH', 9, 4, len(properties)) + properties
+
+    def compress(self, data):
+        header, self.header = self.header, b''
+        return header + self.compressor.compress(data)
+
+    def flush(self):
+        return self.header + self.compressor.flush()
+
+
+def stream_compressor(codec, level):
+    """Последовательный компрессор для методов, чьи блоки нельзя сжимать независимо"""
+    if codec == 'bzip2':
+        return bz2.BZ2Compressor(9 if level is None or level < 1 else min(level, 9))
+    return LZMAStream(level)
+
+
+def compress_sequential(previous, compressor, data, final):
+    """Работа потока для bzip2/lzma: блоки файла идут через один компрессор по очереди.
+
+    Задачи пула выполняются в порядке постановки, поэтому предыдущий блок
+    к этому моменту уже взят в работу и ожидание не блокирует пул.
+    """
+    if previous is not None:
+        previous.result()
+    started = time.perf_counter()
+    output = compressor.compress(data)
+    if final:
+        output += compressor.flush()
+    return output, time.perf_counter() - started
+
+
+def timed_compress_block(data, level, zdict, final):
+    started = time.perf_counter()
+    output = compress_block(data, level, zdict, final)
+    return output, time.perf_counter() - started
+
+
+class ZipEntry:
+    """Запись архива: метаданные, контрольная сумма и размеры"""
+
+    def __init__(self, arcname, mtime, size_hint=0, mode=DEFAULT_MODE, method=METHOD_DEFLATED):
+        self.arcname = arcname
+        self.name = arcname.encode('utf-8')
+        self.mtime = mtime
+        self.mode = mode
+        self.method = method
+        self.flags = 0 if arcname.isascii() else FLAG_UTF8
+        if method == METHOD_LZMA:
+            self.flags |= FLAG_LZMA_EOS
+        # Как и zipfile, заранее решаем по размеру, нужен ли ZIP64
+        self.zip64 = size_hint * 1.05 > ZIP64_LIMIT
+        self.crc = 0
+        self.size = 0
+        self.compressed_size = 0
+        self.offset = 0
+
+    STATE = ('mtime', 'mode', 'method', 'flags', 'zip64', 'crc', 'size', 'compressed_size', 'offset')
+
+    def to_dict(self):
+        """Состояние завершенной записи для журнала"""
+        data = {'arcname': self.arcname}
+        data.update((key, getattr(self, key)) for key in self.STATE)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        entry = cls(data['arcname'], data['mtime'])
+        for key in cls.STATE:
+            setattr(entry, key, data[key])
+        return entry
+
+
+class ZipWriter:
+    """Запись ZIP-архива из уже сжатых данных.
+
+    В файл с произвольным доступом заголовок записи переписывается после
+    данных; в несекуемый поток (канал, stdout) размеры и CRC идут в
+    дескрипторе данных после записи. Записи, центральный каталог и
+    ZIP64-структуры пишутся в порядке добавления.
+    """
+
+    def __init__(self, fileobj, entries=None):
+        self.fp = fileobj
+        try:
+            self.position = fileobj.tell()
+            self.seekable = fileobj.seekable()
+        except (AttributeError, OSError):
+            self.position = 0
+            self.seekable = False
+        # Записи, уже лежащие в файле (продолжение прерванного архива)
+        self.entries = list(entries or [])
+
+    def _write(self, data):
+        self.fp.write(data)
+        self.position += len(data)
+
+    def _local_header(self, entry):
+        extra = b''
+        size, compressed_size = entry.size, entry.compressed_size
+        if entry.zip64:
+            extra = ZIP64_LOCAL_EXTRA.pack(1, 16, size, compressed_size)
+            size = compressed_size = MAX_UINT32
+        dos_time, dos_date = dos_datetime(entry.mtime)
+        version = max(METHOD_VERSIONS[entry.method], 45 if entry.zip64 else 0)
+        return LOCAL_HEADER.pack(
+            LOCAL_SIGNATURE, version, entry.flags, entry.method, dos_time, dos_date,
+            entry.crc, compressed_size, size, len(entry.name), len(extra)
+        ) + entry.name + extra
+
+    def begin(self, entry):
+        """Начало записи: локальный заголовок"""
+        if not self.seekable:
+            entry.flags |= FLAG_DATA_DESCRIPTOR
+        entry.offset = self.position
+        self._write(self._local_header(entry))
+
+    def write(self, entry, data):
+        """Очередная порция сжатых данных записи"""
+        entry.compressed_size += len(data)
+        self._write(data)
+
+    def finish(self, entry):
+        """Завершение записи: размеры и CRC в заголовок или дескриптор"""
+        if not entry.zip64 and (entry.size > ZIP64_LIMIT or entry.compressed_size > ZIP64_LIMIT):
+            raise ArchiveWriteError(f"Файл {entry.arcname} вырос во время копирования сверх лимита без ZIP64")
+        if self.seekable:
+            end = self.position
+            self.fp.seek(entry.offset)
+            self.fp.write(self._local_header(entry))
+            self.fp.seek(end)
+        elif entry.zip64:
+            self._write(ZIP64_DESCRIPTOR.pack(DESCRIPTOR_SIGNATURE, entry.crc, entry.compressed_size, entry.size))
+        else:
+            self._write(DESCRIPTOR.pack(DESCRIPTOR_SIGNATURE, entry.crc, entry.compressed_size, entry.size))
+        self.entries.append(entry)
+
+    def _central_header(self, entry):
+        size, compressed_size, offset = entry.size, entry.compressed_size, entry.offset
+        fields = []
+        if size > ZIP64_LIMIT:
+            fields.append(size)
+            size = MAX_UINT32
+        if compressed_size > ZIP64_LIMIT:
+            fields.append(compressed_size)
+            compressed_size = MAX_UINT32
+        if offset > ZIP64_LIMIT:
+            fields.append(offset)
+            offset = MAX_UINT32
+        extra = struct.pack(f'<HH{len(fields)}Q', 1, 8 * len(fields), *fields) if fields else b''
+        version = max(METHOD_VERSIONS[entry.method], 45 if fields or entry.zip64 else 0)
+        dos_time, dos_date = dos_datetime(entry.mtime)
+        return CENTRAL_HEADER.pack(
+            CENTRAL_SIGNATURE, (UNIX_SYSTEM << 8) | version, version, entry.flags, entry.method,
+            dos_time, dos_date, entry.crc, compressed_size, size, len(entry.name), len(extra), 0, 0, 0,
+            (entry.mode & 0xFFFF) << 16, offset
+        ) + entry.name + extra
+
+    def close(self):
+        """Центральный каталог и завершающие записи"""
+        start = self.position
+        for entry in self.entries:
+            self._write(self._central_header(entry))
+        size = self.position - start
+        count = len(self.entries)
+
+        if count > MAX_ENTRIES or start > ZIP64_LIMIT or size > ZIP64_LIMIT:
+            zip64_end = self.position
+            self._write(ZIP64_END_RECORD.pack(
+                ZIP64_END_SIGNATURE, ZIP64_END_RECORD.size - 12, 45, 45, 0, 0, count, count, size, start))
+            self._write(ZIP64_LOCATOR.pack(ZIP64_LOCATOR_SIGNATURE, 0, zip64_end, 1))
+            count = min(count, MAX_ENTRIES)
+            size = min(size, MAX_UINT32)
+            start = min(start, MAX_UINT32)
+        self._write(END_RECORD.pack(END_SIGNATURE, 0, 0, count, count, size, start, 0))
+        self.fp.flush()
+
+
+class _EntryEncoder:
+    """Состояние сжатия одной записи"""
+
+    def __init__(self, entry, codec, level):
+        self.entry = entry
+        self.codec = codec
+        self.level = level
+        self.window = b''
+        self.stream = stream_compressor(codec, level) if codec in ('bzip2', 'lzma') else None
+        self.last = None
+
+    def submit(self, pool, data, final):
+        if self.codec == 'store':
+            future = Future()
+            future.set_result((data, 0.0))
+        elif self.codec == 'deflate':
+            future = pool.submit(timed_compress_block, data, self.level, self.window, final)
+            self.window = data[-WINDOW_SIZE:] if data else self.window
+        else:
+            future = pool.submit(compress_sequential, self.last, self.stream, data, final)
+            self.last = future
+        return future
+
+
+class ParallelCompressor:
+    """Параллельное сжатие файлов в ZIP с детерминированным порядком.
+
+    Основной поток читает файлы блоками, считает CRC-32 и SHA-256 и
+    отдает блоки на сжатие в пул потоков; готовые блоки пишутся в архив
+    строго в порядке чтения. Число блоков в работе ограничено, поэтому
+    память не зависит от размера файлов. Блоки deflate сжимаются
+    независимо; bzip2 и lzma сжимают файл последовательно, и параллельно
+    идут уже разные файлы. Метод и уровень задаются для каждого файла.
+    """
+
+    def __init__(self, writer, workers=None, level=DEFAULT_LEVEL, block_size=BLOCK_SIZE, max_pending=None,
+                 throttle=None):
+        self.writer = writer
+        self.workers = workers or os.cpu_count() or 1
+        self.level = level
+        self.block_size = block_size
+        self.max_pending = max_pending or 2 * self.workers
+        # Ограничение скорости чтения: вызывается с размером каждого прочитанного блока
+        self.throttle = throttle
+        self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        # Очередь действий: ('begin', запись), ('data', запись, future), ('finish', запись)
+        self._queue = deque()
+        self._pending = 0
+        # Несжатый объем блоков, еще не записанных в архив
+        self.pending_bytes = 0
+        self._encoders = {}
+        # По методам: файлы, исходный и сжатый объем, время сжатия в потоках
+        self.stats = {}
+        # Время основного потока: чтение и запись (ввод-вывод), хеширование,
+        # ожидание сжатия (потоки сжатия не успевают)
+        self.timings = {'read': 0.0, 'hash': 0.0, 'wait': 0.0, 'write': 0.0}
+
+    def _submit(self, entry, data, final):
+        future = self._encoders[entry].submit(self.pool, data, final)
+        started = time.perf_counter()
+        entry.crc = zlib.crc32(data, entry.crc)
+        self.timings['hash'] += time.perf_counter() - started
+        entry.size += len(data)
+        self._queue.append(('data', entry, future, len(data)))
+        self._pending += 1
+        self.pending_bytes += len(data)
+        self._drain(self.max_pending)
+
+    def _drain(self, limit):
+        """Запись готовых блоков по порядку; ждем, пока в работе больше limit блоков"""
+        queue = self._queue
+        while queue:
+            action, entry = queue[0][0], queue[0][1]
+            if action == 'data':
+                future = queue[0][2]
+                if self._pending <= limit and not future.done():
+                    break
+                started = time.perf_counter()
+                data, seconds = future.result()
+                self.timings['wait'] += time.perf_counter() - started
+                self._codec_stats(entry)['seconds'] += seconds
+            started = time.perf_counter()
+            try:
+                if action == 'data':
+                    self.writer.write(entry, data)
+                    self._pending -= 1
+                    self.pending_bytes -= queue[0][3]
+                elif action == 'begin':
+                    self.writer.begin(entry)
+                else:
+                    self.writer.finish(entry)
+                    self._finish_stats(entry)
+            except OSError as e:
+                raise ArchiveWriteError(f"Ошибка записи архива: {e}") from e
+            self.timings['write'] += time.perf_counter() - started
+            queue.popleft()
+
+    def _codec_stats(self, entry):
+        codec = self._encoders[entry].codec
+        return self.stats.setdefault(codec, {'files': 0, 'bytes': 0, 'compressed': 0, 'seconds': 0.0})
+
+    def _finish_stats(self, entry):
+        stats = self._codec_stats(entry)
+        stats['files'] += 1
+        stats['bytes'] += entry.size
+        stats['compressed'] += entry.compressed_size
+        del self._encoders[entry]
+
+    def _start(self, entry, codec, level):
+        self._encoders[entry] = _EntryEncoder(entry, codec, self.level if level is None else level)
+        self._queue.append(('begin', entry))
+
+    def add_file(self, file_path, arcname, size_hint=0, mtime=None, codec='deflate', level=None,
+                 offset=0, length=None, digest=None):
+        """Добавление файла или его части [offset, offset + length).
+
+        Возвращает (запись, SHA-256 добавленных данных); внешний digest,
+        если передан, дополнительно обновляется теми же данными.
+        """
+        part_digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            info = os.fstat(f.fileno())
+            entry = ZipEntry(arcname, info.st_mtime if mtime is None else mtime,
+                             length if length is not None else size_hint or info.st_size, info.st_mode, CODECS[codec])
+            self._start(entry, codec, level)
+            remaining = length
+            if offset:
+                f.seek(offset)
+
+            def read():
+                nonlocal remaining
+                started = time.perf_counter()
+                if remaining is None:
+                    data = f.read(self.block_size)
+                else:
+                    data = f.read(min(self.block_size, remaining))
+                    remaining -= len(data)
+                if self.throttle is not None:
+                    self.throttle(len(data))
+                self.timings['read'] += time.perf_counter() - started
+                return data
+
+            try:
+                block = read()
+                while True:
+                    following = read() if len(block) == self.block_size else b''
+                    started = time.perf_counter()
+                    part_digest.update(block)
+                    if digest is not None:
+                        digest.update(block)
+                    self.timings['hash'] += time.perf_counter() - started
+                    self._submit(entry, block, final=not following)
+                    if not following:
+                        break
+                    block = following
+            except OSError:
+                self._abandon(entry)
+                raise
+        self._queue.append(('finish', entry))
+        return entry, part_digest.hexdigest()
+
+    def _abandon(self, entry):
+        """Отказ от записи после ошибки чтения"""
+        if any(item[0] == 'begin' and item[1] is entry for item in self._queue):
+            # Заголовок еще не записан - просто убираем блоки файла из очереди
+            for item in [item for item in self._queue if item[1] is entry]:
+                self._queue.remove(item)
+                if item[0] == 'data':
+                    item[2].cancel()
+                    self._pending -= 1
+                    self.pending_bytes -= item[3]
+            del self._encoders[entry]
+            return
+        # Часть данных уже в архиве - закрываем поток сжатия на прочитанном
+        self._submit(entry, b'', final=True)
+        self._queue.append(('finish', entry))
+
+    def add_bytes(self, arcname, data, mtime=None, codec='deflate', level=None):
+        """Добавление записи из памяти"""
+        entry = ZipEntry(arcname, time.time() if mtime is None else mtime, len(data), method=CODECS[codec])
+        self._start(entry, codec, level)
+        self._submit(entry, data, final=True)
+        self._queue.append(('finish', entry))
+        return entry
+
+    def flush(self):
+        """Дождаться записи всех блоков: после этого writer.position точен"""
+        self._drain(0)
+
+    def switch_writer(self, writer):
+        """Завершить текущий архив и продолжить в новом (следующий том)"""
+        self._drain(0)
+        self.writer.close()
+        self.writer = writer
+
+    def close(self):
+        """Дописать все блоки, центральный каталог и остановить пул"""
+        try:
+            self._drain(0)
+            self.writer.close()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.pool.shutdown(cancel_futures=True)
+
+
+def _decompressor(method):
+    if method == METHOD_DEFLATED:
+        return zlib.decompressobj(-zlib.MAX_WBITS)
+    if method == METHOD_BZIP2:
+        return bz2.BZ2Decompressor()
+    if method == METHOD_LZMA:
+        # Разбирает заголовок LZMA записи ZIP (версия и свойства фильтра)
+        return zipfile.LZMADecompressor()
+    raise ValueError(f"неподдерживаемый метод сжатия {method}")
+
+
+
+def locate_entry(fileobj, offset, arcname):
+    """Переход к данным записи по смещению ее локального заголовка.
+
+    Центральный каталог не читается, поэтому извлечение одного файла из
+    большого архива не зависит от числа записей в нем. Возвращает метод
+    сжатия или None, если по смещению лежит не эта запись.
+    """
+    fileobj.seek(offset)
+    header = fileobj.read(LOCAL_HEADER.size)
+    if len(header) < LOCAL_HEADER.size:
+        return None
+    signature, _, _, method, _, _, _, _, _, name_length, extra_length = LOCAL_HEADER.unpack(header)
+    if signature != LOCAL_SIGNATURE or fileobj.read(name_length) != arcname.encode('utf-8'):
+        return None
+    fileobj.seek(extra_length, os.SEEK_CUR)
+    return method
+
+
+def iter_entry_data(fileobj, method, compressed_size, block_size=BLOCK_SIZE):
+    """Распакованное содержимое записи, к данным которой перешел locate_entry"""
+    decompressor = None if method == METHOD_STORED else _decompressor(method)
+    remaining = compressed_size
+    while remaining:
+        block = fileobj.read(min(block_size, remaining))
+        if not block:
+            raise ValueError("запись архива обрезана")
+        remaining -= len(block)
+        if decompressor is None:
+            yield block
+            continue
+        try:
+            yield decompressor.decompress(block)
+        except (zlib.error, lzma.LZMAError, OSError) as e:
+            raise ValueError(f"данные записи повреждены ({e})")
+    if hasattr(decompressor, 'flush'):
+        yield decompressor.flush()
@@ -0,0 +1,373 @@
+import os
+import json
+import gzip
+import zlib
+import sqlite3
+import contextlib
+import hashlib
+import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from manifest import TIMESTAMP_FORMAT
+
+REPOSITORY_VERSION = 1
+MIN_CHUNK = 512 * 1024
+MAX_CHUNK = 8 * 1024 * 1024
+# Граница ставится, где последние CUT_BITS битов совпали с образцом:
+# в среднем раз в 2**20 байт после минимального размера
+CUT_BITS = 20
+SCAN_STEP = 1024 * 1024
+READ_SIZE = 4 * 1024 * 1024
+PACK_SIZE = 16 * 1024 * 1024
+COMPRESSION_LEVEL = 6
+CHUNKER_SEED = b'backup-utility-cdc-v1'
+
+
+def _seed_bits(label, count):
+    """Детерминированная последовательность битов 0/1 из семени разбиения"""
+    bits = bytearray()
+    counter = 0
+    while len(bits) < count:
+        digest = hashlib.sha256(CHUNKER_SEED + label + counter.to_bytes(4, 'little')).digest()
+        bits.extend(byte & 1 for byte in digest)
+        counter += 1
+    return bytes(bits[:count])
+
+
+# Скользящий хэш считается для всего отрезка сразу, без цикла по байтам:
+# отрезок как большое число умножается на 64-битную константу, и каждый байт
+# произведения перемешивает MIX_BYTES предыдущих байтов данных. Затем каждый
+# байт дает один бит по таблице, и граница - там, где последние CUT_BITS
+# битов совпали с образцом. Все шаги (умножение, translate, find) идут в C
+MIX = 0x9E3779B97F4A7C15
+MIX_BYTES = 8
+BIT_TABLE = _seed_bits(b'table', 256)
+CUT_PATTERN = _seed_bits(b'pattern', CUT_BITS)
+
+
+def find_cut(buffer):
+    """Длина первого чанка в buffer (буфер содержит не меньше MAX_CHUNK байт или весь остаток)"""
+    length = len(buffer)
+    if length <= MIN_CHUNK:
+        return length
+    limit = min(length, MAX_CHUNK)
+    # Окно хэша - MIX_BYTES + CUT_BITS байт, отрезки перекрываются на его длину
+    start = MIN_CHUNK - CUT_BITS - MIX_BYTES
+    while True:
+        end = min(start + SCAN_STEP, limit)
+        segment = bytes(buffer[start:end])
+        mixed = (int.from_bytes(segment, 'little') * MIX).to_bytes(len(segment) + MIX_BYTES, 'little')
+        # Первые MIX_BYTES байтов отрезка перемешаны не полностью - их пропускаем
+        position = mixed[:len(segment)].translate(BIT_TABLE).find(CUT_PATTERN, MIX_BYTES)
+        if position >= 0:
+            return start + position + CUT_BITS
+        if end == limit:
+            return limit
+        start = end - CUT_BITS - MIX_BYTES + 1
+
+
+def iter_chunks(f):
+    """Разбиение потока на чанки, границы которых определяются содержимым"""
+    buffer = bytearray()
+    eof = False
+    while True:
+        while not eof and len(buffer) < MAX_CHUNK:
+            block = f.read(READ_SIZE)
+            if block:
+                buffer += block
+            else:
+                eof = True
+        if not buffer:
+            return
+        cut = find_cut(buffer)
+        yield bytes(buffer[:cut])
+        del buffer[:cut]
+
+
+def prepare_chunk(data, known):
+    """Работа потока: (SHA-256, сжатые данные, флаг сжатия); для известных чанков данные не сжимаются"""
+    digest = hashlib.sha256(data).digest()
+    if digest in known:
+        return digest, None, False
+    compressed = zlib.compress(data, COMPRESSION_LEVEL)
+    if len(compressed) < len(data):
+        return digest, compressed, True
+    return digest, data, False
+
+
+def _snapshot_key(name):
+    """Ключ сортировки снимков <дата>_<время>[.номер]_<источник>.json.gz"""
+    date, stamp, _ = name.split('_', 2)
+    stamp, _, number = stamp.partition('.')
+    return date, stamp, int(number or 0)
+
+
+class DedupRepository:
+    """Репозиторий резервных копий с дедупликацией (в духе restic/borg).
+
+    Файлы режутся на чанки с границами по содержимому, каждый чанк
+    хранится один раз в pack-файлах и адресуется своим SHA-256. Индекс
+    чанков (pack, смещение, длина) лежит в SQLite, а резервная копия -
+    это небольшой снимок: список файлов и их чанков. Поэтому хранилище
+    растет только на объем действительно новых данных.
+    """
+
+    def __init__(self, repository_dir, workers=None):
+        self.repository_dir = repository_dir
+        self.workers = workers or os.cpu_count() or 1
+        for folder in ('packs', 'snapshots'):
+            os.makedirs(os.path.join(repository_dir, folder), exist_ok=True)
+        self._check_config()
+        self.db_path = os.path.join(repository_dir, 'index.db')
+        self.init_database()
+
+    def _check_config(self):
+        """Параметры разбиения фиксируются при создании: с другими чанки не совпадут"""
+        path = os.path.join(self.repository_dir, 'config.json')
+        config = {'version': REPOSITORY_VERSION, 'min_chunk': MIN_CHUNK, 'max_chunk': MAX_CHUNK,
+                  'cut_bits': CUT_BITS, 'seed': CHUNKER_SEED.decode('ascii')}
+        if not os.path.exists(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(config, f, indent=2)
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            existing = json.load(f)
+        if existing != config:
+            raise ValueError(f"Репозиторий {self.repository_dir} создан с другими параметрами: {existing}")
+
+    def init_database(self):
+        """Инициализация индекса чанков"""
+        with contextlib.closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS chunks (
+                    hash BLOB PRIMARY KEY,
+                    pack TEXT NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    compressed INTEGER NOT NULL
+                ) WITHOUT ROWID
+            ''')
+
+    def _pack_path(self, pack):
+        return os.path.join(self.repository_dir, 'packs', pack[:2], f"{pack}.pack")
+
+    # ---- снимки ----
+
+    def snapshots(self, source_name=None):
+        """Снимки от старых к новым: список имен файлов снимков"""
+        names = sorted((name for name in os.listdir(os.path.join(self.repository_dir, 'snapshots'))
+                        if name.endswith('.json.gz')), key=_snapshot_key)
+        if source_name is not None:
+            names = [name for name in names if name.split('_', 2)[2][:-len('.json.gz')] == source_name]
+        return names
+
+    def load_snapshot(self, name):
+        with gzip.open(os.path.join(self.repository_dir, 'snapshots', name), 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_snapshot(self, snapshot):
+        number = 0
+        while True:
+            stamp = f"{snapshot['created']}.{number}" if number else snapshot['created']
+            name = f"{stamp}_{snapshot['source']}.json.gz"
+            path = os.path.join(self.repository_dir, 'snapshots', name)
+            if not os.path.exists(path):
+                break
+            number += 1
+        with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+        return name
+
+    # ---- запись ----
+
+    def backup(self, files, source_name, progress=None, errors=None):
+        """Снимок набора файлов [(путь в архиве, полный путь, размер, mtime в нс)].
+
+        Файлы с тем же размером и mtime, что в предыдущем снимке источника,
+        не читаются - их списки чанков переносятся. Возвращает (имя снимка,
+        статистика).
+        """
+        previous_names = self.snapshots(source_name)
+        previous = self.load_snapshot(previous_names[-1])['files'] if previous_names else {}
+        with contextlib.closing(sqlite3.connect(self.db_path)) as conn, conn:
+            known = {row[0] for row in conn.execute('SELECT hash FROM chunks')}
+
+        session = _BackupSession(self, known)
+        snapshot_files = {}
+        stats = {'files': 0, 'unchanged_files': 0, 'bytes': 0, 'read_bytes': 0}
+        try:
+            for arcname, file_path, size, mtime_ns in files:
+                entry = previous.get(arcname)
+                if entry and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+                    snapshot_files[arcname] = entry
+                    stats['unchanged_files'] += 1
+                else:
+                    try:
+                        chunks, size = session.add_file(file_path)
+                    except OSError as e:
+                        if errors is not None:
+                            errors.append(f"{file_path}: {e}")
+                        continue
+                    snapshot_files[arcname] = {'size': size, 'mtime_ns': mtime_ns, 'chunks': chunks}
+                    stats['read_bytes'] += size
+                stats['files'] += 1
+                stats['bytes'] += size
+                if progress:
+                    progress(size)
+            session.close()
+        finally:
+            session.shutdown()
+
+        stats.update(session.stats)
+        snapshot = {
+            'version': REPOSITORY_VERSION,
+            'source': source_name,
+            'created': datetime.datetime.now().strftime(TIMESTAMP_FORMAT),
+            'files': snapshot_files,
+            'stats': stats,
+        }
+        return self._save_snapshot(snapshot), stats
+
+    # ---- чтение ----
+
+    def restore(self, snapshot_name, target_dir, progress=None):
+        """Восстановление снимка в target_dir; возвращает (число файлов, список ошибок)"""
+        snapshot = self.load_snapshot(snapshot_name)
+        restored = 0
+        errors = []
+        packs = {}
+        try:
+            with contextlib.closing(sqlite3.connect(self.db_path)) as conn, conn:
+                for path, entry in sorted(snapshot['files'].items()):
+                    try:
+                        self._restore_file(conn, packs, path, entry, target_dir)
+                        restored += 1
+                    except (OSError, ValueError, zlib.error) as e:
+                        errors.append(f"{path}: {e}")
+                    if progress:
+                        progress(entry['size'])
+        finally:
+            for pack_file in packs.values():
+                pack_file.close()
+        return restored, errors
+
+    def _restore_file(self, conn, packs, path, entry, target_dir):
+        destination = os.path.join(target_dir, *path.split('/'))
+        if not os.path.abspath(destination).startswith(os.path.abspath(target_dir) + os.sep):
+            raise ValueError("путь выходит за пределы папки восстановления")
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+
+        with open(destination, 'wb') as dst:
+            for chunk_id in entry['chunks']:
+                dst.write(self.read_chunk(conn, packs, bytes.fromhex(chunk_id)))
+        os.utime(destination, ns=(entry['mtime_ns'], entry['mtime_ns']))
+
+    def read_chunk(self, conn, packs, digest):
+        """Чтение чанка из pack-файла с проверкой SHA-256"""
+        row = conn.execute('SELECT pack, offset, length, compressed FROM chunks WHERE hash = ?',
+                           (digest,)).fetchone()
+        if row is None:
+            raise ValueError(f"чанк {digest.hex()} отсутствует в индексе")
+        pack, offset, length, compressed = row
+        if pack not in packs:
+            packs[pack] = open(self._pack_path(pack), 'rb')
+        pack_file = packs[pack]
+        pack_file.seek(offset)
+        data = pack_file.read(length)
+        if compressed:
+            data = zlib.decompress(data)
+        if hashlib.sha256(data).digest() != digest:
+            raise ValueError(f"чанк {digest.hex()} поврежден")
+        return data
+
+    def usage(self):
+        """Сводка хранилища: (число чанков, объем чанков, объем в pack-файлах)"""
+        with contextlib.closing(sqlite3.connect(self.db_path)) as conn, conn:
+            count, size, length = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length), 0) FROM chunks').fetchone()
+        return count, size, length
+
+
+class _BackupSession:
+    """Запись новых чанков одного снимка в pack-файлы.
+
+    Хэширование и сжатие идут в пуле потоков, результаты обрабатываются
+    в порядке чтения. Строки индекса фиксируются после того, как pack
+    записан на диск, поэтому прерванная копия оставляет лишь лишний
+    pack-файл, но не битый индекс.
+    """
+
+    def __init__(self, repository, known):
+        self.repository = repository
+        self.known = known
+        self.pool = ThreadPoolExecutor(max_workers=repository.workers)
+        self.max_pending = 2 * repository.workers
+        self.pending = deque()
+        self.pack = None
+        self.pack_file = None
+        self.pack_rows = []
+        self.stats = {'chunks': 0, 'new_chunks': 0, 'new_bytes': 0, 'stored_bytes': 0}
+
+    def add_file(self, file_path):
+        """Разбиение файла; возвращает (список SHA-256 чанков, размер)"""
+        chunk_ids = []
+        size = 0
+        with open(file_path, 'rb') as f:
+            for data in iter_chunks(f):
+                self.pending.append((chunk_ids, len(data), self.pool.submit(prepare_chunk, data, self.known)))
+                size += len(data)
+                while len(self.pending) > self.max_pending:
+                    self._complete()
+        # Список чанков файла должен быть полным к моменту записи снимка
+        while self.pending and any(item[0] is chunk_ids for item in self.pending):
+            self._complete()
+        return chunk_ids, size
+
+    def _complete(self):
+        chunk_ids, size, future = self.pending.popleft()
+        digest, data, compressed = future.result()
+        chunk_ids.append(digest.hex())
+        self.stats['chunks'] += 1
+        if data is None or digest in self.known:
+            return
+        self._write(digest, data, size, compressed)
+
+    def _write(self, digest, data, size, compressed):
+        if self.pack_file is None:
+            self.pack = os.urandom(16).hex()
+            os.makedirs(os.path.dirname(self.repository._pack_path(self.pack)), exist_ok=True)
+            self.pack_file = open(self.repository._pack_path(self.pack), 'wb')
+        offset = self.pack_file.tell()
+        self.pack_file.write(data)
+        self.pack_rows.append((digest, self.pack, offset, len(data), size, int(compressed)))
+        self.known.add(digest)
+        self.stats['new_chunks'] += 1
+        self.stats['new_bytes'] += size
+        self.stats['stored_bytes'] += len(data)
+        if offset + len(data) >= PACK_SIZE:
+            self._finish_pack()
+
+    def _finish_pack(self):
+        """Сброс pack-файла на диск и регистрация его чанков в индексе"""
+        if self.pack_file is None:
+            return
+        self.pack_file.flush()
+        os.fsync(self.pack_file.fileno())
+        self.pack_file.close()
+        self.pack_file = None
+        with contextlib.closing(sqlite3.connect(self.repository.db_path)) as conn, conn:
+            conn.executemany('INSERT OR IGNORE INTO chunks VALUES (?, ?, ?, ?, ?, ?)', self.pack_rows)
+        self.pack_rows = []
+
+    def close(self):
+        while self.pending:
+            self._complete()
+        self._finish_pack()
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+        if self.pack_file is not None:
+            self.pack_file.close()
@@ -0,0 +1,83 @@
+import os
+
+from catalog import index_path
+
+
+def backup_volumes(name, manifest):
+    """Файлы копии; последний том - сам архив с описью, под каким бы именем он ни лежал"""
+    if manifest is None:
+        return [name]
+    return manifest.volumes[:-1] + [name]
+
+
+def select_retained(backups, daily, weekly):
+    """Имена копий, которые оставляет политика хранения.
+
+    backups - [(имя, время создания)] от старых к новым. Остаются самая
+    свежая копия каждого из последних daily дней, в которые делались копии,
+    и самая свежая копия каждой из последних weekly недель (ISO).
+    Последняя копия остается всегда.
+    """
+    keep = set()
+    days = set()
+    weeks = set()
+    for name, timestamp in reversed(backups):
+        day = timestamp.date()
+        week = timestamp.isocalendar()[:2]
+        if day not in days and len(days) < daily:
+            days.add(day)
+            keep.add(name)
+        if week not in weeks and len(weeks) < weekly:
+            weeks.add(week)
+            keep.add(name)
+    if backups:
+        keep.add(backups[-1][0])
+    return keep
+
+
+def plan_retention(chain, daily, weekly):
+    """(оставляемые, удаляемые) копии цепочки с учетом зависимостей.
+
+    Инкрементные и дифференциальные копии ссылаются на версии файлов в
+    более ранних архивах, поэтому копия, тома которой нужны оставленной
+    описи, тоже остается, даже если политика ее не выбрала.
+    """
+    backups = chain.backups()
+    keep = select_retained(backups, daily, weekly)
+
+    owners = {}
+    for name, _ in backups:
+        manifest = chain.load(name)
+        for volume in backup_volumes(name, manifest):
+            owners[volume] = name
+
+    needed = set(keep)
+    for name in keep:
+        manifest = chain.load(name)
+        if manifest is None:
+            continue
+        for entry in manifest.files.values():
+            volumes = [part[0] for part in entry['parts']] if 'parts' in entry else [entry['archive']]
+            needed.update(owners[volume] for volume in volumes if volume in owners)
+
+    remove = [name for name, _ in backups if name not in needed]
+    return sorted(needed), remove
+
+
+def prune(chain, daily, weekly, dry_run=False):
+    """Удаление копий вне политики хранения; возвращает удаленные (или удаляемые) файлы"""
+    _, remove = plan_retention(chain, daily, weekly)
+    removed = []
+    for name in remove:
+        manifest = chain.load(name)
+        # Последний том носит имя копии - удаляем его последним, чтобы недоудаленная копия оставалась видна
+        for volume in backup_volumes(name, manifest):
+            path = os.path.join(chain.backup_dir, volume)
+            if not os.path.exists(path):
+                continue
+            if not dry_run:
+                os.remove(path)
+            removed.append(path)
+        if not dry_run and os.path.exists(index_path(chain.backup_dir, name)):
+            os.remove(index_path(chain.backup_dir, name))
+    return removed
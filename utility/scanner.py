@@ -0,0 +1,92 @@
+import os
+import stat as stat_module
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from manifest import to_arcname
+
+
+class FileSnapshot:
+    """Снимок дерева файлов, полученный за один проход.
+
+    Хранит (путь в архиве, полный путь, размер, mtime в нс) для каждого
+    файла в детерминированном порядке и общий размер, так что подсчет
+    объема, прогресс и архивация используют одни и те же данные без
+    повторных обходов и stat.
+    """
+
+    def __init__(self, source_dir, files, errors):
+        self.source_dir = source_dir
+        self.files = files
+        self.errors = errors
+        self.total_size = sum(size for _, _, size, _ in files)
+        # Длительность сканирования, заполняется scan_tree
+        self.seconds = 0.0
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+
+def _list_dir(source_dir, directory, files, errors):
+    """Файлы каталога в files (по именам); возвращает его подкаталоги"""
+    try:
+        with os.scandir(directory) as iterator:
+            entries = sorted(iterator, key=lambda entry: entry.name)
+    except OSError as e:
+        errors.append(f"{directory}: {e}")
+        return []
+
+    subdirs = []
+    for entry in entries:
+        try:
+            # Ссылки на каталоги не обходим, как os.walk по умолчанию
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+                continue
+            # stat берется из DirEntry: кэшируется и не требует повторного разбора пути
+            stat = entry.stat()
+        except OSError as e:
+            errors.append(f"{entry.path}: {e}")
+            continue
+        # Ссылки на каталоги, как и в os.walk, пропускаются; каналы и сокеты тоже
+        if not stat_module.S_ISREG(stat.st_mode):
+            continue
+        files.append((to_arcname(os.path.relpath(entry.path, source_dir)), entry.path,
+                      stat.st_size, stat.st_mtime_ns))
+    return subdirs
+
+
+def _scan_subtree(source_dir, directory):
+    """Обход поддерева в глубину: файлы каталога, затем подкаталоги по алфавиту"""
+    files = []
+    errors = []
+    stack = [directory]
+    while stack:
+        stack.extend(reversed(_list_dir(source_dir, stack.pop(), files, errors)))
+    return files, errors
+
+
+def scan_tree(source_dir, workers=1):
+    """Снимок файлов папки; при workers > 1 подкаталоги верхнего уровня обходятся параллельно"""
+    started = time.perf_counter()
+    if workers <= 1:
+        files, errors = _scan_subtree(source_dir, source_dir)
+        snapshot = FileSnapshot(source_dir, files, errors)
+        snapshot.seconds = time.perf_counter() - started
+        return snapshot
+
+    files = []
+    errors = []
+    subdirs = _list_dir(source_dir, source_dir, files, errors)
+    # Запросы stat отпускают GIL, поэтому на сетевых ФС потоки работают параллельно;
+    # результаты склеиваются в порядке подкаталогов - как при последовательном обходе
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for subtree_files, subtree_errors in pool.map(lambda path: _scan_subtree(source_dir, path), subdirs):
+            files.extend(subtree_files)
+            errors.extend(subtree_errors)
+    snapshot = FileSnapshot(source_dir, files, errors)
+    snapshot.seconds = time.perf_counter() - started
+    return snapshot